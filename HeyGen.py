@@ -5,21 +5,154 @@ import json
 import os
 import mimetypes
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 
+from heygen_jobs import LookJob, TrainingJob, VideoJob
+from jobs import Backoff
+from rate_limit import RateLimiter, get_rate_limiter
+from upload_streams import DEFAULT_CHUNK_SIZE, AssetStream
 
-class HeyGenAPIClient:
+
+class PoolStats:
+    """Thread-safe counters for requests served on reused (hit) vs. newly opened (miss) connections."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def record_new_connection(self):
+        with self._lock:
+            self.new_connections += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            requests_sent, misses = self.requests, self.new_connections
+        hits = max(requests_sent - misses, 0)
+        return {"requests": requests_sent, "pool_hits": hits, "pool_misses": misses,
+                "hit_ratio": round(hits / requests_sent, 3) if requests_sent else 0.0}
+
+
+class _CountingHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools report every new TCP/TLS connection to a PoolStats."""
+
+    def __init__(self, stats: PoolStats, **kwargs):
+        self._stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        stats = self._stats
+
+        class _CountingHTTPConnectionPool(HTTPConnectionPool):
+            def _new_conn(self):
+                stats.record_new_connection()
+                return super()._new_conn()
+
+        class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+            def _new_conn(self):
+                stats.record_new_connection()
+                return super()._new_conn()
+
+        self.poolmanager.pool_classes_by_scheme = {"http": _CountingHTTPConnectionPool,
+                                                   "https": _CountingHTTPSConnectionPool}
+
+    def send(self, request, **kwargs):
+        self._stats.record_request()
+        return super().send(request, **kwargs)
+
+
+class _ApiCall:
+    """Transport-independent description of one HeyGen request and how to read its response.
+
+    Built by _HeyGenClientBase and executed by either HeyGenAPIClient (requests) or AsyncHeyGenAPIClient (httpx),
+    so payload building and response parsing cannot drift between the two clients.
+    """
+
+    def __init__(self, method: str = None, url: str = None, headers: dict = None, json_body=None, body=None,
+                 parse=None, on_error=None, description: str = "", result=None):
+        self.method = method
+        self.url = url
+        self.headers = headers or {}
+        self.json_body = json_body
+        self.body = body
+        self.parse = parse
+        self.on_error = on_error
+        self.description = description
+        self.result = result
+
+    @classmethod
+    def resolved(cls, result):
+        """A call that short-circuits (validation failed client side) without touching the network."""
+        return cls(result=result)
+
+    @property
+    def is_resolved(self) -> bool:
+        return self.method is None
+
+
+class _GroupListCache:
+    """Thread-safe TTL cache for the full avatar group list, invalidated whenever a group is created or deleted."""
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._groups = None
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, max_age: float | None = None) -> list[dict] | None:
+        max_age = self.ttl_seconds if max_age is None else max_age
+        with self._lock:
+            if self._groups is not None and time.monotonic() - self._fetched_at <= max_age:
+                self.hits += 1
+                return list(self._groups)
+            self.misses += 1
+            return None
+
+    def set(self, groups: list[dict]):
+        with self._lock:
+            self._groups, self._fetched_at = list(groups), time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._groups = None
+
+
+class _HeyGenClientBase:
     DEFAULT_V1_BASE_URL = "https://api.heygen.com/v1"
     DEFAULT_V2_BASE_URL = "https://api.heygen.com/v2"
     DEFAULT_UPLOAD_URL = "https://upload.heygen.com/v1"
+    DIMENSION_PRESETS = {"16:9": {"width": 1920, "height": 1080}, "9:16": {"width": 1080, "height": 1920},
+                         "1:1": {"width": 1080, "height": 1080}, "4:5": {"width": 1080, "height": 1350},
+                         "720p": {"width": 1280, "height": 720}}
 
-    def __init__(self, api_key: str, logger=None):
+    RATE_LIMIT_VENDOR = "heygen"
+    MAX_RATE_LIMIT_RETRIES = 5
+    GROUP_LIST_PAGE_SIZE = 100
+    GROUP_LIST_CACHE_TTL_SECONDS = 120
+
+    def __init__(self, api_key: str, logger=None, rate_limiter: RateLimiter | None = None,
+                 group_list_ttl: float = GROUP_LIST_CACHE_TTL_SECONDS):
         if not api_key:
             raise ValueError("API key cannot be empty.")
         self.api_key = api_key
         self.logger = logger or self._setup_default_logger()
+        # Shared by every client in the process, so all sessions using this key are paced together.
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.group_list_cache = _GroupListCache(group_list_ttl)
 
     def _setup_default_logger(self):
-        logger = logging.getLogger(__name__ + ".HeyGenAPIClient")
+        logger = logging.getLogger(__name__ + "." + type(self).__name__)
         if not logger.handlers:
             handler = logging.StreamHandler()
             formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -54,277 +187,530 @@ class HeyGenAPIClient:
             headers["accept"] = "application/json"
         return headers
 
-    def upload_asset_from_bytes_get_image_key(self, file_bytes: bytes, file_name: str) -> str | None:
-        self._log(f"Uploading image '{file_name}' from bytes to HeyGen assets.", "info")
-        content_type, _ = mimetypes.guess_type(file_name)
-        if not content_type or not content_type.startswith("image/"):
-            ext = os.path.splitext(file_name)[1].lower()
-            if ext in [".jpg", ".jpeg"]:
-                content_type = "image/jpeg"
-            elif ext == ".png":
-                content_type = "image/png"
-            else:
-                self._log(f"File '{file_name}' not supported image type (bytes).", "error"); return None
-
-        api_headers = self._get_headers(content_type=content_type)
-        url = f"{self.DEFAULT_UPLOAD_URL}/asset"
+    def _endpoint_class(self, call: _ApiCall) -> str:
+        """Rate-limit bucket for a call: asset uploads, status/list reads, or submits (create/generate/delete)."""
+        if call.url.startswith(self.DEFAULT_UPLOAD_URL):
+            return "upload"
+        return "status" if call.method == "GET" else "submit"
+
+    @staticmethod
+    def _rewind_body(body) -> bool:
+        if body is None or isinstance(body, (bytes, bytearray, memoryview)):
+            return True
+        rewind = getattr(body, "rewind", None)
+        return bool(rewind and rewind())
+
+    def _should_resend(self, call: _ApiCall, response, attempt: int) -> bool:
+        """On a 429, applies Retry-After to the shared bucket and reports whether the call should be queued again."""
+        if response.status_code != 429:
+            return False
+        self.rate_limiter.throttle(self.RATE_LIMIT_VENDOR, self.api_key, self._endpoint_class(call),
+                                   response.headers.get("Retry-After"))
+        if attempt >= self.MAX_RATE_LIMIT_RETRIES or not self._rewind_body(call.body):
+            return False
+        self._log(f"{call.description or call.url} rate limited (429); requeued, attempt {attempt + 2}.", "warning")
+        return True
+
+    def _interpret_response(self, call: _ApiCall, response):
+        """Shared response handling; works on both requests.Response and httpx.Response."""
+        if response.status_code >= 400:
+            return call.on_error(response.text[:500], response.status_code)
         try:
-            response = requests.post(url, headers=api_headers, data=file_bytes)
-            response.raise_for_status();
+            return call.parse(response)
+        except ValueError:  # json.JSONDecodeError and the requests/httpx variants all derive from it
+            return call.on_error(f"{call.description} response not valid JSON. Status: {response.status_code}. "
+                                 f"Text: {response.text[:200]}", response.status_code)
+        except Exception as e:
+            return call.on_error(f"Unexpected error reading {call.description} response: {e}", response.status_code)
+
+    @staticmethod
+    def _guess_image_content_type(file_name: str) -> str | None:
+        content_type, _ = mimetypes.guess_type(file_name)
+        if content_type and content_type.startswith("image/"):
+            return content_type
+        ext = os.path.splitext(file_name)[1].lower()
+        if ext in [".jpg", ".jpeg"]:
+            return "image/jpeg"
+        if ext == ".png":
+            return "image/png"
+        return None
+
+    @staticmethod
+    def _delete_succeeded(response, ok_message: str, log) -> bool:
+        if response.status_code == 200 and response.content:
+            try:
+                data = response.json()
+            except ValueError:
+                log(f"{ok_message} was 200 OK but response not JSON: {response.text[:200]}", "warning")
+                return False
+            if data.get("code") == 0 and "success" in data.get("message", "").lower():
+                return True
+            log(f"{ok_message} was 200 OK but content unexpected: {data}", "warning")
+            return False
+        return response.status_code in (200, 204)
+
+    # --- Call builders (one per endpoint) ---
+    def _upload_asset_call(self, body, file_name: str) -> _ApiCall:
+        self._log(f"Uploading image '{file_name}' to HeyGen assets.", "info")
+        content_type = self._guess_image_content_type(file_name)
+        if not content_type:
+            self._log(f"File '{file_name}' not supported image type.", "error")
+            return _ApiCall.resolved(None)
+
+        def parse(response):
             res_json = response.json()
-            if response.status_code == 200 and res_json.get("data", {}).get("image_key"):
-                self._log(f"Image from bytes uploaded. Image Key: {res_json['data']['image_key']}", "success")
+            if res_json.get("data", {}).get("image_key"):
+                self._log(f"Image uploaded. Image Key: {res_json['data']['image_key']}", "success")
                 return res_json["data"]["image_key"]
-            err_msg = res_json.get("error", {}).get("message", res_json.get("message", "Unknown error"));
-            self._log(f"Asset upload (bytes) failed: {err_msg}", "error");
-            return None
-        except requests.exceptions.HTTPError as http_err:
-            err_text = http_err.response.text[:500] if http_err.response else str(http_err);
-            self._log(
-                f"Asset upload (bytes) HTTP error: {http_err.response.status_code if http_err.response else 'N/A'} - {err_text}",
-                "error");
+            err_msg = res_json.get("error", {}).get("message", res_json.get("message", "Unknown error"))
+            self._log(f"Asset upload failed: {err_msg}", "error")
             return None
-        except json.JSONDecodeError:
-            self._log(
-                f"Asset upload (bytes) response not valid JSON. Status: {response.status_code if 'response' in locals() else 'N/A'}. Text: {response.text[:200] if 'response' in locals() else 'N/A'}",
-                "error");
+
+        def on_error(message, status_code):
+            self._log(f"Asset upload error: {status_code or 'N/A'} - {message}", "error")
             return None
-        except Exception as e:
-            self._log(f"Unexpected error asset upload (bytes): {e}", "error"); return None
 
-    def create_photo_avatar_group(self, name: str, image_key: str) -> str | None:
+        return _ApiCall("POST", f"{self.DEFAULT_UPLOAD_URL}/asset", self._get_headers(content_type=content_type),
+                        body=body, parse=parse, on_error=on_error, description="Asset upload")
+
+    def _create_photo_avatar_group_call(self, name: str, image_key: str) -> _ApiCall:
         url = self._get_api_url("photo_avatar/avatar_group/create", api_version="v2")  # As per original Streamlit
-        payload = {"name": name, "image_key": image_key}
         self._log(f"Creating HeyGen avatar group '{name}' using image_key '{image_key}'", "info")
-        try:
-            response = requests.post(url, headers=self._get_headers("json"), json=payload)
-            response.raise_for_status();
+
+        def parse(response):
             data = response.json()
             if data.get("data", {}).get("group_id"):
-                self._log(f"Group '{name}' created successfully. Group ID: {data['data']['group_id']}", "success");
+                self._log(f"Group '{name}' created successfully. Group ID: {data['data']['group_id']}", "success")
                 return data["data"]["group_id"]
-            self._log(f"Group creation failed: {data.get('error', {}).get('message', 'Unknown')}", "error");
-            return None
-        except requests.exceptions.RequestException as e:
-            self._log(f"Group creation request failed: {e}", "error");
+            self._log(f"Group creation failed: {data.get('error', {}).get('message', 'Unknown')}", "error")
             return None
-        except json.JSONDecodeError:
-            self._log(
-                f"Group creation response not valid JSON. Status: {response.status_code if 'response' in locals() else 'N/A'}. Text: {response.text[:200] if 'response' in locals() else 'N/A'}",
-                "error");
+
+        def on_error(message, status_code):
+            self._log(f"Group creation request failed: {status_code or 'N/A'} - {message}", "error")
             return None
 
-    def list_avatar_group_looks(self, group_id: str) -> list[dict] | None:
+        return _ApiCall("POST", url, self._get_headers("json"), json_body={"name": name, "image_key": image_key},
+                        parse=parse, on_error=on_error, description="Group creation")
+
+    def _list_avatar_group_looks_call(self, group_id: str) -> _ApiCall:
         url = self._get_api_url(f"avatar_group/{group_id}/avatars", api_version="v2")  # As per original Streamlit
         self._log(f"Listing looks for HeyGen avatar group ID '{group_id}'", "info")
-        try:
-            response = requests.get(url, headers=self._get_headers("accept_json"))
-            response.raise_for_status();
-            data = response.json()
-            looks = data.get("data", {}).get("avatar_list", [])
-            self._log(f"Fetched {len(looks)} Looks for group '{group_id}'", "success");
+
+        def parse(response):
+            looks = response.json().get("data", {}).get("avatar_list", [])
+            self._log(f"Fetched {len(looks)} Looks for group '{group_id}'", "success")
             return looks
-        except requests.exceptions.RequestException as e:
-            self._log(f"Failed to list group looks for group '{group_id}': {e}", "error");
-            return None
-        except json.JSONDecodeError:
-            self._log(
-                f"List looks response not valid JSON. Status: {response.status_code if 'response' in locals() else 'N/A'}. Text: {response.text[:200] if 'response' in locals() else 'N/A'}",
-                "error");
-            return None
-        except KeyError:  # If 'data' or 'avatar_list' is missing
-            self._log(
-                f"List looks response missing expected keys. Response: {data if 'data' in locals() else 'Unknown Response'}",
-                "error");
+
+        def on_error(message, status_code):
+            self._log(f"Failed to list group looks for group '{group_id}': {status_code or 'N/A'} - {message}",
+                      "error")
             return None
 
-    def delete_photo_avatar_group(self, group_id: str) -> bool:
+        return _ApiCall("GET", url, self._get_headers("accept_json"), parse=parse, on_error=on_error,
+                        description="List looks")
+
+    def _delete_photo_avatar_group_call(self, group_id: str) -> _ApiCall:
         """Deletes a Photo Avatar Group using DELETE with group_id in path."""
-        if not group_id: self._log("Error: group_id cannot be empty for deletion.", "error"); return False
+        if not group_id:
+            self._log("Error: group_id cannot be empty for deletion.", "error")
+            return _ApiCall.resolved(False)
         url = self._get_api_url(f"photo_avatar_group/{group_id}", api_version="v2")
         self._log(f"Attempting to DELETE photo avatar group ID: {group_id} from URL: {url}", "info")
-        api_headers = self._get_headers("accept_json")
-        try:
-            response = requests.delete(url, headers=api_headers)
-            response.raise_for_status()
-            if response.status_code == 200 or response.status_code == 204:
-                if response.status_code == 200 and response.content:
-                    try:
-                        data = response.json()
-                        if data.get("code") == 0 and "success" in data.get("message", "").lower():
-                            self._log(f"Group '{group_id}' deleted successfully (DELETE, path param).", "success");
-                            return True
-                        self._log(f"Group delete for '{group_id}' (DELETE) was 200 OK but content unexpected: {data}",
-                                  "warning");
-                        return False
-                    except json.JSONDecodeError:
-                        self._log(
-                            f"Group delete for '{group_id}' (DELETE) was 200 OK but response not JSON: {response.text[:200]}",
-                            "warning");
-                        return False
-                else:  # 204 No Content or 200 with no content
-                    self._log(f"Group '{group_id}' deleted successfully (DELETE, status {response.status_code}).",
-                              "success");
-                    return True
-            self._log(f"Group delete for '{group_id}' (DELETE) failed with status {response.status_code}.", "error");
+
+        def parse(response):
+            if self._delete_succeeded(response, f"Group delete for '{group_id}' (DELETE)", self._log):
+                self._log(f"Group '{group_id}' deleted successfully (DELETE, status {response.status_code}).",
+                          "success")
+                return True
             return False
-        except requests.exceptions.HTTPError as http_err:
-            err_text = http_err.response.text[:200] if http_err.response else str(http_err)
-            status_code = http_err.response.status_code if http_err.response else "N/A"
-            if status_code == 404: self._log(f"Group ID '{group_id}' not found for deletion (DELETE).",
-                                             "warning"); return True
-            self._log(f"Group deletion HTTP error (DELETE, ID: {group_id}): {status_code} - {err_text}", "error");
+
+        def on_error(message, status_code):
+            if status_code == 404:
+                self._log(f"Group ID '{group_id}' not found for deletion (DELETE).", "warning")
+                return True
+            self._log(f"Group deletion error (DELETE, ID: {group_id}): {status_code or 'N/A'} - {message}", "error")
             return False
-        except Exception as e:
-            self._log(f"Unexpected error deleting group (DELETE, ID: {group_id}): {e}", "error"); return False
 
-    def delete_talking_photo(self, talking_photo_id: str) -> bool:
-        if not talking_photo_id: self._log("No Talking Photo ID for deletion.", "warning"); return False
+        return _ApiCall("DELETE", url, self._get_headers("accept_json"), parse=parse, on_error=on_error,
+                        description="Group delete")
+
+    def _delete_talking_photo_call(self, talking_photo_id: str) -> _ApiCall:
+        if not talking_photo_id:
+            self._log("No Talking Photo ID for deletion.", "warning")
+            return _ApiCall.resolved(False)
         url = self._get_api_url(f"talking_photos/{talking_photo_id}", api_version="v2")
-        headers = self._get_headers(content_type="accept_json")
         self._log(f"Attempting to delete HeyGen talking photo ID: {talking_photo_id} from {url}", "info")
-        try:
-            response = requests.delete(url, headers=headers);
-            response.raise_for_status()
-            if response.status_code == 200 or response.status_code == 204:
-                if response.status_code == 200 and response.content:
-                    try:
-                        data = response.json()
-                        if data.get("code") == 0 and "success" in data.get("message", "").lower():
-                            self._log(f"Talking photo '{talking_photo_id}' deleted.", "success");
-                            return True
-                        self._log(
-                            f"Talking photo delete '{talking_photo_id}' was 200 OK but content unexpected: {data}",
-                            "warning");
-                        return False
-                    except json.JSONDecodeError:
-                        self._log(
-                            f"Talking photo delete '{talking_photo_id}' was 200 OK but response not JSON: {response.text[:200]}",
-                            "warning");
-                        return False
-                else:
-                    self._log(f"Talking photo '{talking_photo_id}' deleted (status {response.status_code}).",
-                              "success"); return True
-            self._log(f"Talking photo deletion failed. Status: {response.status_code}", "error");
+
+        def parse(response):
+            if self._delete_succeeded(response, f"Talking photo delete '{talking_photo_id}'", self._log):
+                self._log(f"Talking photo '{talking_photo_id}' deleted (status {response.status_code}).", "success")
+                return True
             return False
-        except requests.exceptions.HTTPError as http_err:
-            err_text = http_err.response.text[:200] if http_err.response else str(http_err)
-            status_code = http_err.response.status_code if http_err.response else "N/A"
-            if status_code == 404: self._log(f"Talking photo '{talking_photo_id}' not found for deletion.",
-                                             "warning"); return True
-            self._log(f"Talking photo deletion HTTP error (ID: {talking_photo_id}): {status_code} - {err_text}",
-                      "error");
+
+        def on_error(message, status_code):
+            if status_code == 404:
+                self._log(f"Talking photo '{talking_photo_id}' not found for deletion.", "warning")
+                return True
+            self._log(f"Talking photo deletion error (ID: {talking_photo_id}): {status_code or 'N/A'} - {message}",
+                      "error")
             return False
-        except Exception as e:
-            self._log(f"Unexpected error deleting talking photo (ID: {talking_photo_id}): {e}", "error"); return False
 
-    def generate_video_with_photo_or_avatar(self, text_script: str, voice_id: str, title: str, test_mode: bool,
-                                            add_caption: bool, dimension_preset: str, talking_photo_id: str = None,
-                                            avatar_id: str = None) -> str | None:
-        if not (talking_photo_id or avatar_id) or not voice_id: self._log("Error: Missing ID for video gen.",
-                                                                          "error"); return None
-        url = self._get_api_url("video/generate", api_version="v2")
+        return _ApiCall("DELETE", url, self._get_headers(content_type="accept_json"), parse=parse, on_error=on_error,
+                        description="Talking photo delete")
+
+    def _build_video_payload(self, text_script: str, voice_id: str, title: str, test_mode: bool, add_caption: bool,
+                             dimension_preset: str, talking_photo_id: str = None, avatar_id: str = None,
+                             callback_url: str = None) -> dict:
         char_payload = {"type": "talking_photo" if talking_photo_id else "avatar",
                         ("talking_photo_id" if talking_photo_id else "avatar_id"): (
                             talking_photo_id if talking_photo_id else avatar_id)}
         video_inputs = [
             {"character": char_payload, "voice": {"type": "text", "input_text": text_script, "voice_id": voice_id}}]
-        dim_map = {"16:9": {"width": 1920, "height": 1080}, "9:16": {"width": 1080, "height": 1920},
-                   "1:1": {"width": 1080, "height": 1080}, "4:5": {"width": 1080, "height": 1350},
-                   "720p": {"width": 1280, "height": 720}}
-        dimension_payload = dim_map.get(dimension_preset)
+        dimension_payload = self.DIMENSION_PRESETS.get(dimension_preset)
         if not dimension_payload:
             try:
                 w, h = map(int, dimension_preset.split('x')); dimension_payload = {"width": w, "height": h}
-            except:
-                dimension_payload = dim_map["720p"]; self._log(
+            except (AttributeError, ValueError):
+                dimension_payload = self.DIMENSION_PRESETS["720p"]; self._log(
                     f"Warn: Invalid custom dims '{dimension_preset}', using 720p", "warning")
         payload = {"video_inputs": video_inputs, "test": test_mode, "caption": add_caption,
                    "dimension": dimension_payload, "title": title}
+        if callback_url:
+            payload["callback_url"] = callback_url
+        return payload
+
+    def _generate_video_call(self, text_script: str, voice_id: str, title: str, test_mode: bool, add_caption: bool,
+                             dimension_preset: str, talking_photo_id: str = None, avatar_id: str = None,
+                             callback_url: str = None) -> _ApiCall:
+        if not (talking_photo_id or avatar_id) or not voice_id:
+            self._log("Error: Missing ID for video gen.", "error")
+            return _ApiCall.resolved(None)
+        payload = self._build_video_payload(text_script, voice_id, title, test_mode, add_caption, dimension_preset,
+                                            talking_photo_id=talking_photo_id, avatar_id=avatar_id,
+                                            callback_url=callback_url)
         self._log(f"HeyGen generation payload: {json.dumps(payload, indent=1)}", "debug")
-        try:
-            response = requests.post(url, headers=self._get_headers("json"), json=payload);
-            response.raise_for_status();
+
+        def parse(response):
             data = response.json()
             if data.get("data", {}).get("video_id"):
-                self._log(f"Video submission successful. ID: {data['data']['video_id']}", "success");
+                self._log(f"Video submission successful. ID: {data['data']['video_id']}", "success")
                 return data["data"]["video_id"]
-            self._log(f"Video submission failed: {data.get('error', {}).get('message', 'Unknown')}", "error");
-            return None
-        except requests.exceptions.RequestException as e:
-            self._log(f"Video generation request failed: {e}", "error")
-            if hasattr(e, 'response') and e.response is not None: self._log(
-                f"HeyGen API Error Response: {e.response.text}", "error")
+            self._log(f"Video submission failed: {data.get('error', {}).get('message', 'Unknown')}", "error")
             return None
-        except json.JSONDecodeError:
-            self._log(
-                f"Video gen response not valid JSON. Status: {response.status_code if 'response' in locals() else 'N/A'}. Text: {response.text[:200] if 'response' in locals() else 'N/A'}",
-                "error");
+
+        def on_error(message, status_code):
+            self._log(f"Video generation request failed: {status_code or 'N/A'} - {message}", "error")
             return None
 
-    def check_video_status(self, video_id: str) -> tuple[str | None, str | None, dict | None]:
+        return _ApiCall("POST", self._get_api_url("video/generate", api_version="v2"), self._get_headers("json"),
+                        json_body=payload, parse=parse, on_error=on_error, description="Video gen")
+
+    def _check_video_status_call(self, video_id: str) -> _ApiCall:
         url = self._get_api_url(f"video_status.get?video_id={video_id}", api_version="v1")
         self._log(f"Checking HeyGen video status for ID: {video_id}", "info")
-        try:
-            response = requests.get(url, headers=self._get_headers("accept_json"));
-            response.raise_for_status();
+
+        def parse(response):
             data = response.json()
             self._log(f"HeyGen status response: {data}", "debug")
             if data.get("data"): return data["data"].get("status"), data["data"].get("video_url"), data["data"].get(
                 "error")
-            self._log(f"Video status response format incorrect: {data}", "error");
+            self._log(f"Video status response format incorrect: {data}", "error")
             return "error", None, {"message": "Format error"}
-        except requests.exceptions.RequestException as e:
-            self._log(f"Failed to check video status (ID: {video_id}): {e}", "error");
-            return "error", None, {"message": str(e)}
-        except json.JSONDecodeError:
-            self._log(
-                f"Video status response not valid JSON. Status: {response.status_code if 'response' in locals() else 'N/A'}. Text: {response.text[:200] if 'response' in locals() else 'N/A'}",
-                "error");
-            return "error", None, {"message": "JSON decode error"}
 
-    def list_avatar_groups(self) -> list[dict]:
+        def on_error(message, status_code):
+            self._log(f"Failed to check video status (ID: {video_id}): {status_code or 'N/A'} - {message}", "error")
+            return "error", None, {"message": message}
+
+        return _ApiCall("GET", url, self._get_headers("accept_json"), parse=parse, on_error=on_error,
+                        description="Video status")
+
+    def _list_avatar_groups_call(self, page: int = None, page_size: int = None, token: str = None) -> _ApiCall:
+        """One page of avatar groups; parse returns (groups, total or None, next token or None), errors None."""
         url = self._get_api_url("avatar_group.list", api_version="v2")  # Corrected as per original streamlit
+        params = {key: value for key, value in (("page", page), ("limit", page_size), ("token", token)) if value}
+        if params:
+            url = f"{url}?{urlencode(params)}"
         self._log(f"Requesting avatar group list from: {url}", "info")
-        try:
-            response = requests.get(url, headers=self._get_headers("accept_json"));
-            response.raise_for_status();
+
+        def parse(response):
             data = response.json()
-            groups = data.get("data", {}).get("list", [])
-            if not groups and isinstance(data.get("data"), list): groups = data.get("data")
-            self._log(f"Fetched {len(groups)} avatar groups", "success");
-            return groups
-        except Exception as e:
-            self._log(f"Fetch group list API failed: {e}", "error"); return []
+            payload = data.get("data")
+            groups, total, next_token = [], None, None
+            if isinstance(payload, dict):
+                groups = payload.get("list") or payload.get("avatar_group_list") or []
+                total = payload.get("total") or payload.get("total_count")
+                next_token = payload.get("next_token") or payload.get("token")
+            elif isinstance(payload, list):
+                groups = payload
+            self._log(f"Fetched {len(groups)} avatar groups", "success")
+            return groups, total, next_token
 
-    def train_photo_avatar_group(self, group_id: str) -> str | None:
-        url = self._get_api_url("photo_avatar/train", api_version="v2")
-        payload = {"group_id": group_id}
+        def on_error(message, status_code):
+            self._log(f"Fetch group list API failed: {status_code or 'N/A'} - {message}", "error")
+            return None
+
+        return _ApiCall("GET", url, self._get_headers("accept_json"), parse=parse, on_error=on_error,
+                        description="Group list")
+
+    @staticmethod
+    def _new_group_cursor() -> dict:
+        return {"page": 1, "token": None, "seen": 0, "first_id": None, "done": False}
+
+    @staticmethod
+    def _advance_group_cursor(cursor: dict, result, page_size: int) -> list[dict]:
+        """Consumes one page result and moves the cursor; returns the page's groups (empty once finished)."""
+        if result is None:
+            cursor["done"] = True
+            return []
+        groups, total, next_token = result
+        first_id = (groups[0].get("id") or groups[0].get("group_id")) if groups else None
+        # A repeated first entry or an oversized page means the endpoint ignored paging and sent everything.
+        if not groups or (cursor["page"] > 1 and first_id == cursor["first_id"]):
+            cursor["done"] = True
+            return []
+        cursor["seen"] += len(groups)
+        cursor["page"] += 1
+        cursor["first_id"], cursor["token"] = first_id, next_token
+        if len(groups) > page_size or (total is not None and cursor["seen"] >= int(total)) or (
+                next_token is None and len(groups) < page_size):
+            cursor["done"] = True
+        return groups
+
+    def _train_photo_avatar_group_call(self, group_id: str) -> _ApiCall:
         self._log(f"Training avatar group: {group_id}")
-        try:
-            response = requests.post(url, headers=self._get_headers("json"), json=payload);
-            response.raise_for_status();
+
+        def parse(response):
             data = response.json()
-            if response.ok:
-                tid = data.get("data", {}).get("job_id") or data.get("data", {}).get("training_id")
-                if tid: self._log(f"Group training submitted. TrackID:{tid}", "success"); return tid
-            self._log(f"Error training group: {data.get('error', {}).get('message', 'Unknown')}", "error");
+            tid = data.get("data", {}).get("job_id") or data.get("data", {}).get("training_id")
+            if tid: self._log(f"Group training submitted. TrackID:{tid}", "success"); return tid
+            self._log(f"Error training group: {data.get('error', {}).get('message', 'Unknown')}", "error")
             return None
-        except Exception as e:
-            self._log(f"Train group API failed: {e}", "error"); return None
 
-    def check_photo_avatar_group_training_status(self, training_id: str) -> tuple[str | None, dict | None]:
+        def on_error(message, status_code):
+            self._log(f"Train group API failed: {status_code or 'N/A'} - {message}", "error")
+            return None
+
+        return _ApiCall("POST", self._get_api_url("photo_avatar/train", api_version="v2"), self._get_headers("json"),
+                        json_body={"group_id": group_id}, parse=parse, on_error=on_error, description="Train group")
+
+    def _check_training_status_call(self, training_id: str) -> _ApiCall:
         url = self._get_api_url(f"photo_avatar/train/status/{training_id}", api_version="v2")
-        try:
-            response = requests.get(url, headers=self._get_headers("accept_json"));
-            response.raise_for_status();
+
+        def parse(response):
             data = response.json()
-            d = data.get("data", {});
+            d = data.get("data", {})
             status = d.get("status")
-            err = d.get("error") or data.get("error");
+            err = d.get("error") or data.get("error")
             err_msg = err.get("message") if isinstance(err, dict) else str(err) if err else None
             if not status and err_msg: self._log(f"Group training status API error (ID:{training_id}):{err_msg}",
                                                  "error"); return "error", {"message": err_msg}
             return status, {"message": err_msg} if err_msg else None
-        except Exception as e:
-            self._log(f"Check group training status API failed: {e}", "error"); return "error", {"message": str(e)}
\ No newline at end of file
+
+        def on_error(message, status_code):
+            self._log(f"Check group training status API failed: {status_code or 'N/A'} - {message}", "error")
+            return "error", {"message": message}
+
+        return _ApiCall("GET", url, self._get_headers("accept_json"), parse=parse, on_error=on_error,
+                        description="Training status")
+
+
+class HeyGenAPIClient(_HeyGenClientBase):
+    # Keep-alive pool size per origin; api.heygen.com carries status polls from every session.
+    DEFAULT_POOL_SIZES = {"https://api.heygen.com": 20, "https://upload.heygen.com": 10}
+    DEFAULT_TIMEOUT_SECONDS = 60
+
+    def __init__(self, api_key: str, logger=None, pool_sizes: dict[str, int] | None = None,
+                 timeout: float | None = DEFAULT_TIMEOUT_SECONDS, prewarm: bool = False,
+                 rate_limiter: RateLimiter | None = None):
+        super().__init__(api_key, logger, rate_limiter)
+        self.timeout = timeout
+        self.pool_stats = PoolStats()
+        # Adapters (and their urllib3 pools) are shared by every thread; Sessions are per thread because
+        # requests.Session mutates cookie/state objects that are not safe to share across threads.
+        self._pool_sizes = {**self.DEFAULT_POOL_SIZES, **(pool_sizes or {})}
+        self._adapters = {origin: _CountingHTTPAdapter(self.pool_stats, pool_connections=1, pool_maxsize=size)
+                          for origin, size in self._pool_sizes.items()}
+        self._local = threading.local()
+        if prewarm:
+            self.warm_connections()
+
+    @property
+    def session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            for origin, adapter in self._adapters.items():
+                session.mount(origin, adapter)
+            self._local.session = session
+        return session
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, url, **kwargs)
+
+    def _execute(self, call: _ApiCall):
+        if call.is_resolved:
+            return call.result
+        endpoint_class = self._endpoint_class(call)
+        attempt = 0
+        while True:
+            # Blocks (queues) until this key's bucket has capacity instead of sending into a 429.
+            self.rate_limiter.acquire(self.RATE_LIMIT_VENDOR, self.api_key, endpoint_class)
+            try:
+                response = self._request(call.method, call.url, headers=call.headers, json=call.json_body,
+                                         data=call.body)
+            except requests.exceptions.RequestException as e:
+                return call.on_error(str(e), getattr(e.response, "status_code", None))
+            if not self._should_resend(call, response, attempt):
+                return self._interpret_response(call, response)
+            attempt += 1
+
+    def warm_connections(self, connections_per_host: int = 1) -> int:
+        """Opens keep-alive connections to every configured origin so the first real calls skip the handshake."""
+        targets = [origin for origin, size in self._pool_sizes.items()
+                   for _ in range(max(1, min(connections_per_host, size)))]
+
+        def _touch(origin: str) -> bool:
+            try:
+                self._request("HEAD", origin)
+                return True
+            except requests.exceptions.RequestException as e:
+                self._log(f"Connection pre-warm to {origin} failed: {e}", "warning")
+                return False
+
+        with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+            warmed = sum(executor.map(_touch, targets))
+        self._log(f"Pre-warmed {warmed}/{len(targets)} HeyGen connections.", "info")
+        return warmed
+
+    def get_pool_stats(self) -> dict:
+        stats = self.pool_stats.snapshot()
+        stats["pool_sizes"] = {urlsplit(origin).netloc: size for origin, size in self._pool_sizes.items()}
+        return stats
+
+    def close(self):
+        for adapter in self._adapters.values():
+            adapter.close()
+
+    def upload_asset_from_bytes_get_image_key(self, file_bytes: bytes, file_name: str) -> str | None:
+        return self._execute(self._upload_asset_call(file_bytes, file_name))
+
+    def upload_asset_stream(self, source, file_name: str = None, chunk_size: int = DEFAULT_CHUNK_SIZE) -> str | None:
+        """Streams an image asset from a path (memory-mapped), file object, memoryview or iterable of chunks."""
+        with AssetStream(source, chunk_size) as stream:
+            return self._execute(self._upload_asset_call(stream.request_body(), file_name or stream.name or ""))
+
+    def create_photo_avatar_group(self, name: str, image_key: str) -> str | None:
+        group_id = self._execute(self._create_photo_avatar_group_call(name, image_key))
+        if group_id:
+            self.group_list_cache.invalidate()
+        return group_id
+
+    def list_avatar_group_looks(self, group_id: str) -> list[dict] | None:
+        return self._execute(self._list_avatar_group_looks_call(group_id))
+
+    def delete_photo_avatar_group(self, group_id: str) -> bool:
+        """Deletes a Photo Avatar Group using DELETE with group_id in path."""
+        deleted = self._execute(self._delete_photo_avatar_group_call(group_id))
+        if deleted:
+            self.group_list_cache.invalidate()
+        return deleted
+
+    def delete_talking_photo(self, talking_photo_id: str) -> bool:
+        return self._execute(self._delete_talking_photo_call(talking_photo_id))
+
+    def generate_video_with_photo_or_avatar(self, text_script: str, voice_id: str, title: str, test_mode: bool,
+                                            add_caption: bool, dimension_preset: str, talking_photo_id: str = None,
+                                            avatar_id: str = None, callback_url: str = None) -> str | None:
+        return self._execute(self._generate_video_call(text_script, voice_id, title, test_mode, add_caption,
+                                                       dimension_preset, talking_photo_id=talking_photo_id,
+                                                       avatar_id=avatar_id, callback_url=callback_url))
+
+    def check_video_status(self, video_id: str) -> tuple[str | None, str | None, dict | None]:
+        return self._execute(self._check_video_status_call(video_id))
+
+    def _iter_group_pages(self, page_size: int):
+        cursor = self._new_group_cursor()
+        while not cursor["done"]:
+            result = self._execute(self._list_avatar_groups_call(cursor["page"], page_size, cursor["token"]))
+            if result is None:
+                yield None  # the listing is incomplete
+                return
+            groups = self._advance_group_cursor(cursor, result, page_size)
+            if groups:
+                yield groups
+
+    def iter_avatar_groups(self, page_size: int = _HeyGenClientBase.GROUP_LIST_PAGE_SIZE):
+        """Lazily yields avatar groups page by page; callers that stop early never fetch the remaining pages."""
+        for groups in self._iter_group_pages(page_size):
+            if groups is None:
+                return
+            yield from groups
+
+    def list_avatar_groups(self) -> list[dict]:
+        return list(self.iter_avatar_groups())
+
+    def cached_avatar_groups(self, max_age: float | None = None) -> list[dict]:
+        """Full group list from the shared TTL cache; a miss re-lists once. Incomplete listings are not cached."""
+        groups = self.group_list_cache.get(max_age)
+        if groups is not None:
+            return groups
+        groups = []
+        for page in self._iter_group_pages(self.GROUP_LIST_PAGE_SIZE):
+            if page is None:
+                return groups
+            groups.extend(page)
+        self.group_list_cache.set(groups)
+        return groups
+
+    def find_avatar_group(self, name: str) -> dict | None:
+        """First group with this exact name, paging only as far as needed (uncached, so always current)."""
+        return next((group for group in self.iter_avatar_groups() if group.get("name") == name), None)
+
+    def train_photo_avatar_group(self, group_id: str) -> str | None:
+        return self._execute(self._train_photo_avatar_group_call(group_id))
+
+    def check_photo_avatar_group_training_status(self, training_id: str) -> tuple[str | None, dict | None]:
+        return self._execute(self._check_training_status_call(training_id))
+
+    # --- Job handles (polling with jittered exponential backoff) ---
+    def video_job(self, video_id: str, backoff: Backoff | None = None) -> VideoJob:
+        return VideoJob(self, video_id, backoff=backoff or Backoff(initial=5.0, max_delay=30.0))
+
+    # With a callback registered, polling is only a watchdog in case the webhook never arrives.
+    CALLBACK_WATCHDOG_BACKOFF = {"initial": 60.0, "factor": 1.5, "max_delay": 300.0}
+
+    def submit_video(self, text_script: str, voice_id: str, title: str, test_mode: bool, add_caption: bool,
+                     dimension_preset: str, talking_photo_id: str = None, avatar_id: str = None,
+                     callbacks=None) -> VideoJob | None:
+        """Submits a video and returns its job handle.
+
+        If callbacks (a callbacks.CallbackServer) is enabled, HeyGen is given its callback URL and the job is resolved
+        by the webhook; status polling then drops to a slow watchdog.
+        """
+        callback_ref = callbacks.new_ref() if callbacks is not None else None
+        callback_url = callbacks.url_for("heygen", callback_ref) if callbacks is not None else None
+        video_id = self.generate_video_with_photo_or_avatar(text_script, voice_id, title, test_mode, add_caption,
+                                                            dimension_preset, talking_photo_id=talking_photo_id,
+                                                            avatar_id=avatar_id, callback_url=callback_url)
+        if not video_id:
+            return None
+        if not callback_url:
+            return self.video_job(video_id)
+        backoff = Backoff(**self.CALLBACK_WATCHDOG_BACKOFF)
+        job = self.video_job(video_id, backoff=backoff)
+        job.defer_polling(backoff.next_delay())
+        job.callback_ref = callback_ref
+        callbacks.register("heygen", video_id, job, ref=callback_ref)
+        return job
+
+    def look_job(self, group_id: str, ready_status: str = "COMPLETED", backoff: Backoff | None = None) -> LookJob:
+        return LookJob(self, group_id, ready_status=ready_status,
+                       backoff=backoff or Backoff(initial=2.0, max_delay=15.0))
+
+    def training_job(self, training_id: str, backoff: Backoff | None = None) -> TrainingJob:
+        return TrainingJob(self, training_id, backoff=backoff or Backoff(initial=5.0, max_delay=60.0))
+
+    def submit_training(self, group_id: str) -> TrainingJob | None:
+        training_id = self.train_photo_avatar_group(group_id)
+        return self.training_job(training_id) if training_id else None
@@ -1,13 +1,16 @@
 import streamlit as st
-import requests
 import json
-import time
 import os
 from dotenv import load_dotenv
-import google.generativeai as genai
-from openai import OpenAI  # OpenAI Import
-from supabase import create_client, Client  # Supabase Import
-import mimetypes  # For guessing content type
+
+from callbacks import CallbackServer
+from clients import get_client_registry
+from media_preflight import MediaPreflight
+from narration import NarrationPublisher
+from pipeline import PREFLIGHT_MERGE_FIELDS
+from script_cache import ScriptCache, script_key
+from services import SCRIPT_PROMPT_VERSION, build_script_prompt, gemini_response_text
+from shotstack_client import ShotstackClient
 
 # Load environment variables from .env file
 load_dotenv()
@@ -19,6 +22,14 @@ SHOTSTACK_OWNER_ID_ENV = os.getenv("SHOTSTACK_OWNER_ID", "ttwxkrohlv")
 SHOTSTACK_API_ENDPOINT = os.getenv("SHOTSTACK_API_ENDPOINT", "https://api.shotstack.io/edit/stage/templates/render")
 SHOTSTACK_STATUS_ENDPOINT_TEMPLATE = os.getenv("SHOTSTACK_STATUS_ENDPOINT_TEMPLATE",
                                                "https://api.shotstack.io/edit/stage/render/{}")
+# Longest a single script run blocks on the render job before rerunning to refresh the page.
+SHOTSTACK_WAIT_SLICE_SECONDS = int(os.getenv("SHOTSTACK_WAIT_SLICE_SECONDS", "60"))
+# Render callbacks: set CALLBACK_PUBLIC_URL to a URL that reaches CALLBACK_LISTEN_HOST:CALLBACK_LISTEN_PORT
+# (e.g. a tunnel). Without it, renders are tracked by polling only.
+CALLBACK_PUBLIC_URL = os.getenv("CALLBACK_PUBLIC_URL")
+CALLBACK_LISTEN_HOST = os.getenv("CALLBACK_LISTEN_HOST", "0.0.0.0")
+CALLBACK_LISTEN_PORT = int(os.getenv("CALLBACK_LISTEN_PORT", "8765"))
+CALLBACK_SECRET = os.getenv("CALLBACK_SECRET")  # signs callback URLs; random per process if unset
 
 GEMINI_API_KEY_ENV = os.getenv("GEMINI_API_KEY")
 OPENAI_API_KEY_ENV = os.getenv("OPENAI_API_KEY")  # OpenAI API Key
@@ -35,7 +46,12 @@ WORDS_PER_SECOND_ESTIMATE = float(os.getenv("WORDS_PER_SECOND_ESTIMATE", "2.5"))
 DEFAULT_OPENAI_TTS_VOICE = "alloy"
 DEFAULT_OPENAI_TTS_MODEL = "gpt-4o-mini-tts"
 
-TEMP_AUDIO_FILENAME = "temp_narration_openai.mp3"
+# Set NARRATION_STREAM_UPLOAD=false to spool each narration to its own scratch folder before uploading it.
+NARRATION_STREAM_UPLOAD = os.getenv("NARRATION_STREAM_UPLOAD", "true").lower() in ("1", "true", "yes")
+NARRATION_SCRATCH_DIR = os.getenv("NARRATION_SCRATCH_DIR") or None
+# Scripts this long (characters; 0 = never) are synthesized as sentence-aligned pieces in parallel and joined.
+NARRATION_CHUNK_MIN_CHARS = int(os.getenv("NARRATION_CHUNK_MIN_CHARS", "900"))
+NARRATION_TTS_CONCURRENCY = int(os.getenv("NARRATION_TTS_CONCURRENCY", "4"))
 
 # --- Default Merge Fields ---
 ORIGINAL_DEFAULT_MERGE_FIELDS = [
@@ -75,35 +91,42 @@ def get_original_placeholder(field_key_to_find):
 
 
 # --- LLM and TTS Functions ---
+@st.cache_resource
+def get_script_cache():
+    # Shared by every session; scripts also survive restarts (on disk).
+    return ScriptCache()
+
+
 def generate_script_with_gemini(api_key, description, target_duration_seconds, words_per_second,
-                                model_name="gemini-2.5-pro-preview-05-06"):
+                                model_name="gemini-2.5-pro-preview-05-06", fresh=False):
+    """Script for the description; reused from the script cache for the same inputs unless fresh is set."""
     if not api_key:
         st.error("Gemini API Key is missing. Please configure it in your .env file.")
         return "Error: Gemini API Key not configured."
+    key = script_key(description, target_duration_seconds, words_per_second, model_name, SCRIPT_PROMPT_VERSION)
+    script, from_cache = get_script_cache().get_or_generate(
+        key, lambda: _call_gemini(api_key, description, target_duration_seconds, words_per_second, model_name),
+        fresh=fresh, model_name=model_name)
+    if from_cache:
+        st.info("Reusing the script generated earlier for this description (tick 'Fresh script' for a new take).")
+    return script
+
+
+def _call_gemini(api_key, description, target_duration_seconds, words_per_second, model_name):
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel(model_name)
+        model = get_client_registry().gemini_model(api_key, model_name)
         target_word_count = int(target_duration_seconds * words_per_second)
-        prompt = (
-            f"You are an enthusiastic and persuasive real estate sales agent creating a promotional video script aimed at attracting potential residents. "
-            f"Your task is to transform the following property description into a compelling and inviting narration. "
-            f"The script should be approximately {target_word_count} words long, suitable for a {target_duration_seconds}-second video, and delivered in a warm, confident, and professional sales tone. "
-            f"Highlight the key benefits and lifestyle a resident would enjoy. Make them feel like this is their next dream home. "
-            f"Focus on the most appealing features that would matter to someone looking to live there. "
-            f"Keep the language clear, aspirational, and avoid overly technical jargon. "
-            f"Conclude with an inviting remark or a subtle call to imagine themselves living there. "
-            f"Strictly provide ONLY the spoken narration script, with no scene directions, camera instructions, or any other text.\n\n"
-            f"Property Description:\n\"\"\"\n{description}\n\"\"\"\n\n"
-            f"Generate ONLY the narration script text, nothing else."
-        )
-        with st.spinner(f"🤖 Generating script with Gemini (target: ~{target_word_count} words)..."):
-            response = model.generate_content(prompt)
-
+        prompt = build_script_prompt(description, target_duration_seconds, words_per_second)
+        # Streamed, so the script appears as Gemini writes it instead of after the whole response.
+        live_script = st.empty()
+        live_script.info(f"🤖 Generating script with Gemini (target: ~{target_word_count} words)...")
+        response = model.generate_content(prompt, stream=True)
         generated_text = ""
-        if hasattr(response, 'parts') and response.parts:
-            generated_text = "".join(part.text for part in response.parts if hasattr(part, 'text'))
-        elif hasattr(response, 'text'):
-            generated_text = response.text
+        for chunk in response:
+            generated_text += gemini_response_text(chunk)
+            if generated_text:
+                live_script.markdown(f"```text\n{generated_text}\n```")
+        live_script.empty()
 
         if not generated_text:
             feedback = "No prompt feedback available."
@@ -118,148 +141,94 @@ def generate_script_with_gemini(api_key, description, target_duration_seconds, w
         return f"Error during Gemini API call: {str(e)}"
 
 
-def generate_openai_tts_audio_to_file(api_key, script_text, output_filepath, voice_model, tts_model):
-    """Generates TTS audio using OpenAI Speech API and saves it to a local file."""
-    if not api_key:
-        st.error("OpenAI API Key is missing. Please configure it in your .env file.")
-        return None
-    try:
-        client = OpenAI(api_key=api_key)
-        st.info(f"Synthesizing speech with OpenAI TTS (voice: {voice_model}, model: {tts_model})...")
-
-        with client.audio.speech.with_streaming_response.create(
-                model=tts_model,
-                voice=voice_model,
-                input=script_text,
-                response_format="mp3"
-        ) as response:
-            response.stream_to_file(output_filepath)
-
-        st.success(f'OpenAI TTS audio content written to local file: "{output_filepath}"')
-        return output_filepath
-    except Exception as e:
-        st.error(f"OpenAI TTS API error: {e}")
-        return None
-
-
-def upload_audio_and_get_public_url(local_filepath, filename_in_bucket):
-    """
-    Uploads the local audio file to Supabase Storage and returns its public URL.
-    Shotstack needs a publicly accessible URL for the audio.
-    """
-    if not SUPABASE_URL or not SUPABASE_KEY:
-        st.error("Supabase URL or Key is not configured. Please set SUPABASE_URL and SUPABASE_SERVICE_KEY in .env.")
-        return None
+@st.cache_resource
+def get_narration_publisher():
+    # Streams TTS audio straight into the Supabase upload, so concurrent sessions never share a local file.
+    # Narrations are stored under a hash of (script, voice, model), so a repeated one is reused as is.
+    return NarrationPublisher(get_client_registry(), OPENAI_API_KEY_ENV, SUPABASE_URL, SUPABASE_KEY,
+                              SUPABASE_BUCKET_NAME, stream_upload=NARRATION_STREAM_UPLOAD,
+                              scratch_dir=NARRATION_SCRATCH_DIR, chunk_min_chars=NARRATION_CHUNK_MIN_CHARS,
+                              tts_concurrency=NARRATION_TTS_CONCURRENCY)
 
-    try:
-        supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-        content_type, _ = mimetypes.guess_type(local_filepath)
-        if not content_type:
-            content_type = "audio/mpeg"
-
-        with open(local_filepath, 'rb') as f:
-            st.info(
-                f"Uploading '{local_filepath}' to Supabase bucket '{SUPABASE_BUCKET_NAME}' as '{filename_in_bucket}'...")
-            upload_response = supabase.storage.from_(SUPABASE_BUCKET_NAME).upload(
-                path=filename_in_bucket,
-                file=f,
-                file_options={"content-type": content_type, "upsert": "false"}
-            )
-
-        public_url_data = supabase.storage.from_(SUPABASE_BUCKET_NAME).get_public_url(filename_in_bucket)
-
-        if isinstance(public_url_data, str):
-            st.success(f"Successfully uploaded to Supabase. Public URL: {public_url_data}")
-            return public_url_data
-        else:
-            st.error(f"Failed to get public URL from Supabase. Response: {public_url_data}")
-            return None
 
-    except Exception as e:
-        st.error(f"Supabase upload or URL retrieval failed: {e}")
-        if hasattr(e, 'message') and isinstance(e.message, dict) and 'message' in e.message:
-            st.error(f"Supabase specific error: {e.message['message']}")
-        elif hasattr(e, 'args') and e.args:
-            st.error(f"Error details: {e.args[0]}")
-        return None
+def _streamlit_log(message, level="info", source=""):
+    {"error": st.error, "warning": st.warning, "success": st.success}.get(level, st.info)(message)
 
 
 def generate_narration_audio_url(openai_api_key, script_text, openai_tts_voice, openai_tts_model):
-    """Orchestrates TTS generation with OpenAI, saving to file, uploading, and getting public URL."""
+    """Synthesizes the narration with OpenAI TTS into Supabase Storage and returns its public URL."""
     if not script_text or "Error:" in script_text:
         st.warning("Skipping OpenAI TTS due to script generation error or empty script.")
         return None
-
-    local_audio_file = TEMP_AUDIO_FILENAME
-    public_audio_url = None
-
-    try:
-        with st.spinner(
-                f"Generating narration with OpenAI TTS (Voice: {openai_tts_voice}, Model: {openai_tts_model})..."):
-            if not generate_openai_tts_audio_to_file(openai_api_key, script_text, local_audio_file, openai_tts_voice,
-                                                     openai_tts_model):
-                st.error("OpenAI TTS failed to generate local audio file.")
-                return None
-
-        with st.spinner(f"Uploading narration audio to Supabase ({SUPABASE_BUCKET_NAME})..."):
-            timestamp = int(time.time())
-            base_name = os.path.basename(local_audio_file).replace(" ", "_")
-            unique_filename_in_bucket = f"narration_openai_{timestamp}_{base_name}"
-
-            public_audio_url = upload_audio_and_get_public_url(local_audio_file, unique_filename_in_bucket)
-
-        if public_audio_url:
-            st.success(f"🎙️ OpenAI TTS audio processed. Public URL (Supabase): {public_audio_url}")
-        else:
-            st.error("Failed to upload audio to Supabase or get public URL.")
-
-        return public_audio_url
-
-    except Exception as e:
-        st.error(f"Error in OpenAI TTS audio processing pipeline: {e}")
+    if not openai_api_key:
+        st.error("OpenAI API Key is missing. Please configure it in your .env file.")
+        return None
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        st.error("Supabase URL or Key is not configured. Please set SUPABASE_URL and SUPABASE_SERVICE_KEY in .env.")
         return None
-    finally:
-        if os.path.exists(local_audio_file):
-            try:
-                os.remove(local_audio_file)
-                st.info(f"Temporary local audio file '{local_audio_file}' removed.")
-            except Exception as e_rem:
-                st.warning(f"Could not remove temporary audio file {local_audio_file}: {e_rem}")
-
 
-# --- Shotstack API Call Functions (unchanged) ---
-def render_video_with_shotstack(api_key_to_use, template_id, merge_fields, owner_id):
-    if not api_key_to_use:
-        st.error("Shotstack API Key is not configured.")
+    with st.spinner(f"Generating narration with OpenAI TTS (Voice: {openai_tts_voice}, Model: {openai_tts_model}) "
+                    f"and uploading it to Supabase ({SUPABASE_BUCKET_NAME})..."):
+        public_audio_url = get_narration_publisher().publish(script_text, openai_tts_voice, openai_tts_model,
+                                                             log=_streamlit_log)
+    if public_audio_url:
+        st.success(f"🎙️ OpenAI TTS audio processed. Public URL (Supabase): {public_audio_url}")
+    else:
+        st.error("Failed to generate narration audio or upload it to Supabase.")
+    return public_audio_url
+
+
+# --- Media Preflight ---
+@st.cache_resource
+def get_media_preflight():
+    # Shared by every session, so the same listing's URLs are only probed again after the cache TTL.
+    return MediaPreflight()
+
+
+def media_url_problems():
+    """Image / logo URLs Shotstack would fail to fetch, checked concurrently before any paid API call."""
+    fields = {key: st.session_state.get(f"user_input_{key}", get_original_placeholder(key))
+              for key in PREFLIGHT_MERGE_FIELDS}
+    fields = {key: url for key, url in fields.items() if url}
+    with st.spinner(f"Checking {len(fields)} media URL(s)..."):
+        results = get_media_preflight().check_all(list(fields.values()))
+    return [f"{key}: {results[url]['error']}" for key, url in fields.items() if not results[url]["ok"]]
+
+
+# --- Shotstack API Call Functions ---
+@st.cache_resource
+def get_shotstack_client(api_key):
+    # One client per process so every session shares its rate-limit buckets and keep-alive connections.
+    return ShotstackClient(api_key, render_endpoint=SHOTSTACK_API_ENDPOINT,
+                           status_endpoint_template=SHOTSTACK_STATUS_ENDPOINT_TEMPLATE)
+
+
+@st.cache_resource
+def get_callback_server():
+    if not CALLBACK_PUBLIC_URL:
         return None
-    headers = {"Content-Type": "application/json", "x-api-key": api_key_to_use}
-    payload = {"id": template_id, "merge": merge_fields, "owner": owner_id}
+    server = CallbackServer(host=CALLBACK_LISTEN_HOST, port=CALLBACK_LISTEN_PORT, public_url=CALLBACK_PUBLIC_URL,
+                            secret=CALLBACK_SECRET)
     try:
-        st.info("Sending request to Shotstack API...")
-        response = requests.post(SHOTSTACK_API_ENDPOINT, headers=headers, json=payload)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        st.error(f"API request failed (render_video): {e}")
-        if hasattr(e, 'response') and e.response is not None: st.error(f"API response content: {e.response.text}")
+        return server.start()
+    except OSError as e:
+        print(f"WARNING: Callback receiver could not listen on {CALLBACK_LISTEN_HOST}:{CALLBACK_LISTEN_PORT} ({e}); "
+              f"falling back to polling.")
         return None
 
 
-def get_render_status(api_key_to_use, render_id):
+def render_video_with_shotstack(api_key_to_use, template_id, merge_fields, owner_id):
+    """Submits the render and returns its RenderJob (resolved by the Shotstack callback when enabled), or None."""
     if not api_key_to_use:
         st.error("Shotstack API Key is not configured.")
         return None
-    if not render_id: return None
-    headers = {"x-api-key": api_key_to_use, "Accept": "application/json"}
-    status_url = SHOTSTACK_STATUS_ENDPOINT_TEMPLATE.format(render_id)
-    try:
-        response = requests.get(status_url, headers=headers)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        st.error(f"Failed to get render status: {e}")
-        if hasattr(e, 'response') and e.response is not None: st.error(f"API response content: {e.response.text}")
-        return None
+    shotstack_client = get_shotstack_client(api_key_to_use)
+    st.info("Sending request to Shotstack API...")
+    render_job = shotstack_client.submit_render(template_id, merge_fields, owner_id, callbacks=get_callback_server())
+    if render_job is None:
+        st.error(f"API submission failed: {shotstack_client.last_error}")
+        if shotstack_client.last_response: st.json(shotstack_client.last_response)
+    return render_job
 
 
 # --- Streamlit App Interface ---
@@ -281,6 +250,7 @@ if 'owner_id' not in st.session_state: st.session_state.owner_id = SHOTSTACK_OWN
 if 'render_id' not in st.session_state: st.session_state.render_id = None
 if 'video_url' not in st.session_state: st.session_state.video_url = None
 if 'last_status' not in st.session_state: st.session_state.last_status = None
+if 'render_job' not in st.session_state: st.session_state.render_job = None
 # API keys are now sourced directly from ENV VARS, not session state for override
 # if 'current_gemini_api_key' not in st.session_state: st.session_state.current_gemini_api_key = GEMINI_API_KEY_ENV
 # if 'current_openai_api_key' not in st.session_state: st.session_state.current_openai_api_key = OPENAI_API_KEY_ENV
@@ -304,6 +274,7 @@ WORDS_PER_SECOND_ESTIMATE = st.sidebar.number_input("Words Per Second (Speaking
 GEMINI_MODEL_NAME = st.sidebar.selectbox("Gemini Model",
                                          options=["gemini-2.5-pro-preview-05-06","gemini-1.5-flash-latest", "gemini-1.0-pro-latest", "gemini-pro"],
                                          index=0, key="gemini_model_sb")
+GEMINI_FRESH_SCRIPT = st.sidebar.checkbox("Fresh script (ignore cached script)", value=False, key="gemini_fresh_sb")
 
 st.sidebar.subheader("OpenAI ")
 if OPENAI_API_KEY_ENV:
@@ -372,6 +343,7 @@ if not st.session_state.render_id or st.session_state.last_status in ["done", "f
             st.session_state[f"user_input_{field_key}"] = input_value
 
         st.session_state.render_id = None
+        st.session_state.render_job = None
         st.session_state.video_url = None
         st.session_state.last_status = None
         st.session_state.generated_script = None
@@ -391,10 +363,13 @@ if not st.session_state.render_id or st.session_state.last_status in ["done", "f
             st.error("Supabase URL or Key is not configured in .env. Audio upload will fail.")
         elif not st.session_state.property_description:
             st.error("Please enter a property description for script generation.")
+        elif media_problems := media_url_problems():
+            st.error("These media URLs would fail the render; fix them and resubmit:\n\n- " +
+                     "\n- ".join(media_problems))
         else:
             current_script = generate_script_with_gemini(active_gemini_key, st.session_state.property_description,
                                                          TARGET_VIDEO_DURATION_SECONDS, WORDS_PER_SECOND_ESTIMATE,
-                                                         GEMINI_MODEL_NAME)
+                                                         GEMINI_MODEL_NAME, fresh=GEMINI_FRESH_SCRIPT)
             st.session_state.generated_script = current_script
 
             if not current_script or "Error:" in current_script:
@@ -421,17 +396,15 @@ if not st.session_state.render_id or st.session_state.last_status in ["done", "f
                         field_value = ""
                     current_merge_fields.append({"find": fd["find"], "replace": field_value})
 
-                api_response = render_video_with_shotstack(CONFIGURED_API_KEY, st.session_state.template_id,
-                                                           current_merge_fields, st.session_state.owner_id)
-                if api_response and api_response.get("success"):
-                    st.session_state.render_id = api_response.get("response", {}).get("id")
+                render_job = render_video_with_shotstack(CONFIGURED_API_KEY, st.session_state.template_id,
+                                                         current_merge_fields, st.session_state.owner_id)
+                if render_job:
+                    st.session_state.render_id = render_job.job_id
+                    st.session_state.render_job = render_job
                     st.session_state.last_status = "submitted"
                     st.success(f"✅ Video render job submitted! Render ID: {st.session_state.render_id}")
                     st.info("Checking render progress...")
                     st.rerun()
-                elif api_response:
-                    st.error(f"API submission failed: {api_response.get('message', 'Unknown error')}")
-                    st.json(api_response)
 
 # --- Display Generated Script (if not rendering) ---
 if st.session_state.generated_script and not st.session_state.render_id and st.session_state.last_status not in ["done",
@@ -456,23 +429,32 @@ if st.session_state.render_id and st.session_state.last_status not in ["done", "
         st.caption(f"OpenAI TTS Audio URL used (Supabase): `{st.session_state.tts_audio_url}`")
         st.audio(st.session_state.tts_audio_url)
 
-    with st.spinner("Fetching latest render status..."):
-        status_response = get_render_status(CONFIGURED_API_KEY, st.session_state.render_id)
-
-    if status_response and status_response.get("success"):
-        render_data = status_response.get("response", {})
-        current_status = render_data.get("status")
+    render_job = st.session_state.render_job
+    if render_job is None or render_job.job_id != st.session_state.render_id:
+        render_job = get_shotstack_client(CONFIGURED_API_KEY).render_job(st.session_state.render_id)
+        st.session_state.render_job = render_job
+    with st.spinner(f"Waiting for render (status: {st.session_state.last_status or 'checking'})..."):
+        # Returns as soon as the Shotstack callback resolves the job (if callbacks are enabled), else polls.
+        render_job.wait(timeout=SHOTSTACK_WAIT_SLICE_SECONDS)
+    callback_server = get_callback_server()
+    if callback_server and render_job.state != render_job.PENDING:
+        callback_server.unregister("shotstack", render_job.job_id)  # finished by the watchdog poll
+
+    if render_job.state != render_job.PENDING or render_job.last_status:
+        current_status = {render_job.COMPLETED: "done", render_job.FAILED: "failed"}.get(render_job.state,
+                                                                                         render_job.last_status)
         st.session_state.last_status = current_status
         status_placeholder.info(f"Current Status: **{current_status.upper()}**")
 
         if current_status == "done":
-            st.session_state.video_url = render_data.get("url")
+            st.session_state.video_url = render_job.result
             status_placeholder.success("🎉 Video rendering complete!")
             vid_col, _ = st.columns([2, 1])
             with vid_col:
                 st.video(st.session_state.video_url)
             if st.button("✨ Start New Video Edit", key="new_edit_done"):
                 st.session_state.render_id = None;
+                st.session_state.render_job = None;
                 st.session_state.video_url = None;
                 st.session_state.last_status = None;
                 st.session_state.generated_script = None;
@@ -484,23 +466,21 @@ if st.session_state.render_id and st.session_state.last_status not in ["done", "
                     field_data_orig["replace"]
                 st.rerun()
         elif current_status == "failed":
-            error_message = render_data.get("error", "Unknown error")
-            status_placeholder.error(f"☠️ Video rendering failed. Reason: {error_message}")
-            st.json(render_data)
+            status_placeholder.error(f"☠️ Video rendering failed. Reason: {render_job.error_message}")
+            if render_job.render_data: st.json(render_job.render_data)
             if st.button("Try Editing Again", key="edit_again_failed"):
                 st.session_state.render_id = None;
+                st.session_state.render_job = None;
                 st.session_state.video_url = None;
                 st.session_state.last_status = None
                 st.rerun()
         else:
             status_placeholder.info(
                 f"Video is still processing ({current_status.upper()}). Page refreshes automatically.")
-            time.sleep(10)
             st.rerun()
-    elif status_response:
-        st.error(f"Error fetching status: {status_response.get('message', 'Unknown error')}")
-        st.json(status_response)
-        if st.button("Refresh Status Manually", key="refresh_status_error"): st.rerun()
+    else:
+        status_placeholder.info("Waiting for the render to report progress. Page refreshes automatically.")
+        st.rerun()
 
 # --- Completed/Failed Video Display ---
 elif st.session_state.video_url and st.session_state.last_status == "done":
@@ -515,6 +495,7 @@ elif st.session_state.video_url and st.session_state.last_status == "done":
         st.audio(st.session_state.tts_audio_url)
     if st.button("✨ Start New Video Edit", key="new_edit_completed"):
         st.session_state.render_id = None;
+        st.session_state.render_job = None;
         st.session_state.video_url = None;
         st.session_state.last_status = None;
         st.session_state.generated_script = None;
@@ -534,6 +515,7 @@ elif st.session_state.last_status == "failed":
         st.audio(st.session_state.tts_audio_url)
     if st.button("Try Editing Again", key="edit_again_prev_failed"):
         st.session_state.render_id = None;
+        st.session_state.render_job = None;
         st.session_state.video_url = None;
         st.session_state.last_status = None
         st.rerun()
@@ -0,0 +1,124 @@
+# asset_cache.py
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_CACHE_DIR = os.getenv("APP_CACHE_DIR", ".cache")
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def sha256_of(source) -> str:
+    """SHA-256 of bytes-like data, a file path or a seekable file object, read in chunks so large files are never
+    fully loaded. File objects are rewound to where they were so they can be uploaded afterwards."""
+    digest = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        digest.update(source)
+    elif hasattr(source, "read"):
+        position = source.tell()
+        for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+        source.seek(position)
+    else:
+        with open(source, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ImageKeyCache:
+    """Persistent map of SHA-256(image bytes) -> HeyGen image_key with TTL expiry and LRU eviction.
+
+    Keys are scoped per HeyGen account (hash of the API key), because an image_key is only valid for the account
+    that uploaded it.
+    """
+
+    def __init__(self, db_path: str = None, ttl_seconds: float = 30 * 24 * 3600, max_entries: int = 5000,
+                 logger=None):
+        self.db_path = db_path or os.path.join(DEFAULT_CACHE_DIR, "heygen_assets.sqlite3")
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.logger = logger or logging.getLogger(__name__)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS image_keys ("
+                         "account TEXT NOT NULL, sha256 TEXT NOT NULL, image_key TEXT NOT NULL, "
+                         "created_at REAL NOT NULL, last_used REAL NOT NULL, PRIMARY KEY (account, sha256))")
+            conn.execute("CREATE INDEX IF NOT EXISTS image_keys_last_used ON image_keys (last_used)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:  # commits on success, rolls back on error
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def account_of(client) -> str:
+        return hashlib.sha256(client.api_key.encode()).hexdigest()[:16]
+
+    def get(self, account: str, digest: str) -> str | None:
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT image_key, created_at FROM image_keys WHERE account = ? AND sha256 = ?",
+                               (account, digest)).fetchone()
+            if row and now - row[1] > self.ttl_seconds:
+                conn.execute("DELETE FROM image_keys WHERE account = ? AND sha256 = ?", (account, digest))
+                row = None
+            if row:
+                conn.execute("UPDATE image_keys SET last_used = ? WHERE account = ? AND sha256 = ?",
+                             (now, account, digest))
+        return row[0] if row else None
+
+    def put(self, account: str, digest: str, image_key: str):
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO image_keys VALUES (?, ?, ?, ?, ?)",
+                         (account, digest, image_key, now, now))
+            conn.execute("DELETE FROM image_keys WHERE created_at < ?", (now - self.ttl_seconds,))
+            # LRU: keep only the max_entries most recently used rows.
+            conn.execute("DELETE FROM image_keys WHERE rowid IN (SELECT rowid FROM image_keys "
+                         "ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def invalidate(self, account: str, digest: str):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM image_keys WHERE account = ? AND sha256 = ?", (account, digest))
+
+    def get_or_upload(self, client, source, file_name: str) -> tuple[str | None, bool]:
+        """Returns (image_key, from_cache) for source (bytes, path or file object). A hit is trusted and skips the
+        upload entirely (no status call to HeyGen); a caller whose request HeyGen then rejects because the key has
+        gone stale calls reupload()."""
+        account, digest = self.account_of(client), sha256_of(source)
+        image_key = self.get(account, digest)
+        if image_key:
+            self.hits += 1
+            self.logger.info(f"image_key cache hit for '{file_name}' ({digest[:12]}): {image_key}")
+            return image_key, True
+        return self._upload(client, source, file_name, account, digest), False
+
+    def reupload(self, client, source, file_name: str) -> str | None:
+        """Drops the cached image_key for source (HeyGen rejected it: expired or deleted asset) and uploads again."""
+        account, digest = self.account_of(client), sha256_of(source)
+        self.logger.info(f"Dropping the rejected image_key for '{file_name}' ({digest[:12]}).")
+        self.invalidate(account, digest)
+        return self._upload(client, source, file_name, account, digest)
+
+    def _upload(self, client, source, file_name: str, account: str, digest: str) -> str | None:
+        self.misses += 1
+        image_key = client.upload_asset_stream(source, file_name=file_name)
+        if image_key:
+            self.put(account, digest, image_key)
+        return image_key
+
+    def stats(self) -> dict:
+        with self._lock, self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM image_keys").fetchone()[0]
+        return {"entries": entries, "hits": self.hits, "misses": self.misses}
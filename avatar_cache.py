@@ -0,0 +1,217 @@
+# avatar_cache.py
+import io
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from PIL import Image, ImageOps
+
+from asset_cache import DEFAULT_CACHE_DIR, ImageKeyCache, sha256_of
+
+# Groups owned by the cache are named "<prefix><sha256[:16]>" so they can be rediscovered if the DB is lost and are
+# never mistaken for per-run TempGroup_* groups.
+AVATAR_GROUP_PREFIX = "CachedAvatar_"
+
+
+def perceptual_hash(source) -> int:
+    """64-bit difference hash (dHash); near-identical photos (re-encoded, resized, EXIF-rotated) differ by few bits."""
+    position = source.tell() if hasattr(source, "read") else None
+    image = Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else source)
+    image = ImageOps.exif_transpose(image).convert("L").resize((9, 8), Image.Resampling.LANCZOS)
+    if position is not None:
+        source.seek(position)
+    pixels = list(image.getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class AvatarCache:
+    """Maps a photo fingerprint to a ready HeyGen avatar group / look (talking photo) ID.
+
+    Entries are shared across runs and sessions, reference counted while a video is being rendered, and only
+    deleted from HeyGen once they have been idle (refcount 0) for idle_ttl_seconds.
+    """
+
+    def __init__(self, db_path: str = None, idle_ttl_seconds: float = 7 * 24 * 3600,
+                 lease_timeout_seconds: float = 6 * 3600, phash_max_distance: int = 6, logger=None):
+        self.db_path = db_path or os.path.join(DEFAULT_CACHE_DIR, "heygen_avatars.sqlite3")
+        self.idle_ttl_seconds = idle_ttl_seconds
+        # A lease older than this is treated as abandoned (crashed/closed session) and no longer pins the group.
+        self.lease_timeout_seconds = lease_timeout_seconds
+        self.phash_max_distance = phash_max_distance
+        self.logger = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._build_locks = {}
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS avatars ("
+                         "account TEXT NOT NULL, sha256 TEXT NOT NULL, phash TEXT, group_id TEXT NOT NULL, "
+                         "look_id TEXT NOT NULL, refcount INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL, "
+                         "last_used REAL NOT NULL, PRIMARY KEY (account, sha256))")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _build_lock(self, account: str, digest: str) -> threading.Lock:
+        with self._lock:
+            return self._build_locks.setdefault((account, digest), threading.Lock())
+
+    def find(self, account: str, digest: str, phash: int | None = None) -> dict | None:
+        """Exact SHA-256 match first, then the closest perceptual-hash match within phash_max_distance."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM avatars WHERE account = ? AND sha256 = ?", (account, digest)).fetchone()
+            if row or phash is None:
+                return dict(row) if row else None
+            best, best_distance = None, self.phash_max_distance + 1
+            for candidate in conn.execute("SELECT * FROM avatars WHERE account = ? AND phash IS NOT NULL",
+                                          (account,)):
+                distance = hamming_distance(phash, int(candidate["phash"], 16))
+                if distance < best_distance:
+                    best, best_distance = candidate, distance
+        if best is not None:
+            self.logger.info(f"Avatar cache near-duplicate match ({best_distance} bits) -> group {best['group_id']}")
+        return dict(best) if best else None
+
+    def _lease(self, account: str, entry: dict, reused: bool) -> dict:
+        with self._connect() as conn:
+            conn.execute("UPDATE avatars SET refcount = refcount + 1, last_used = ? WHERE account = ? AND sha256 = ?",
+                         (time.time(), account, entry["sha256"]))
+        return {"account": account, "fingerprint": entry["sha256"], "group_id": entry["group_id"],
+                "look_id": entry["look_id"], "reused": reused}
+
+    def _store(self, account: str, digest: str, phash: int | None, group_id: str, look_id: str) -> dict:
+        now = time.time()
+        entry = {"sha256": digest, "group_id": group_id, "look_id": look_id}
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO avatars VALUES (?, ?, ?, ?, ?, 0, ?, ?)",
+                         (account, digest, f"{phash:016x}" if phash is not None else None, group_id, look_id, now,
+                          now))
+        return entry
+
+    def _discover_group(self, client, group_name: str) -> str | None:
+        group = client.find_avatar_group(group_name)
+        return (group.get("id") or group.get("group_id")) if group else None
+
+    def acquire(self, client, source, file_name: str, image_key_cache: ImageKeyCache | None = None,
+                look_timeout_seconds: float = 120, look_waiter=None) -> dict | None:
+        """Returns a lease dict (look_id, group_id, fingerprint, reused) for the photo (bytes, path or file object),
+        creating the group on a miss.
+
+        look_waiter(group_id) -> look_id | None can be supplied to customise (e.g. display) look polling.
+        """
+        account = ImageKeyCache.account_of(client)
+        digest = sha256_of(source)
+        try:
+            phash = perceptual_hash(source)
+        except Exception as e:  # Pillow cannot decode it; exact-match caching still works
+            self.logger.warning(f"Perceptual hash failed for '{file_name}': {e}")
+            phash = None
+
+        # Serialise builds per photo so concurrent sessions with the same agent share one group.
+        with self._build_lock(account, digest):
+            entry = self.find(account, digest, phash)
+            if entry:
+                self.logger.info(f"Avatar cache hit for '{file_name}': look {entry['look_id']}")
+                return self._lease(account, entry, reused=True)
+
+            group_name = f"{AVATAR_GROUP_PREFIX}{digest[:16]}"
+            group_id = self._discover_group(client, group_name)
+            if group_id:
+                self.logger.info(f"Reusing existing HeyGen group '{group_name}' ({group_id}) for '{file_name}'.")
+            else:
+                group_id = self._create_group(client, source, file_name, group_name, image_key_cache)
+                if not group_id:
+                    return None
+
+            if look_waiter:
+                look_id = look_waiter(group_id)
+            else:
+                look_job = client.look_job(group_id)
+                look_job.wait(timeout=look_timeout_seconds)
+                look_id = look_job.result if look_job.succeeded else None
+            if not look_id:
+                self.logger.error(f"No ready look for avatar group {group_id}; it will be retried on the next run.")
+                return None
+            return self._lease(account, self._store(account, digest, phash, group_id, look_id), reused=False)
+
+    def _create_group(self, client, source, file_name: str, group_name: str,
+                      image_key_cache: ImageKeyCache | None) -> str | None:
+        if image_key_cache is None:
+            image_key, cached = client.upload_asset_stream(source, file_name=file_name), False
+        else:
+            image_key, cached = image_key_cache.get_or_upload(client, source, file_name)
+        if not image_key:
+            return None
+        group_id = client.create_photo_avatar_group(name=group_name, image_key=image_key)
+        if not group_id and cached:
+            # Cached keys are trusted without a check; only once HeyGen rejects one (expired/deleted asset) is the
+            # photo uploaded again, once.
+            self.logger.warning(f"Cached image key {image_key} rejected; re-uploading '{file_name}'.")
+            image_key = image_key_cache.reupload(client, source, file_name)
+            if image_key:
+                group_id = client.create_photo_avatar_group(name=group_name, image_key=image_key)
+        return group_id
+
+    def release(self, lease: dict | None):
+        if not lease:
+            return
+        with self._connect() as conn:
+            conn.execute("UPDATE avatars SET refcount = MAX(refcount - 1, 0), last_used = ? "
+                         "WHERE account = ? AND sha256 = ?", (time.time(), lease["account"], lease["fingerprint"]))
+
+    def invalidate(self, lease: dict | None):
+        """Forgets an entry whose group/look turned out to be unusable (e.g. deleted on the HeyGen side)."""
+        if not lease:
+            return
+        with self._connect() as conn:
+            conn.execute("DELETE FROM avatars WHERE account = ? AND sha256 = ?",
+                         (lease["account"], lease["fingerprint"]))
+
+    # Leased entries only become evictable once their lease has also timed out.
+    _IDLE_CONDITION = "last_used < ? - CASE WHEN refcount > 0 THEN ? ELSE 0 END"
+
+    def idle_entries(self, account: str) -> list[dict]:
+        now = time.time()
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT * FROM avatars WHERE account = ? AND {self._IDLE_CONDITION}",
+                                (account, now - self.idle_ttl_seconds, self.lease_timeout_seconds)).fetchall()
+        return [dict(row) for row in rows]
+
+    def claim_idle(self, account: str, digest: str) -> bool:
+        """Atomically removes an entry if it is still idle, so no new lease can pick it up while it is deleted.
+
+        If the HeyGen delete then fails, the group keeps its CachedAvatar_ name and acquire() rediscovers it.
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(f"DELETE FROM avatars WHERE account = ? AND sha256 = ? AND {self._IDLE_CONDITION}",
+                                  (account, digest, time.time() - self.idle_ttl_seconds, self.lease_timeout_seconds))
+        return cursor.rowcount > 0
+
+    def evict_idle(self, client) -> list[str]:
+        """Deletes HeyGen groups that have been idle past idle_ttl_seconds; returns the deleted group IDs."""
+        account = ImageKeyCache.account_of(client)
+        evicted = []
+        for entry in self.idle_entries(account):
+            if self.claim_idle(account, entry["sha256"]) and client.delete_photo_avatar_group(
+                    group_id=entry["group_id"]):
+                evicted.append(entry["group_id"])
+        if evicted:
+            self.logger.info(f"Evicted {len(evicted)} idle cached avatar group(s): {evicted}")
+        return evicted
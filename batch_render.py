@@ -0,0 +1,281 @@
+# batch_render.py
+# Renders a CSV / JSONL file of listings through the full Gemini -> HeyGen -> Shotstack pipeline:
+#   python batch_render.py listings.csv results.jsonl --workers 8 --concurrency heygen=3 --concurrency shotstack=2
+# Each finished row is appended to the output JSONL straight away, and re-running with the same output file
+# resumes: rows recorded as done are skipped (failed ones are retried unless --skip-failed). Runs are also kept in
+# a job database next to the output (--db), so a row interrupted mid-run is resumed at the stage it had reached
+# and its submitted HeyGen / Shotstack jobs are waited on rather than paid for again.
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import os
+import queue
+import sys
+import time
+
+from dotenv import load_dotenv
+
+from engine_factory import build_engine
+from job_store import UNFINISHED_STATES, JobStore
+from pipeline import DEFAULT_INPUTS, DEFAULT_MERGE_FIELDS, PipelineEngine, PipelineRun
+
+# Column name (case-insensitive) -> pipeline input. Columns named like a merge field (PRODUCT_NAME, IMAGE_SRC_2,
+# ...) fill that field; anything else is ignored unless mapped with --map.
+INPUT_COLUMNS = {
+    "description": "property_description",
+    "property_description": "property_description",
+    "photo": "photo_path",
+    "photo_path": "photo_path",
+    "talking_photo_id": "default_talking_photo_id",
+    "voice_id": "voice_id",
+    "narration_script": "bg_narration_script",
+    "bg_narration_script": "bg_narration_script",
+}
+# Filled in by the pipeline, never from a row.
+PIPELINE_MERGE_FIELDS = ("AVATAR_VIDEO", "NARRATION_AUDIO_SRC")
+DEFAULT_VENDOR_CONCURRENCY = {"gemini": 4, "heygen": 3, "openai": 4, "shotstack": 2, "storage": 4}
+
+
+def read_rows(path: str, input_format: str | None = None):
+    """Yields (row_number, row dict) from a CSV or JSONL file, one row at a time."""
+    input_format = input_format or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+    with open(path, newline="" if input_format == "csv" else None, encoding="utf-8") as f:
+        if input_format == "csv":
+            for row_number, row in enumerate(csv.DictReader(f), start=1):
+                yield row_number, row
+            return
+        for row_number, line in enumerate(f, start=1):
+            if line.strip():
+                yield row_number, json.loads(line)
+
+
+def row_key(row: dict) -> str:
+    """Stable identity of a row for resume: its "id" column if present, else a hash of its contents."""
+    if row.get("id"):
+        return str(row["id"])
+    return hashlib.sha256(json.dumps(row, sort_keys=True, default=str).encode()).hexdigest()[:20]
+
+
+_TRUE, _FALSE = ("1", "true", "yes", "y", "on"), ("0", "false", "no", "n", "off")
+
+
+def _typed_value(target: str, value):
+    """value converted to the type of DEFAULT_INPUTS[target] (CSV cells are all strings); ValueError if it does not
+    parse. Inputs whose default is None or a string are kept as given."""
+    default = DEFAULT_INPUTS[target]
+    if isinstance(default, bool):
+        if isinstance(value, bool):
+            return value
+        text = str(value).strip().lower()
+        if text in _TRUE or text in _FALSE:
+            return text in _TRUE
+        raise ValueError(f"{target} expects true/false, got {value!r}")
+    if isinstance(default, (int, float)):
+        number_type = type(default)
+        if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            raise ValueError(f"{target} expects {'an integer' if number_type is int else 'a number'}, got {value!r}")
+        try:
+            return number_type(value.strip() if isinstance(value, str) else value)
+        except ValueError:
+            raise ValueError(f"{target} expects {'an integer' if number_type is int else 'a number'}, "
+                             f"got {value!r}") from None
+    return value
+
+
+def batch_run_id(output_path: str, key: str) -> str:
+    """Run ID of a row in this batch: the same on every re-run with this output file, so the row's stored run
+    is found again."""
+    return "batch-" + hashlib.sha256(f"{os.path.abspath(output_path)}\0{key}".encode()).hexdigest()[:24]
+
+
+def row_to_inputs(row: dict, base_inputs: dict, column_map: dict | None = None) -> dict:
+    """Maps a row onto pipeline inputs (see INPUT_COLUMNS); empty cells keep the base / template default.
+
+    Values are converted to the type of the input's default (e.g. "30" -> 30, "yes" -> True); raises ValueError
+    naming the column when one does not parse.
+    """
+    merge_keys = {field["find"] for field in DEFAULT_MERGE_FIELDS} - set(PIPELINE_MERGE_FIELDS)
+    inputs = {**base_inputs, "merge_fields": dict(base_inputs.get("merge_fields") or {})}
+    for column, value in row.items():
+        if value is None or (isinstance(value, str) and not value.strip()):
+            continue
+        target = (column_map or {}).get(column) or INPUT_COLUMNS.get(column.lower()) or column.upper()
+        if target in merge_keys:
+            inputs["merge_fields"][target] = value
+        elif target in DEFAULT_INPUTS and target != "merge_fields":
+            try:
+                inputs[target] = _typed_value(target, value)
+            except ValueError as e:
+                raise ValueError(f"column '{column}': {e}") from None
+    if inputs.get("photo_path") and not inputs.get("photo_name"):
+        inputs["photo_name"] = os.path.basename(inputs["photo_path"])
+    return inputs
+
+
+def load_finished(output_path: str, include_failed: bool = False) -> set:
+    """Keys of rows already recorded in the output file as done (and failed, if include_failed)."""
+    finished = set()
+    if not os.path.exists(output_path):
+        return finished
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by a crash; that row is simply redone
+            if record.get("status") == "done" or (include_failed and record.get("status") == "failed"):
+                finished.add(record.get("row_key"))
+    return finished
+
+
+def result_record(key: str, row_number: int, run) -> dict:
+    snapshot = run.snapshot()
+    outputs = snapshot["outputs"]
+    return {"row_key": key, "row_number": row_number, "status": snapshot["state"], "run_id": snapshot["run_id"],
+            "product_name": run.inputs["merge_fields"].get("PRODUCT_NAME"),
+            "shotstack_video_url": outputs.get("shotstack_video_url"),
+            "heygen_video_url": outputs.get("heygen_video_url"),
+            "narration_audio_url": outputs.get("narration_audio_url"), "avatar_script": outputs.get("avatar_script"),
+            "error": snapshot["error"], "failed_stage": snapshot["stage"] if snapshot["error"] else None,
+            "seconds": round((snapshot["finished_at"] or time.time()) - snapshot["created_at"], 1)}
+
+
+def run_batch(engine: PipelineEngine, rows, output_path: str, base_inputs: dict, column_map: dict | None = None,
+              skip_failed: bool = False, max_in_flight: int = 8, log=print) -> dict:
+    """Submits rows to the engine (at most max_in_flight at a time) and appends one JSON line per finished row.
+
+    Rows are pulled from the iterable only as capacity frees up, so the input is never loaded whole. With a
+    JobStore on the engine, each row's run has a fixed ID (batch_run_id): a run left unfinished by an earlier
+    attempt is adopted at its last stage, and one that finished without being recorded is recorded as it is.
+    """
+    finished_keys = load_finished(output_path, include_failed=skip_failed)
+    counts = {"done": 0, "failed": 0, "skipped": 0, "invalid": 0}
+    completed = queue.Queue()
+    in_flight = {}  # run_id -> (row_key, row_number)
+    seen_keys = set()
+
+    with open(output_path, "a", encoding="utf-8") as out:
+        def record(result: dict):
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            os.fsync(out.fileno())  # a finished row must survive a crash right after it
+
+        def drain(block: bool):
+            """Records finished runs; with block=True waits for at least one."""
+            while in_flight:
+                try:
+                    run = completed.get(block=block)
+                except queue.Empty:
+                    return
+                block = False  # after the first, only collect what has already finished
+                key, row_number = in_flight.pop(run.run_id)
+                result = result_record(key, row_number, run)
+                record(result)
+                counts[result["status"]] = counts.get(result["status"], 0) + 1
+                log(f"row {row_number} [{key}] {result['status']}: "
+                    f"{result['shotstack_video_url'] or result['error']} ({result['seconds']}s)")
+
+        try:
+            for row_number, row in rows:
+                key = row_key(row)
+                if key in finished_keys or key in seen_keys:
+                    counts["skipped"] += 1
+                    continue
+                seen_keys.add(key)
+                try:
+                    inputs = row_to_inputs(row, base_inputs, column_map)
+                except ValueError as e:
+                    problems = [str(e)]
+                else:
+                    problems = engine.validate(inputs)
+                if problems:
+                    record({"row_key": key, "row_number": row_number, "status": "failed",
+                            "error": "; ".join(problems), "failed_stage": "validation"})
+                    counts["invalid"] += 1
+                    log(f"row {row_number} [{key}] invalid: {'; '.join(problems)}")
+                    continue
+                run_id = batch_run_id(output_path, key)
+                stored = engine.store.load(run_id) if engine.store is not None else None
+                if stored is not None and stored["state"] == PipelineRun.DONE:
+                    # Finished before the last attempt stopped, but never made it into the output file.
+                    in_flight[run_id] = (key, row_number)
+                    completed.put(PipelineRun.from_record(stored))
+                    drain(block=False)
+                    continue
+                while len(in_flight) >= max_in_flight:
+                    drain(block=True)
+                run = None
+                if stored is not None and stored["state"] in UNFINISHED_STATES:
+                    run = engine.adopt(stored, on_finished=completed.put)
+                    if run is not None:
+                        log(f"row {row_number} [{key}] resumed after {len(run.stages_done)} finished stage(s)")
+                if run is None:
+                    run = engine.submit(inputs, on_finished=completed.put, run_id=run_id)
+                in_flight[run.run_id] = (key, row_number)
+                drain(block=False)
+        except KeyboardInterrupt:
+            log(f"Interrupted: no new rows will be started; waiting for {len(in_flight)} in-flight row(s) "
+                f"(interrupt again to abandon them; they are resumed at their last stage on the next run).")
+        while in_flight:
+            drain(block=True)
+    return counts
+
+
+def _parse_pairs(values: list[str], option: str) -> dict:
+    pairs = {}
+    for value in values or []:
+        name, sep, target = value.partition("=")
+        if not sep or not name or not target:
+            raise SystemExit(f"{option} expects NAME=VALUE, got '{value}'")
+        pairs[name] = target
+    return pairs
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    cli = argparse.ArgumentParser(description="Render a CSV/JSONL of listings through the video pipeline.")
+    cli.add_argument("input", help="CSV (header row) or JSONL file, one listing per row")
+    cli.add_argument("output", help="JSONL results file; appended to, and used to resume")
+    cli.add_argument("--format", choices=["csv", "jsonl"], help="input format (default: from the file extension)")
+    cli.add_argument("--workers", type=int, default=int(os.getenv("PIPELINE_WORKERS", "4")),
+                     help="listings rendered at the same time")
+    cli.add_argument("--concurrency", action="append", metavar="VENDOR=N",
+                     help="max stages in flight per vendor (gemini, heygen, openai, shotstack); repeatable")
+    cli.add_argument("--map", action="append", metavar="COLUMN=TARGET",
+                     help="map an input column to a merge field or pipeline input; repeatable")
+    cli.add_argument("--narration", action="store_true", help="add OpenAI background narration")
+    cli.add_argument("--dimension", default="720p", help="HeyGen dimension preset")
+    cli.add_argument("--test-mode", action="store_true", help="HeyGen test mode (watermarked, free)")
+    cli.add_argument("--skip-failed", action="store_true", help="do not retry rows recorded as failed")
+    cli.add_argument("--db", help="job database for resuming interrupted rows (default: OUTPUT.runs.sqlite3)")
+    args = cli.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    vendor_concurrency = dict(DEFAULT_VENDOR_CONCURRENCY)
+    vendor_concurrency.update({vendor: int(limit) for vendor, limit in
+                               _parse_pairs(args.concurrency, "--concurrency").items()})
+    base_inputs = {
+        "default_talking_photo_id": os.getenv("DEFAULT_HEYGEN_TALKING_PHOTO_ID", "63da0015b6e24aaab076f8257b3801d7"),
+        "voice_id": os.getenv("DEFAULT_HEYGEN_VOICE_ID", "d7bbcdd6964c47bdaae26decade4a933"),
+        "target_duration_seconds": int(os.getenv("TARGET_VIDEO_DURATION_SECONDS", "25")),
+        "words_per_second": float(os.getenv("WORDS_PER_SECOND_ESTIMATE", "2.5")),
+        "shotstack_template_id": os.getenv("SHOTSTACK_TEMPLATE_ID", "f408d4a6-281b-4e73-a818-04999bce19cc"),
+        "shotstack_owner_id": os.getenv("SHOTSTACK_OWNER_ID", "ttwxkrohlv"),
+        "dimension": args.dimension, "test_mode": args.test_mode, "enable_bg_narration": args.narration,
+    }
+    store = JobStore(args.db or args.output + ".runs.sqlite3").start()
+    engine = build_engine(args.workers, vendor_concurrency, store=store)
+    started = time.time()
+    try:
+        counts = run_batch(engine, read_rows(args.input, args.format), args.output, base_inputs,
+                           column_map=_parse_pairs(args.map, "--map"), skip_failed=args.skip_failed,
+                           max_in_flight=2 * args.workers)
+    except KeyboardInterrupt:
+        print("Abandoning in-flight rows; they will be resumed on the next run.")
+        store.flush()
+        os._exit(130)
+    store.stop()
+    print(f"Batch finished in {time.time() - started:.0f}s: " + ", ".join(f"{n} {k}" for k, n in counts.items()))
+    sys.exit(1 if counts.get("failed") or counts.get("invalid") else 0)
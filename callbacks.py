@@ -0,0 +1,266 @@
+# callbacks.py
+import argparse
+import hashlib
+import hmac
+import json
+import logging
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+import requests
+
+# HeyGen signs webhook bodies with the endpoint secret (HMAC-SHA256, hex) in this header.
+HEYGEN_SIGNATURE_HEADER = "Signature"
+MAX_BODY_BYTES = 1024 * 1024
+
+
+def sign(secret: str, message: bytes) -> str:
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def verify(secret: str, message: bytes, signature: str | None) -> bool:
+    return bool(signature) and hmac.compare_digest(sign(secret, message), signature)
+
+
+def verify_heygen_body(secret: str, body: bytes, headers) -> bool:
+    """HeyGen's webhook body signature: HMAC-SHA256 of the raw body with the endpoint secret."""
+    return verify(secret, body, headers.get(HEYGEN_SIGNATURE_HEADER))
+
+
+def parse_heygen_event(payload: dict) -> tuple[str | None, str | None, object, object]:
+    """HeyGen webhook -> (video_id, outcome, result, error); outcome is "completed", "failed" or None (ignore)."""
+    event_type = payload.get("event_type", "")
+    data = payload.get("event_data") or {}
+    video_id = data.get("video_id")
+    if event_type == "avatar_video.success":
+        return video_id, "completed", data.get("url") or data.get("video_url"), None
+    if event_type == "avatar_video.fail":
+        return video_id, "failed", None, {"message": data.get("msg") or data.get("error") or "HeyGen render failed"}
+    return video_id, None, None, None
+
+
+def parse_shotstack_event(payload: dict) -> tuple[str | None, str | None, object, object]:
+    """Shotstack render callback -> (render_id, outcome, result, error). Shotstack does not sign callback bodies."""
+    render_id = payload.get("id")
+    status = payload.get("status")
+    if payload.get("type", "edit") != "edit":
+        return render_id, None, None, None  # e.g. hosting ("serve") callbacks for the same render
+    if status == "done":
+        return render_id, "completed", payload.get("url"), None
+    if status == "failed":
+        return render_id, "failed", None, {"message": payload.get("error") or "Shotstack render failed"}
+    return render_id, None, None, None
+
+
+class CallbackServer:
+    """Embedded HTTP receiver that resolves job handles when a vendor posts a completion callback.
+
+    Each kind of callback ("heygen", "shotstack") has its own path. Callback URLs handed to vendors carry a reference and an
+    HMAC of it, so forged URLs are rejected; a vendor body signature is checked too, in that vendor's scheme, when
+    the vendor signs its bodies (HeyGen; Shotstack does not) and a secret is configured for it. A job is registered with the ref of the URL it was submitted with, and a callback whose body names a
+    different job than its ref was issued for is rejected, so one callback URL cannot settle another job. Callbacks
+    that arrive before their job is registered are held for early_ttl_seconds and applied on registration only if
+    the job is registered with the same ref.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765, public_url: str | None = None,
+                 secret: str | None = None, vendor_secrets: dict | None = None, early_ttl_seconds: float = 3600,
+                 logger=None):
+        self.host = host
+        self.port = port
+        self.public_url = (public_url or "").rstrip("/") or None
+        self.secret = secret or secrets.token_hex(32)
+        self.vendor_secrets = vendor_secrets or {}
+        self.early_ttl_seconds = early_ttl_seconds
+        self.logger = logger or logging.getLogger(__name__)
+        self.parsers = {"heygen": parse_heygen_event, "shotstack": parse_shotstack_event}
+        self.body_verifiers = {"heygen": verify_heygen_body}
+        for kind in set(self.vendor_secrets) - set(self.body_verifiers):
+            self.logger.warning(f"Ignoring the {kind} vendor secret: {kind} callbacks are not signed.")
+        self._jobs = {}
+        self._early = {}  # (kind, key) -> (received_at, ref, outcome, result, error)
+        self._refs = {}  # (kind, ref) -> key of the job the ref's callback URL was issued for
+        self._lock = threading.Lock()
+        self._server = None
+        self.received = 0
+        self.rejected = 0
+
+    @property
+    def enabled(self) -> bool:
+        """Callbacks are only useful when the vendor can reach us, i.e. a public URL is configured."""
+        return self.public_url is not None and self._server is not None
+
+    def start(self):
+        if self._server is None:
+            server = ThreadingHTTPServer((self.host, self.port), _make_handler(self))
+            server.daemon_threads = True
+            self.port = server.server_address[1]  # resolves port 0
+            threading.Thread(target=server.serve_forever, name="callback-server", daemon=True).start()
+            self._server = server
+            self.logger.info(f"Callback receiver listening on {self.host}:{self.port} (public: {self.public_url})")
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _ref_signature(self, kind: str, ref: str) -> str:
+        return sign(self.secret, f"{kind}/{ref}".encode())
+
+    @staticmethod
+    def new_ref() -> str:
+        return secrets.token_urlsafe(12)
+
+    def url_for(self, kind: str, ref: str | None = None) -> str | None:
+        """Callback URL to give a vendor; ref defaults to a fresh random token (pass the same ref to register())."""
+        if not self.enabled:
+            return None
+        ref = ref or self.new_ref()
+        return f"{self.public_url}/{kind}?{urlencode({'ref': ref, 'sig': self._ref_signature(kind, ref)})}"
+
+    def register(self, kind: str, key: str, job, ref: str | None = None):
+        """Routes the callback for (kind, key) to job.resolve()/job.reject(); applies it now if it already came.
+
+        ref is the one in the callback URL the job was submitted with; only callbacks carrying it can settle the job.
+        Without a ref (e.g. the URL's ref was lost in a restart) the job is left to status polling.
+        """
+        with self._lock:
+            early = self._early.pop((kind, key), None)
+            if early is not None and (not ref or early[1] != ref):
+                self.logger.warning(f"Dropped a {kind} callback for {key} sent to a URL not issued for it.")
+                early = None
+            if early is None:
+                self._jobs[(kind, key)] = job
+                if ref:
+                    self._refs[(kind, ref)] = key
+        if early is not None:
+            self._apply(job, *early[2:])
+
+    def unregister(self, kind: str, key: str):
+        with self._lock:
+            self._jobs.pop((kind, key), None)
+            self._refs = {ref: bound for ref, bound in self._refs.items() if ref[0] != kind or bound != key}
+
+    @staticmethod
+    def _apply(job, outcome: str, result, error):
+        if outcome == "completed":
+            job.resolve(result)
+        else:
+            job.reject(error)
+
+    def handle(self, kind: str, query: str, body: bytes, headers) -> tuple[int, str]:
+        """Processes one callback request; returns (HTTP status, message). Used by the HTTP handler."""
+        parser = self.parsers.get(kind)
+        if parser is None:
+            return 404, "unknown callback"
+        params = parse_qs(query)
+        ref, signature = params.get("ref", [None])[0], params.get("sig", [None])[0]
+        if not ref or not verify(self.secret, f"{kind}/{ref}".encode(), signature):
+            return self._reject(403, "bad callback signature")
+        vendor_secret, verify_body = self.vendor_secrets.get(kind), self.body_verifiers.get(kind)
+        if vendor_secret and verify_body and not verify_body(vendor_secret, body, headers):
+            return self._reject(401, "bad body signature")
+        try:
+            key, outcome, result, error = parser(json.loads(body or b"{}"))
+        except (ValueError, AttributeError) as e:
+            return 400, f"invalid payload: {e}"
+        with self._lock:
+            self.received += 1
+        if not key or outcome is None:
+            return 200, "ignored"
+        now = time.time()
+        with self._lock:
+            bound = self._refs.get((kind, ref))
+            if (bound is not None and bound != key) or (bound is None and (kind, key) in self._jobs):
+                self.rejected += 1
+                return 403, "callback not issued for this job"
+            job = self._jobs.pop((kind, key), None) if bound is not None else None
+            if job is not None:
+                del self._refs[(kind, ref)]
+            elif bound is None:
+                self._early = {k: v for k, v in self._early.items() if now - v[0] < self.early_ttl_seconds}
+                self._early[(kind, key)] = (now, ref, outcome, result, error)
+        if job is not None:
+            self._apply(job, outcome, result, error)
+        self.logger.info(f"{kind} callback for {key}: {outcome}{'' if job else ' (held until registered)'}")
+        return 200, "ok"
+
+    def _reject(self, status: int, message: str) -> tuple[int, str]:
+        with self._lock:
+            self.rejected += 1
+        return status, message
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"waiting": len(self._jobs), "early": len(self._early), "received": self.received,
+                    "rejected": self.rejected}
+
+
+def _make_handler(receiver: CallbackServer):
+    class _Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            parts = urlsplit(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_BODY_BYTES:
+                status, message = 413, "payload too large"
+            else:
+                status, message = receiver.handle(parts.path.strip("/"), parts.query, self.rfile.read(length),
+                                                  self.headers)
+            body = json.dumps({"message": message}).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            receiver.logger.debug("callback %s - " + format, self.address_string(), *args)
+
+    return _Handler
+
+
+# --- Local stand-in sender (offline testing) ---
+def heygen_event(video_id: str, success: bool = True, url: str = None, message: str = None) -> dict:
+    if success:
+        return {"event_type": "avatar_video.success",
+                "event_data": {"video_id": video_id, "url": url or f"https://example.invalid/{video_id}.mp4"}}
+    return {"event_type": "avatar_video.fail", "event_data": {"video_id": video_id, "msg": message or "failed"}}
+
+
+def shotstack_event(render_id: str, success: bool = True, url: str = None, message: str = None) -> dict:
+    if success:
+        return {"type": "edit", "action": "render", "id": render_id, "status": "done",
+                "url": url or f"https://example.invalid/{render_id}.mp4", "error": None}
+    return {"type": "edit", "action": "render", "id": render_id, "status": "failed", "url": None,
+            "error": message or "failed"}
+
+
+STAND_IN_EVENTS = {"heygen": heygen_event, "shotstack": shotstack_event}
+
+
+def send_callback(callback_url: str, payload: dict, vendor_secret: str | None = None, timeout: float = 10):
+    """POSTs a payload to a callback URL the way the vendor would (signing the body if a secret is given)."""
+    body = json.dumps(payload).encode()
+    headers = {"Content-Type": "application/json"}
+    if vendor_secret:
+        headers[HEYGEN_SIGNATURE_HEADER] = sign(vendor_secret, body)
+    return requests.post(callback_url, data=body, headers=headers, timeout=timeout)
+
+
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser(description="Send a stand-in vendor callback to a local receiver.")
+    cli.add_argument("callback_url", help="the callback URL that was registered with the vendor (incl. ref/sig)")
+    cli.add_argument("job_id", help="HeyGen video ID or Shotstack render ID")
+    cli.add_argument("--vendor", choices=sorted(STAND_IN_EVENTS), default="heygen")
+    cli.add_argument("--fail", action="store_true", help="send a failure event instead of success")
+    cli.add_argument("--url", help="video URL to report on success")
+    cli.add_argument("--vendor-secret", help="sign the body like HeyGen does")
+    args = cli.parse_args()
+    event = STAND_IN_EVENTS[args.vendor](args.job_id, not args.fail, url=args.url)
+    response = send_callback(args.callback_url, event, vendor_secret=args.vendor_secret)
+    print(response.status_code, response.text)
@@ -0,0 +1,128 @@
+# clients.py
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import google.generativeai as genai
+import httpx
+from openai import DefaultHttpxClient, OpenAI
+from supabase import create_client, Client
+
+OPENAI_POOL_CONNECTIONS = 20
+OPENAI_MAX_RETRIES = 2
+
+
+class ClientRegistry:
+    """Process-wide vendor clients (OpenAI, Supabase, Gemini models), created on first use and then shared.
+
+    Building a client per call meant a new connection pool, and a new TLS handshake, for every TTS request, upload
+    and script; shared clients keep their connections alive across calls, sessions and pipeline runs. All three
+    SDK clients are safe to use from several threads.
+    """
+
+    def __init__(self, openai_pool_connections: int = OPENAI_POOL_CONNECTIONS,
+                 openai_max_retries: int = OPENAI_MAX_RETRIES):
+        self.openai_pool_connections = openai_pool_connections
+        self.openai_max_retries = openai_max_retries
+        self._clients = {}
+        self._openai_http = {}  # api_key -> the httpx client under that OpenAI client, for prewarm()
+        self._gemini_api_key = None
+        self._lock = threading.RLock()
+        self.created = 0
+        self.reused = 0
+
+    def _get(self, key: tuple, factory):
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = self._clients[key] = factory()
+                self.created += 1
+            else:
+                self.reused += 1
+            return client
+
+    def openai(self, api_key: str) -> OpenAI:
+        def build():
+            http_client = self._openai_http[api_key] = DefaultHttpxClient(limits=httpx.Limits(
+                max_connections=self.openai_pool_connections,
+                max_keepalive_connections=self.openai_pool_connections))
+            return OpenAI(api_key=api_key, max_retries=self.openai_max_retries, http_client=http_client)
+
+        return self._get(("openai", api_key), build)
+
+    def supabase(self, url: str, key: str) -> Client:
+        return self._get(("supabase", url, key), lambda: create_client(url, key))
+
+    def gemini_model(self, api_key: str, model_name: str) -> genai.GenerativeModel:
+        """A GenerativeModel on the shared Gemini channel.
+
+        genai.configure() is global to the process (and rebuilds the gRPC channel), so it only runs when the key
+        changes; models built for a previous key are dropped then.
+        """
+        with self._lock:
+            if api_key != self._gemini_api_key:
+                genai.configure(api_key=api_key)
+                self._gemini_api_key = api_key
+                self._clients = {key: client for key, client in self._clients.items() if key[0] != "gemini"}
+            return self._get(("gemini", model_name), lambda: genai.GenerativeModel(model_name))
+
+    def prewarm(self, openai_api_key: str | None = None, supabase_url: str | None = None,
+                supabase_key: str | None = None, gemini_api_key: str | None = None,
+                gemini_model: str | None = None) -> int:
+        """Builds the clients the given credentials allow and opens a connection on each (in parallel), so the
+        first TTS request, upload and script of a run skip client setup and the TLS handshake. Returns how many
+        were warmed; a failure is logged and leaves that client to connect on first use."""
+        logger = logging.getLogger(__name__)
+        targets = {}
+        if openai_api_key:
+            def warm_openai():
+                client = self.openai(openai_api_key)
+                self._openai_http[openai_api_key].head(str(client.base_url))
+            targets["OpenAI"] = warm_openai
+        if supabase_url and supabase_key:
+            targets["Supabase"] = lambda: self.supabase(supabase_url, supabase_key).storage.list_buckets()
+        if gemini_api_key and gemini_model:
+            def warm_gemini():
+                self.gemini_model(gemini_api_key, gemini_model)
+                next(iter(genai.list_models(page_size=1)), None)
+            targets["Gemini"] = warm_gemini
+        if not targets:
+            return 0
+
+        def _touch(name: str) -> bool:
+            try:
+                targets[name]()
+                return True
+            except Exception as e:  # any SDK / network error; the client still connects on first use
+                logger.warning(f"Pre-warming the {name} client failed: {e}")
+                return False
+
+        with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+            warmed = sum(executor.map(_touch, targets))
+        logger.info(f"Pre-warmed {warmed}/{len(targets)} vendor clients ({', '.join(targets)}).")
+        return warmed
+
+    def close(self):
+        with self._lock:
+            clients, self._clients = list(self._clients.values()), {}
+            self._openai_http = {}
+        for client in clients:
+            if isinstance(client, OpenAI):
+                client.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"clients": len(self._clients), "created": self.created, "reused": self.reused}
+
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+
+def get_client_registry() -> ClientRegistry:
+    """The shared per-process registry used by the pipeline services and the Streamlit apps."""
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = ClientRegistry()
+        return _default_registry
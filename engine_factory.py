@@ -0,0 +1,141 @@
+# engine_factory.py
+# Builds the pipeline engine and everything it calls out to from environment variables. main_app (in-process
+# runs), batch_render and pipeline_worker all build their engine here, so a run behaves the same whichever process
+# executes it. Nothing here imports Streamlit; variables are read when build_engine() is called (after load_dotenv).
+import logging
+import os
+
+from HeyGen import HeyGenAPIClient
+from asset_cache import ImageKeyCache
+from avatar_cache import AvatarCache
+from callbacks import CallbackServer
+from heygen_cleanup import CleanupService
+from image_prep import DEFAULT_JPEG_QUALITY, ImagePreprocessor
+from media_preflight import MediaPreflight
+from pipeline import DEFAULT_INPUTS, DEFAULT_MERGE_FIELDS, PipelineEngine
+from script_cache import ScriptCache
+from services import PipelineServices
+from shotstack_client import DEFAULT_RENDER_ENDPOINT, DEFAULT_STATUS_ENDPOINT_TEMPLATE, ShotstackClient
+
+_logger = logging.getLogger(__name__)
+
+
+def _flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+def _int(name: str, default) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+def build_callback_server() -> CallbackServer | None:
+    """The completion-callback receiver, started; None (poll only) without CALLBACK_PUBLIC_URL or if the port is
+    taken (e.g. by another worker process on this host)."""
+    # Set CALLBACK_PUBLIC_URL to a URL that reaches CALLBACK_LISTEN_HOST:CALLBACK_LISTEN_PORT (e.g. a tunnel).
+    public_url = os.getenv("CALLBACK_PUBLIC_URL")
+    if not public_url:
+        return None
+    host, port = os.getenv("CALLBACK_LISTEN_HOST", "0.0.0.0"), _int("CALLBACK_LISTEN_PORT", 8765)
+    webhook_secret = os.getenv("HEYGEN_WEBHOOK_SECRET")  # HeyGen endpoint secret, verifies body signatures
+    # CALLBACK_SECRET signs callback URLs; random per process if unset, in which case callbacks for jobs submitted
+    # before a restart are rejected and resumed runs fall back to polling.
+    server = CallbackServer(host=host, port=port, public_url=public_url, secret=os.getenv("CALLBACK_SECRET"),
+                            vendor_secrets={"heygen": webhook_secret} if webhook_secret else None)
+    try:
+        return server.start()
+    except OSError as e:
+        _logger.warning(f"Callback receiver could not listen on {host}:{port} ({e}); jobs are tracked by polling.")
+        return None
+
+
+def _heygen_client(prewarm: bool) -> HeyGenAPIClient | None:
+    heygen_api_key = os.getenv("HEYGEN_API_KEY")
+    if not heygen_api_key:
+        _logger.warning("HEYGEN_API_KEY not found. HeyGen features will not work.")
+        return None
+    return HeyGenAPIClient(api_key=heygen_api_key,
+                           pool_sizes={"https://api.heygen.com": _int("HEYGEN_API_POOL_SIZE", 20),
+                                       "https://upload.heygen.com": _int("HEYGEN_UPLOAD_POOL_SIZE", 10)},
+                           prewarm=prewarm)
+
+
+def _shotstack_client() -> ShotstackClient | None:
+    shotstack_api_key = os.getenv("SHOTSTACK_API_KEY")
+    return ShotstackClient(
+        shotstack_api_key, render_endpoint=os.getenv("SHOTSTACK_API_ENDPOINT", DEFAULT_RENDER_ENDPOINT),
+        status_endpoint_template=os.getenv("SHOTSTACK_STATUS_ENDPOINT_TEMPLATE",
+                                           DEFAULT_STATUS_ENDPOINT_TEMPLATE)) if shotstack_api_key else None
+
+
+def build_services(callbacks=None) -> PipelineServices:
+    heygen_client = _heygen_client(prewarm=True)
+    avatar_cache = AvatarCache(idle_ttl_seconds=_int("AVATAR_CACHE_IDLE_TTL_SECONDS", 7 * 24 * 3600))
+    # Background deleter/sweeper: TempGroup_* groups older than HEYGEN_TEMP_GROUP_MAX_AGE_SECONDS (leaked by
+    # failed/abandoned runs) are deleted, and idle cached avatars are evicted.
+    cleanup_service = CleanupService(
+        heygen_client, avatar_cache=avatar_cache,
+        sweep_interval_seconds=_int("HEYGEN_SWEEP_INTERVAL_SECONDS", 3600),
+        temp_group_max_age_seconds=_int("HEYGEN_TEMP_GROUP_MAX_AGE_SECONDS", 6 * 3600)).start() \
+        if heygen_client else None
+    # Image / logo merge-field URLs are probed before a run spends anything; results are reused for this long.
+    media_preflight = MediaPreflight(ttl_seconds=_int("MEDIA_PREFLIGHT_TTL_SECONDS", 3600)) \
+        if _flag("MEDIA_PREFLIGHT", "true") else None
+    services = PipelineServices(
+        heygen_client=heygen_client, shotstack_client=_shotstack_client(),
+        gemini_api_key=os.getenv("GEMINI_API_KEY"), openai_api_key=os.getenv("OPENAI_API_KEY"),
+        supabase_url=os.getenv("SUPABASE_URL"), supabase_key=os.getenv("SUPABASE_SERVICE_KEY"),
+        supabase_bucket=os.getenv("SUPABASE_BUCKET_NAME", "videobgm"),
+        image_key_cache=ImageKeyCache(ttl_seconds=_int("IMAGE_KEY_CACHE_TTL_SECONDS", 30 * 24 * 3600),
+                                      max_entries=_int("IMAGE_KEY_CACHE_MAX_ENTRIES", 5000)),
+        avatar_cache=avatar_cache,
+        # Avatar photos are re-encoded before upload: oriented, cropped to the video frame, downscaled and
+        # metadata-free. IMAGE_PREP_WORKERS=0 means one worker process per CPU core.
+        image_preprocessor=ImagePreprocessor(quality=_int("AVATAR_PHOTO_JPEG_QUALITY", DEFAULT_JPEG_QUALITY),
+                                             max_workers=_int("IMAGE_PREP_WORKERS", 0) or None),
+        crop_avatar_photo_to_frame=_flag("AVATAR_PHOTO_CROP_TO_FRAME", "true"),
+        cleanup_service=cleanup_service, callbacks=callbacks,
+        look_timeout_seconds=_int("HEYGEN_LOOK_TIMEOUT_SECONDS", 120),
+        script_cache=ScriptCache(ttl_seconds=_int("GEMINI_SCRIPT_CACHE_TTL_SECONDS", 30 * 24 * 3600)),
+        # Narration audio is streamed from OpenAI TTS straight into the Supabase upload; NARRATION_STREAM_UPLOAD=false
+        # writes each narration to its own scratch folder (under NARRATION_SCRATCH_DIR) and uploads the file instead.
+        # Scripts of NARRATION_CHUNK_MIN_CHARS or more (0 = never) are synthesized as sentence-aligned pieces in
+        # parallel and joined.
+        narration_stream_upload=_flag("NARRATION_STREAM_UPLOAD", "true"),
+        narration_scratch_dir=os.getenv("NARRATION_SCRATCH_DIR") or None,
+        narration_chunk_min_chars=_int("NARRATION_CHUNK_MIN_CHARS", 900),
+        narration_tts_concurrency=_int("NARRATION_TTS_CONCURRENCY", 4),
+        media_preflight=media_preflight,
+        # Listing images (downscaled to the template's output size) and the HeyGen avatar video are copied into the
+        # bucket under content-hash names before rendering, so Shotstack never waits on (or finds expired) links.
+        media_mirroring=_flag("MEDIA_MIRROR", "true"),
+        media_scratch_dir=os.getenv("MEDIA_SCRATCH_DIR") or None)
+    # Like the HeyGen client above: connections are opened now rather than by the first run.
+    services.clients.prewarm(openai_api_key=services.openai_api_key, supabase_url=services.supabase_url,
+                             supabase_key=services.supabase_key, gemini_api_key=services.gemini_api_key,
+                             gemini_model=DEFAULT_INPUTS["gemini_model"])
+    return services
+
+
+def build_engine(workers: int | None = None, vendor_concurrency: dict | None = None, store=None,
+                 queue=None) -> PipelineEngine:
+    """PipelineEngine over build_services() and build_callback_server(); workers defaults to PIPELINE_WORKERS."""
+    services = build_services(callbacks=build_callback_server())
+    return PipelineEngine(services, DEFAULT_MERGE_FIELDS, max_workers=workers or _int("PIPELINE_WORKERS", 4),
+                          heygen_video_timeout_seconds=_int("HEYGEN_VIDEO_TIMEOUT_SECONDS", 3600),
+                          shotstack_render_timeout_seconds=_int("SHOTSTACK_RENDER_TIMEOUT_SECONDS", 1800),
+                          retention_seconds=_int("PIPELINE_RUN_RETENTION_SECONDS", 24 * 3600),
+                          vendor_concurrency=vendor_concurrency, store=store, queue=queue)
+
+
+def build_queue_view(store, queue) -> PipelineEngine:
+    """PipelineEngine that only enqueues runs for pipeline_worker processes and reads them back from the store.
+
+    Its services carry what validate() checks (API keys, unconnected clients) and nothing else: no callback
+    receiver, cleanup sweeper, image workers or connection prewarming, which the workers run instead.
+    """
+    services = PipelineServices(heygen_client=_heygen_client(prewarm=False), shotstack_client=_shotstack_client(),
+                                gemini_api_key=os.getenv("GEMINI_API_KEY"), openai_api_key=os.getenv("OPENAI_API_KEY"),
+                                supabase_url=os.getenv("SUPABASE_URL"), supabase_key=os.getenv("SUPABASE_SERVICE_KEY"),
+                                supabase_bucket=os.getenv("SUPABASE_BUCKET_NAME", "videobgm"))
+    return PipelineEngine(services, DEFAULT_MERGE_FIELDS, max_workers=1,
+                          retention_seconds=_int("PIPELINE_RUN_RETENTION_SECONDS", 24 * 3600), store=store, queue=queue)
@@ -0,0 +1,163 @@
+# heygen_async.py
+import asyncio
+
+import httpx
+
+from HeyGen import _ApiCall, _HeyGenClientBase
+from rate_limit import RateLimiter
+from upload_streams import DEFAULT_CHUNK_SIZE, AssetStream
+
+
+class _AsyncBody:
+    """Async-iterable view of an AssetStream (what httpx.AsyncClient streams), rewindable for 429 resends.
+
+    Chunks are read on a worker thread: a file read or a page fault in a memory-mapped file would otherwise stall
+    the event loop, and every other request on it, for the duration of the disk access.
+    """
+
+    def __init__(self, stream: AssetStream):
+        self._stream = stream
+
+    async def __aiter__(self):
+        while True:
+            chunk = await asyncio.to_thread(self._stream.read, self._stream.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def rewind(self) -> bool:
+        return self._stream.rewind()
+
+
+class AsyncHeyGenAPIClient(_HeyGenClientBase):
+    """asyncio counterpart of HeyGenAPIClient.
+
+    Every public method mirrors the blocking client one-for-one and shares its call builders, so payloads and
+    response parsing are identical; only the transport (a pooled httpx.AsyncClient) differs.
+    """
+    DEFAULT_TIMEOUT_SECONDS = 60
+
+    def __init__(self, api_key: str, logger=None, max_connections: int = 100, max_keepalive_connections: int = 20,
+                 timeout: float | None = DEFAULT_TIMEOUT_SECONDS, http2: bool = False,
+                 rate_limiter: RateLimiter | None = None):
+        super().__init__(api_key, logger, rate_limiter)
+        self._client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_keepalive_connections),
+            timeout=timeout, http2=http2)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        return await self._client.request(method, url, **kwargs)
+
+    async def _execute(self, call: _ApiCall):
+        if call.is_resolved:
+            return call.result
+        endpoint_class = self._endpoint_class(call)
+        attempt = 0
+        while True:
+            await self.rate_limiter.acquire_async(self.RATE_LIMIT_VENDOR, self.api_key, endpoint_class)
+            try:
+                response = await self._request(call.method, call.url, headers=call.headers, json=call.json_body,
+                                               content=call.body)
+            except httpx.HTTPError as e:
+                return call.on_error(str(e) or type(e).__name__, None)
+            if not self._should_resend(call, response, attempt):
+                return self._interpret_response(call, response)
+            attempt += 1
+
+    async def upload_asset_from_bytes_get_image_key(self, file_bytes: bytes, file_name: str) -> str | None:
+        return await self._execute(self._upload_asset_call(file_bytes, file_name))
+
+    async def upload_asset_stream(self, source, file_name: str = None,
+                                  chunk_size: int = DEFAULT_CHUNK_SIZE) -> str | None:
+        """Streams an image asset from a path (memory-mapped), file object, memoryview or iterable of chunks."""
+        with AssetStream(source, chunk_size) as stream:
+            call = self._upload_asset_call(_AsyncBody(stream), file_name or stream.name or "")
+            if stream.length is not None and not call.is_resolved:
+                call.headers["Content-Length"] = str(stream.length)  # otherwise httpx sends it chunked
+            return await self._execute(call)
+
+    async def create_photo_avatar_group(self, name: str, image_key: str) -> str | None:
+        group_id = await self._execute(self._create_photo_avatar_group_call(name, image_key))
+        if group_id:
+            self.group_list_cache.invalidate()
+        return group_id
+
+    async def list_avatar_group_looks(self, group_id: str) -> list[dict] | None:
+        return await self._execute(self._list_avatar_group_looks_call(group_id))
+
+    async def delete_photo_avatar_group(self, group_id: str) -> bool:
+        """Deletes a Photo Avatar Group using DELETE with group_id in path."""
+        deleted = await self._execute(self._delete_photo_avatar_group_call(group_id))
+        if deleted:
+            self.group_list_cache.invalidate()
+        return deleted
+
+    async def delete_talking_photo(self, talking_photo_id: str) -> bool:
+        return await self._execute(self._delete_talking_photo_call(talking_photo_id))
+
+    async def generate_video_with_photo_or_avatar(self, text_script: str, voice_id: str, title: str, test_mode: bool,
+                                                  add_caption: bool, dimension_preset: str,
+                                                  talking_photo_id: str = None,
+                                                  avatar_id: str = None, callback_url: str = None) -> str | None:
+        return await self._execute(self._generate_video_call(text_script, voice_id, title, test_mode, add_caption,
+                                                             dimension_preset, talking_photo_id=talking_photo_id,
+                                                             avatar_id=avatar_id, callback_url=callback_url))
+
+    async def check_video_status(self, video_id: str) -> tuple[str | None, str | None, dict | None]:
+        return await self._execute(self._check_video_status_call(video_id))
+
+    async def _iter_group_pages(self, page_size: int):
+        cursor = self._new_group_cursor()
+        while not cursor["done"]:
+            result = await self._execute(self._list_avatar_groups_call(cursor["page"], page_size, cursor["token"]))
+            if result is None:
+                yield None  # the listing is incomplete
+                return
+            groups = self._advance_group_cursor(cursor, result, page_size)
+            if groups:
+                yield groups
+
+    async def iter_avatar_groups(self, page_size: int = _HeyGenClientBase.GROUP_LIST_PAGE_SIZE):
+        """Async generator over avatar groups, fetching one page at a time."""
+        async for groups in self._iter_group_pages(page_size):
+            if groups is None:
+                return
+            for group in groups:
+                yield group
+
+    async def list_avatar_groups(self) -> list[dict]:
+        return [group async for group in self.iter_avatar_groups()]
+
+    async def cached_avatar_groups(self, max_age: float | None = None) -> list[dict]:
+        groups = self.group_list_cache.get(max_age)
+        if groups is not None:
+            return groups
+        groups = []
+        async for page in self._iter_group_pages(self.GROUP_LIST_PAGE_SIZE):
+            if page is None:
+                return groups
+            groups.extend(page)
+        self.group_list_cache.set(groups)
+        return groups
+
+    async def find_avatar_group(self, name: str) -> dict | None:
+        async for group in self.iter_avatar_groups():
+            if group.get("name") == name:
+                return group
+        return None
+
+    async def train_photo_avatar_group(self, group_id: str) -> str | None:
+        return await self._execute(self._train_photo_avatar_group_call(group_id))
+
+    async def check_photo_avatar_group_training_status(self, training_id: str) -> tuple[str | None, dict | None]:
+        return await self._execute(self._check_training_status_call(training_id))
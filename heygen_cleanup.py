@@ -0,0 +1,170 @@
+# heygen_cleanup.py
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asset_cache import ImageKeyCache
+from jobs import Backoff
+
+TEMP_GROUP_PREFIX = "TempGroup_"
+# Legacy per-run groups were named TempGroup_<label>_<unix time>; used when the API omits created_at.
+_NAME_TIMESTAMP = re.compile(r"_(\d{10})$")
+
+
+def group_created_at(group: dict) -> float | None:
+    """Creation time (unix seconds) of an avatar group list entry, from created_at or the name's timestamp suffix."""
+    created_at = group.get("created_at")
+    if isinstance(created_at, (int, float)) or (isinstance(created_at, str) and created_at.isdigit()):
+        created_at = float(created_at)
+        return created_at / 1000 if created_at > 1e12 else created_at  # tolerate millisecond timestamps
+    match = _NAME_TIMESTAMP.search(group.get("name") or "")
+    return float(match.group(1)) if match else None
+
+
+class CleanupService:
+    """Deletes HeyGen groups / talking photos off the request path and sweeps orphaned temp groups.
+
+    Deletions are queued (deduplicated) and run concurrently on a small thread pool with backoff retries. A
+    daemon thread periodically lists avatar groups and queues every TempGroup_* group older than
+    temp_group_max_age_seconds, so groups leaked by failed or abandoned runs are eventually removed, and (if an
+    AvatarCache is attached) evicts cached avatars that have gone idle.
+    """
+
+    def __init__(self, client, avatar_cache=None, max_workers: int = 4, sweep_interval_seconds: float = 3600,
+                 temp_group_max_age_seconds: float = 6 * 3600, temp_group_prefix: str = TEMP_GROUP_PREFIX,
+                 max_attempts: int = 3, logger=None):
+        self.client = client
+        self.avatar_cache = avatar_cache
+        self.sweep_interval_seconds = sweep_interval_seconds
+        self.temp_group_max_age_seconds = temp_group_max_age_seconds
+        self.temp_group_prefix = temp_group_prefix
+        self.max_attempts = max_attempts
+        self.logger = logger or logging.getLogger(__name__)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="heygen-cleanup")
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sweeper = None
+        self.deleted = 0
+        self.failed = 0
+        self.sweeps = 0
+
+    def start(self):
+        """Starts the periodic sweeper (the first sweep runs immediately). Safe to call more than once."""
+        with self._lock:
+            if self._sweeper is None or not self._sweeper.is_alive():
+                self._stop.clear()
+                self._sweeper = threading.Thread(target=self._sweep_loop, name="heygen-sweeper", daemon=True)
+                self._sweeper.start()
+        return self
+
+    def stop(self, wait: bool = True):
+        """Stops the sweeper and the deleters; deletions requested afterwards are logged and dropped."""
+        self._stop.set()
+        if wait and self._sweeper is not None:
+            self._sweeper.join()
+        self._executor.shutdown(wait=wait)
+
+    def _sweep_loop(self):
+        while not self._stop.is_set():
+            try:
+                self.sweep()
+            except Exception as e:  # never let one bad sweep kill the thread
+                self.logger.error(f"HeyGen cleanup sweep failed: {e}")
+            self._stop.wait(self.sweep_interval_seconds)
+
+    def _submit(self, kind: str, object_id: str, delete, on_deleted=None) -> bool:
+        if not object_id:
+            return False
+        if self._stop.is_set():
+            self.logger.info(f"Cleanup service stopped; dropped the deletion of HeyGen {kind} {object_id}.")
+            return False
+        key = (kind, object_id)
+        with self._lock:
+            if key in self._pending:
+                return False
+            self._pending.add(key)
+        try:
+            self._executor.submit(self._run_delete, key, delete, on_deleted)
+        except RuntimeError:  # stop() shut the pool down since the check above
+            with self._lock:
+                self._pending.discard(key)
+            self.logger.info(f"Cleanup service stopped; dropped the deletion of HeyGen {kind} {object_id}.")
+            return False
+        return True
+
+    def _run_delete(self, key: tuple[str, str], delete, on_deleted):
+        kind, object_id = key
+        backoff = Backoff(initial=2.0, max_delay=30.0)
+        try:
+            for attempt in range(1, self.max_attempts + 1):
+                if delete(object_id):
+                    with self._lock:
+                        self.deleted += 1
+                    if on_deleted:
+                        on_deleted()
+                    return
+                if attempt < self.max_attempts and self._stop.wait(backoff.next_delay()):
+                    break  # shutting down
+            with self._lock:
+                self.failed += 1
+            self.logger.warning(f"Giving up deleting HeyGen {kind} {object_id} after {self.max_attempts} attempts.")
+        except Exception as e:
+            self.logger.error(f"Deleting HeyGen {kind} {object_id} raised: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def delete_group(self, group_id: str, on_deleted=None) -> bool:
+        """Queues a photo avatar group deletion; returns False if it is already queued."""
+        return self._submit("group", group_id, lambda gid: self.client.delete_photo_avatar_group(group_id=gid),
+                            on_deleted)
+
+    def delete_talking_photo(self, talking_photo_id: str, on_deleted=None) -> bool:
+        return self._submit("talking_photo", talking_photo_id,
+                            lambda tpid: self.client.delete_talking_photo(talking_photo_id=tpid), on_deleted)
+
+    def request_eviction(self) -> int:
+        """Queues deletion of every idle cached avatar group; returns how many were queued."""
+        if self.avatar_cache is None:
+            return 0
+        if self._stop.is_set():  # claimed entries would then never be deleted
+            self.logger.info("Cleanup service stopped; skipping avatar eviction.")
+            return 0
+        account = ImageKeyCache.account_of(self.client)
+        queued = 0
+        for entry in self.avatar_cache.idle_entries(account):
+            # Claim first so the entry cannot be leased again while its group is being deleted.
+            if self.avatar_cache.claim_idle(account, entry["sha256"]):
+                queued += self.delete_group(entry["group_id"])
+        return queued
+
+    def stale_temp_groups(self, now: float | None = None) -> list[dict]:
+        now = now or time.time()
+        stale = []
+        for group in self.client.iter_avatar_groups():
+            if not (group.get("name") or "").startswith(self.temp_group_prefix):
+                continue
+            created_at = group_created_at(group)
+            if created_at is not None and now - created_at >= self.temp_group_max_age_seconds:
+                stale.append(group)
+        return stale
+
+    def sweep(self) -> list[str]:
+        """One sweep: queues stale temp groups and idle cached avatars; returns the temp group IDs queued."""
+        queued = [group.get("id") or group.get("group_id") for group in self.stale_temp_groups()]
+        queued = [group_id for group_id in queued if self.delete_group(group_id)]
+        evicted = self.request_eviction()
+        with self._lock:
+            self.sweeps += 1
+        if queued or evicted:
+            self.logger.info(f"HeyGen sweep queued {len(queued)} stale {self.temp_group_prefix}* group(s) "
+                             f"and {evicted} idle cached avatar group(s).")
+        return queued
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"pending": len(self._pending), "deleted": self.deleted, "failed": self.failed,
+                    "sweeps": self.sweeps}
@@ -0,0 +1,60 @@
+# heygen_jobs.py
+# HeyGen operations tracked by polling (see jobs.PolledJob).
+from jobs import PolledJob
+
+
+class VideoJob(PolledJob):
+    """Tracks /video_status.get; result is the finished video URL."""
+    kind = "video"
+
+    def _fetch(self):
+        status, url, error = self.client.check_video_status(self.job_id)
+        self.last_status = status
+        if status == "completed":
+            return self.COMPLETED, url, None
+        if status == "failed":
+            return self.FAILED, None, error
+        if status == "error" or status is None:
+            return self.TRANSIENT, None, error
+        return self.PENDING, None, None
+
+
+class LookJob(PolledJob):
+    """Tracks look processing for a photo avatar group; result is the first ready look (talking photo) ID."""
+    kind = "look"
+    IN_PROGRESS_STATUSES = ("PENDING", "TRAINING", "PROCESSING", "UNKNOWN")
+
+    def __init__(self, client, group_id: str, ready_status: str = "COMPLETED", **kwargs):
+        super().__init__(client, group_id, **kwargs)
+        self.ready_status = ready_status
+
+    def _fetch(self):
+        looks = self.client.list_avatar_group_looks(group_id=self.job_id)
+        if looks is None:
+            return self.TRANSIENT, None, {"message": "Failed to list group looks"}
+        if not looks:
+            self.last_status = "NO_LOOKS"
+            return self.PENDING, None, None
+        look_id = looks[0].get("id")
+        self.last_status = looks[0].get("status", "unknown").upper()
+        if look_id and self.last_status == self.ready_status:
+            return self.COMPLETED, look_id, None
+        if look_id and self.last_status not in self.IN_PROGRESS_STATUSES:
+            return self.FAILED, None, {"message": f"Look {look_id} finished with status '{self.last_status}'"}
+        return self.PENDING, None, None
+
+
+class TrainingJob(PolledJob):
+    """Tracks photo avatar group training; result is the final training status."""
+    kind = "training"
+
+    def _fetch(self):
+        status, error = self.client.check_photo_avatar_group_training_status(self.job_id)
+        self.last_status = status
+        if status == "Ready":
+            return self.COMPLETED, status, None
+        if status in ("Pending", "Training"):
+            return self.PENDING, None, None
+        if status == "error":  # the status call itself failed
+            return self.TRANSIENT, None, error
+        return self.FAILED, None, error or {"message": f"Unexpected training status '{status}'"}
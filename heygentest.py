@@ -3,10 +3,12 @@ import requests
 import time
 import json
 import os
-import tempfile
 import uuid
 import mimetypes
 
+from HeyGen import HeyGenAPIClient
+from upload_streams import AssetStream, MultipartStream
+
 
 # --- HeyGen API Functions ---
 def get_api_urls(api_version="v2"):
@@ -38,12 +40,14 @@ def log_message(message, level="info"):
 
 
 # --- Upload Asset Function (Corrected based on JSON structure) ---
-def upload_asset_get_image_key(api_key, file_path, uploaded_file_name="uploaded_file.jpg"):
-    if not os.path.exists(file_path):
-        log_message(f"Error: Upload file not found: {file_path}", "error")
-        st.error(f"Upload file error: Path {file_path} does not exist.")
+def upload_asset_get_image_key(api_key, file_source, uploaded_file_name="uploaded_file.jpg"):
+    """file_source may be a path, an uploaded file object or a bytes-like buffer; it is streamed, not copied."""
+    is_path = isinstance(file_source, (str, os.PathLike))
+    if is_path and not os.path.exists(file_source):
+        log_message(f"Error: Upload file not found: {file_source}", "error")
+        st.error(f"Upload file error: Path {file_source} does not exist.")
         return None
-    content_type, _ = mimetypes.guess_type(file_path)
+    content_type, _ = mimetypes.guess_type(file_source if is_path else uploaded_file_name)
     if not content_type or not content_type.startswith("image/"):
         ext = os.path.splitext(uploaded_file_name)[1].lower()
         if ext in [".jpg", ".jpeg"]:
@@ -58,8 +62,8 @@ def upload_asset_get_image_key(api_key, file_path, uploaded_file_name="uploaded_
     url = "https://upload.heygen.com/v1/asset"
     api_headers = get_headers(api_key, content_type=content_type)
     try:
-        with open(file_path, "rb") as file_data:
-            response = requests.post(url, headers=api_headers, data=file_data)
+        with AssetStream(file_source) as file_data:
+            response = requests.post(url, headers=api_headers, data=file_data.request_body())
         log_message(f"Asset upload response status code: {response.status_code}")
         res_json = {}
         try:
@@ -155,16 +159,21 @@ def upload_photo_avatar(api_key, image_path, avatar_name="My Custom Avatar"):
         if 'photo' in files and files['photo'][1] and not files['photo'][1].closed: files['photo'][1].close()
 
 
-def clone_voice_from_sample(api_key, audio_path, voice_name="My Cloned Voice"):
-    if not os.path.exists(audio_path): log_message(f"Error: Voice sample file not found: {audio_path}", "error"); return None
+def clone_voice_from_sample(api_key, audio_source, voice_name="My Cloned Voice", audio_file_name=None):
+    """audio_source may be a path, file object or bytes-like buffer; the multipart body is streamed in chunks."""
+    is_path = isinstance(audio_source, (str, os.PathLike))
+    if is_path and not os.path.exists(audio_source): log_message(f"Error: Voice sample file not found: {audio_source}", "error"); return None
     url = f"{get_api_urls('v1')}/voice";
     log_message(f"Uploading audio to clone voice: {voice_name}")
-    ct, _ = mimetypes.guess_type(audio_path);
+    audio_file_name = audio_file_name or (os.path.basename(audio_source) if is_path else "voice_sample.mp3")
+    ct, _ = mimetypes.guess_type(audio_file_name);
     if not ct or not ct.startswith("audio/"): ct = "audio/mpeg"
-    files = {'files': (os.path.basename(audio_path), open(audio_path, 'rb'), ct)};
-    data = {'name': voice_name}
+    audio_stream = AssetStream(audio_source)
+    body = MultipartStream({'name': voice_name}, 'files', audio_file_name, ct, audio_stream)
+    headers = get_headers(api_key, content_type=None)
+    headers["Content-Type"] = body.content_type
     try:
-        response = requests.post(url, headers=get_headers(api_key, content_type=None), files=files, data=data)
+        response = requests.post(url, headers=headers, data=body.request_body())
         response.raise_for_status();
         res_json = response.json()
         if res_json.get("data", {}).get("voice_id"):
@@ -176,7 +185,7 @@ def clone_voice_from_sample(api_key, audio_path, voice_name="My Cloned Voice"):
     except Exception as e:
         log_message(f"Cloning voice failed: {e}", "error"); return None
     finally:
-        if 'files' in files and files['files'][1] and not files['files'][1].closed: files['files'][1].close()
+        audio_stream.close()
 
 
 # --- Video Generation (using Talking Photo or Standard Avatar) ---
@@ -239,6 +248,11 @@ def check_heygen_video_status(api_key, video_id):
         log_message(f"Failed to check video status (ID: {video_id}): {e}", "error"); return "error", None, {"message": str(e)}
 
 
+@st.cache_resource
+def get_heygen_client(api_key):
+    return HeyGenAPIClient(api_key=api_key)
+
+
 # --- Photo Avatar Group Management Functions ---
 def create_photo_avatar_group(api_key, name, key):
     url = f"{get_api_urls('v2')}/photo_avatar/avatar_group/create";
@@ -250,6 +264,7 @@ def create_photo_avatar_group(api_key, name, key):
         data = response.json()
         if data.get("data", {}).get("group_id"):
             log_message(f"Group '{name}' created successfully, ID: {data['data']['group_id']}", "success");
+            get_heygen_client(api_key).group_list_cache.invalidate()
             return data['data']['group_id']
         else:
             log_message(f"Error creating group: {data.get('error', {}).get('message', 'Unknown')}. Details:{data}",
@@ -312,24 +327,18 @@ def check_photo_avatar_group_training_status(api_key, training_id):
         log_message(f"Failed to check group training status API (ID:{training_id}):{e}", "error"); return "error", {"message": str(e)}
 
 
-def list_avatar_groups(api_key):
-    url = f"{get_api_urls('v2')}/avatar_group.list";
-    log_message(f"Requesting avatar group list...");
-    try:
-        response = requests.get(url, headers=get_headers(api_key, "accept_json"))
-        response.raise_for_status();
-        data = response.json()
-        groups = data.get("data", {}).get("list", [])
-        if not groups and isinstance(data.get("data"), list): groups = data.get("data")
-        if groups is not None:
-            log_message(f"Successfully fetched {len(groups)} avatar groups", "success")
-        elif data.get("error"):
-            log_message(f"Error fetching group list API: {data.get('error', {}).get('message', 'Unknown')}", "error")
-        else:
-            log_message("Unknown response format for group list", "info")
-        return groups if groups is not None else []
-    except Exception as e:
-        log_message(f"Fetch group list API failed: {e}", "error"); return []
+def list_avatar_groups(api_key, refresh=False):
+    """Avatar groups from the client's shared TTL cache, so reruns do not re-list the whole account."""
+    client = get_heygen_client(api_key)
+    if refresh: client.group_list_cache.invalidate()
+    groups = client.cached_avatar_groups()
+    log_message(f"Avatar groups available: {len(groups)}")
+    return groups
+
+
+def iter_avatar_groups(api_key, page_size=100):
+    """Lazily pages through avatar groups (uncached); stop iterating to avoid fetching the remaining pages."""
+    return get_heygen_client(api_key).iter_avatar_groups(page_size=page_size)
 
 
 def list_avatar_group_looks(api_key, group_id):
@@ -455,15 +464,11 @@ if operation_type_main_ui_app == "Manage Photo Avatar Groups":
             if uploaded_initial_img_grp_main_ui_val:
                 if st.button("Upload and Get Key (Initial Image)", key="ui_grp_upload_initial_btn_key_v2",
                              disabled=is_processing_main_ui_app):
-                    with tempfile.NamedTemporaryFile(delete=False,
-                                                     suffix=os.path.splitext(uploaded_initial_img_grp_main_ui_val.name)[
-                                                         1]) as tmp_f:
-                        tmp_f.write(uploaded_initial_img_grp_main_ui_val.getvalue());
-                        temp_f_path = tmp_f.name
-                    actual_key = upload_asset_get_image_key(st.session_state.api_key, temp_f_path,
+                    uploaded_initial_img_grp_main_ui_val.seek(0)
+                    actual_key = upload_asset_get_image_key(st.session_state.api_key,
+                                                            uploaded_initial_img_grp_main_ui_val,
                                                             uploaded_initial_img_grp_main_ui_val.name)
                     st.session_state.temp_initial_image_key_group_ui = actual_key if actual_key else None
-                    os.unlink(temp_f_path)
             retrieved_key_create = st.session_state.get("temp_initial_image_key_group_ui")
             if retrieved_key_create: initial_image_key_for_creation_val_ui = retrieved_key_create
 
@@ -514,13 +519,9 @@ if operation_type_main_ui_app == "Manage Photo Avatar Groups":
                          disabled=is_processing_main_ui_app):
                 st.session_state.temp_look_image_keys_group_ui = []
                 for uploaded_file in uploaded_looks_add_grp_main_ui_val:
-                    with tempfile.NamedTemporaryFile(delete=False,
-                                                     suffix=os.path.splitext(uploaded_file.name)[1]) as tmp_f:
-                        tmp_f.write(uploaded_file.getvalue());
-                        temp_f_path = tmp_f.name
-                    actual_key = upload_asset_get_image_key(st.session_state.api_key, temp_f_path, uploaded_file.name)
+                    uploaded_file.seek(0)
+                    actual_key = upload_asset_get_image_key(st.session_state.api_key, uploaded_file, uploaded_file.name)
                     if actual_key: st.session_state.temp_look_image_keys_group_ui.append(actual_key)
-                    os.unlink(temp_f_path)
         current_temp_keys_add_looks_val = st.session_state.get("temp_look_image_keys_group_ui", [])
         final_keys_to_add_val = [key.strip() for key in st.session_state.ui_grp_addlooks_keys_text.splitlines() if
                                  key.strip()]
@@ -556,6 +557,21 @@ if operation_type_main_ui_app == "Manage Photo Avatar Groups":
 
 elif operation_type_main_ui_app == "Generate Video (using a Look from a Photo Avatar Group)":
     st.header("📹 Generate Video Using Photo Avatar Group")
+    browse_col, refresh_col = st.columns([4, 1])
+    with refresh_col:
+        refresh_groups = st.button("🔄 Refresh groups", key="ui_vid_refresh_groups_btn_key_v2",
+                                   disabled=is_processing_main_ui_app)
+    st.session_state.avatar_groups_list_for_vid = list_avatar_groups(st.session_state.api_key, refresh=refresh_groups) \
+        if st.session_state.api_key else []
+    with browse_col:
+        group_options_for_vid = {f"{g.get('name', 'Unnamed')} ({g.get('id') or g.get('group_id')})": g.get('id') or g.get('group_id')
+                                 for g in st.session_state.avatar_groups_list_for_vid}
+        picked_group_label = st.selectbox("Pick one of your avatar groups (or type an ID below):",
+                                          ["--"] + list(group_options_for_vid), key="ui_vid_pick_group_key_v2",
+                                          disabled=is_processing_main_ui_app)
+    if picked_group_label != "--" and group_options_for_vid[picked_group_label] != st.session_state.ui_vid_groupid_for_look_select:
+        st.session_state.ui_vid_groupid_for_look_select = group_options_for_vid[picked_group_label]
+        st.session_state.ui_vid_groupid_for_look_select_key_v2 = st.session_state.ui_vid_groupid_for_look_select
     st.session_state.ui_vid_groupid_for_look_select = st.text_input("Target Avatar Group ID:",
                                                                     value=st.session_state.ui_vid_groupid_for_look_select or st.session_state.get(
                                                                         "group_id", ""),
@@ -679,14 +695,10 @@ if st.session_state.current_step != "idle":
             voice_id_to_set_for_grp_vid = None
             if st.session_state.ui_vid_voice_option == "Clone New Voice":
                 if st.session_state.get("temp_uploaded_voice_bytes_for_grp_vid"):
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=
-                    os.path.splitext(st.session_state.temp_uploaded_voice_filename_for_grp_vid)[1]) as tmp_f:
-                        tmp_f.write(st.session_state.temp_uploaded_voice_bytes_for_grp_vid);
-                        temp_path = tmp_f.name
                     voice_name = st.session_state.ui_vid_voice_name_new or "GrpVidClonedVoice"
-                    voice_id_to_set_for_grp_vid = clone_voice_from_sample(st.session_state.api_key, temp_path,
-                                                                          voice_name)
-                    os.unlink(temp_path);
+                    voice_id_to_set_for_grp_vid = clone_voice_from_sample(
+                        st.session_state.api_key, st.session_state.temp_uploaded_voice_bytes_for_grp_vid, voice_name,
+                        audio_file_name=st.session_state.temp_uploaded_voice_filename_for_grp_vid)
                     if voice_id_to_set_for_grp_vid: time.sleep(10)
                     st.session_state.temp_uploaded_voice_bytes_for_grp_vid = None
                     st.session_state.temp_uploaded_voice_filename_for_grp_vid = None
@@ -801,41 +813,27 @@ if st.session_state.current_step != "idle":
             st.rerun()
 
         elif st.session_state.current_step == "group_poll_train_status" and st.session_state.group_training_id:
-            status_train_poll_grp_proc_val_logic_final_val_manage, err_info_train_poll_grp_proc_val_logic_final_val_manage = check_photo_avatar_group_training_status(
-                st.session_state.api_key, st.session_state.group_training_id)
-            is_final_train_poll_grp_proc_val_logic_final_val_manage = False
-            if status_train_poll_grp_proc_val_logic_final_val_manage == "Ready":
-                log_message(f"Avatar group (ID: {st.session_state.group_training_id}) training completed!", "success");
-                st.session_state.current_step = "idle";
-                is_final_train_poll_grp_proc_val_logic_final_val_manage = True
-            elif status_train_poll_grp_proc_val_logic_final_val_manage == "Failed" or status_train_poll_grp_proc_val_logic_final_val_manage == "Error":
-                err_train_poll_grp_msg_proc_val_logic_final_val_manage = err_info_train_poll_grp_proc_val_logic_final_val_manage.get(
-                    "message", "Unknown training error") if isinstance(err_info_train_poll_grp_proc_val_logic_final_val_manage,
-                                                             dict) else str(
-                    err_info_train_poll_grp_proc_val_logic_final_val_manage)
-                log_message(
-                    f"Avatar group (ID: {st.session_state.group_training_id}) training failed. Reason: {err_train_poll_grp_msg_proc_val_logic_final_val_manage}",
-                    "error");
-                st.session_state.current_step = "idle";
-                is_final_train_poll_grp_proc_val_logic_final_val_manage = True
-
-            st.session_state.group_training_status = status_train_poll_grp_proc_val_logic_final_val_manage
-            if is_final_train_poll_grp_proc_val_logic_final_val_manage:
-                st.rerun()
-            elif status_train_poll_grp_proc_val_logic_final_val_manage in ["Pending", "Training"]:
+            training_job = st.session_state.get("group_training_job")
+            if training_job is None or training_job.job_id != st.session_state.group_training_id:
+                training_job = get_heygen_client(st.session_state.api_key).training_job(
+                    st.session_state.group_training_id)
+                st.session_state.group_training_job = training_job
+            # Blocks with jittered exponential backoff; reruns every minute so the page stays responsive.
+            training_job.wait(timeout=60)
+            st.session_state.group_training_status = training_job.last_status
+            if training_job.succeeded:
+                log_message(f"Avatar group (ID: {st.session_state.group_training_id}) training completed after "
+                            f"{training_job.polls} status checks!", "success")
+                st.session_state.current_step = "idle"
+            elif training_job.state == training_job.FAILED:
                 log_message(
-                    f"Polling avatar group training status (ID: {st.session_state.group_training_id}): {status_train_poll_grp_proc_val_logic_final_val_manage}");
-                time.sleep(10);
-                st.rerun()
-            else: # Includes any other unexpected statuses
+                    f"Avatar group (ID: {st.session_state.group_training_id}) training failed. Reason: {training_job.error_message}",
+                    "error")
+                st.session_state.current_step = "idle"
+            else:
                 log_message(
-                    f"Received unknown training status '{status_train_poll_grp_proc_val_logic_final_val_manage}' or error during check (ID: {st.session_state.group_training_id})",
-                    "warning")
-                if err_info_train_poll_grp_proc_val_logic_final_val_manage and err_info_train_poll_grp_proc_val_logic_final_val_manage.get("message"):
-                     log_message(f"Error details: {err_info_train_poll_grp_proc_val_logic_final_val_manage.get('message')}", "warning")
-
-                st.session_state.current_step = "idle";
-                st.rerun()
+                    f"Polling avatar group training status (ID: {st.session_state.group_training_id}): {training_job.last_status}")
+            st.rerun()
 
 
 # --- Final Log Display ---
@@ -0,0 +1,205 @@
+# image_prep.py
+import io
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image, ImageChops, ImageOps
+
+DEFAULT_MAX_SIDE = 1920  # longest side of any HeyGen output preset; more pixels are thrown away server-side
+DEFAULT_JPEG_QUALITY = 88
+# Focus for aspect crops when no face is found: the upper-middle of the frame, which is where the face sits in
+# virtually every head-and-shoulders avatar photo.
+DEFAULT_FOCUS = (0.5, 0.35)
+# Skin tones in YCbCr (Chai & Ngan), used by face_focus; chroma only, so lighting and skin colour matter little.
+_SKIN_CB, _SKIN_CR = (77, 127), (133, 173)
+_FACE_SAMPLE_SIDE = 96
+
+
+def parse_aspect(value) -> float | None:
+    """'16:9' / '1920x1080' / 1.5 -> width/height ratio; empty or invalid -> None (no crop)."""
+    if not value:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value) if value > 0 else None
+    for separator in (":", "x"):
+        if separator in str(value):
+            try:
+                width, height = (float(part) for part in str(value).split(separator, 1))
+                return width / height if width > 0 and height > 0 else None
+            except ValueError:
+                return None
+    return None
+
+
+def face_focus(image: Image.Image) -> tuple[float, float]:
+    """Estimated face centre as fractions of width/height, or DEFAULT_FOCUS if none stands out.
+
+    A heuristic, not a face detector: skin-toned pixels are found on a small copy of the image, and the focus is the
+    centre of the upper part of the skin region (the face sits above the neck, shoulders and hands). Photos with
+    too little skin, or so much that the background must be skin-coloured (wood, sand, beige walls), keep the
+    default.
+    """
+    sample = image.convert("RGB")
+    sample.thumbnail((_FACE_SAMPLE_SIDE, _FACE_SAMPLE_SIDE))
+    width, height = sample.size
+    _, cb, cr = sample.convert("YCbCr").split()
+    mask = ImageChops.multiply(cb.point(lambda v: 255 if _SKIN_CB[0] <= v <= _SKIN_CB[1] else 0),
+                               cr.point(lambda v: 255 if _SKIN_CR[0] <= v <= _SKIN_CR[1] else 0))
+    skin = [value > 0 for value in mask.getdata()]
+    if not 0.01 <= sum(skin) / len(skin) <= 0.6:
+        return DEFAULT_FOCUS
+    rows = [row for row in range(height) if any(skin[row * width:(row + 1) * width])]
+    # The upper half of the skin region, where the face is.
+    cutoff = rows[0] + 0.5 * (rows[-1] - rows[0] + 1)
+    points = [(index % width, index // width) for index, is_skin in enumerate(skin)
+              if is_skin and index // width < cutoff]
+    x = sum(point[0] for point in points) / len(points)
+    y = sum(point[1] for point in points) / len(points)
+    return (x + 0.5) / width, (y + 0.5) / height
+
+
+def crop_to_aspect(image: Image.Image, aspect: float, focus: tuple[float, float] = DEFAULT_FOCUS) -> Image.Image:
+    """Crops the largest box of the given width/height ratio, centred as close to focus as the borders allow."""
+    width, height = image.size
+    if abs(width / height - aspect) < 0.01:
+        return image
+    crop_w, crop_h = (round(height * aspect), height) if width / height > aspect else (width, round(width / aspect))
+    left = min(max(round(width * focus[0] - crop_w / 2), 0), width - crop_w)
+    top = min(max(round(height * focus[1] - crop_h / 2), 0), height - crop_h)
+    return image.crop((left, top, left + crop_w, top + crop_h))
+
+
+def prepare_image(source, file_name: str = "", max_side: int = DEFAULT_MAX_SIDE, aspect=None,
+                  quality: int = DEFAULT_JPEG_QUALITY, preserve_alpha: bool = False) -> dict:
+    """Normalises one photo for upload: EXIF orientation applied, optional aspect crop, downscaled so the longest side
+    is at most max_side, metadata stripped and re-encoded as an optimised progressive JPEG (or, with preserve_alpha,
+    an optimised PNG for images with transparency, e.g. logos).
+
+    source is a path or bytes-like data (both picklable, so this runs in worker processes). Returns a dict with the
+    encoded data, the new file_name and the original/prepared byte counts. If the re-encode would not be smaller and
+    nothing had to change, the original bytes are returned untouched.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        file_name = file_name or os.path.basename(source)
+        with open(source, "rb") as f:
+            original = f.read()
+    else:
+        original = bytes(source)
+    with Image.open(io.BytesIO(original)) as opened:
+        original_format = opened.format
+        changed = opened.getexif().get(0x0112, 1) != 1  # EXIF Orientation tag: a rotation/flip is needed
+        image = ImageOps.exif_transpose(opened)
+        ratio = parse_aspect(aspect)
+        if ratio:
+            cropped = crop_to_aspect(image, ratio, face_focus(image) if abs(image.width / image.height - ratio) >= 0.01
+                                     else DEFAULT_FOCUS)
+            changed |= cropped is not image
+            image = cropped
+        if max(image.size) > max_side:
+            image = image.copy()
+            image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+            changed = True
+        has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+        output = io.BytesIO()
+        if has_alpha and preserve_alpha:
+            output_format = "PNG"
+            image.save(output, format="PNG", optimize=True)
+        else:
+            output_format = "JPEG"
+            if has_alpha:
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image, mask=image.convert("RGBA").getchannel("A"))
+                image = background
+            elif image.mode != "RGB":
+                image = image.convert("RGB")
+            # No exif/icc_profile arguments: the re-encode carries no metadata (GPS, device, thumbnails).
+            image.save(output, format="JPEG", quality=quality, optimize=True, progressive=True)
+        size = image.size
+    data = output.getvalue()
+    if len(data) >= len(original) and not changed and original_format == output_format:
+        data = original
+    stem = os.path.splitext(os.path.basename(file_name))[0] or "photo"
+    extension = ".png" if output_format == "PNG" else ".jpg"
+    return {"data": data, "file_name": f"{stem}{extension}" if data is not original else file_name, "size": size,
+            "original_bytes": len(original), "bytes": len(data), "saved_bytes": len(original) - len(data)}
+
+
+class ImagePreprocessor:
+    """Runs prepare_image in a process pool so batches of photos are decoded/resized on all cores.
+
+    The pool is started lazily; single-image callers can pass use_pool=False to avoid a worker round trip.
+    """
+
+    def __init__(self, max_side: int = DEFAULT_MAX_SIDE, aspect=None, quality: int = DEFAULT_JPEG_QUALITY,
+                 max_workers: int | None = None, logger=None):
+        self.max_side = max_side
+        self.aspect = aspect
+        self.quality = quality
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.logger = logger or logging.getLogger(__name__)
+        self._pool = None
+        self.total_saved_bytes = 0
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: the callers (Streamlit, worker threads) are multi-threaded, where fork is unsafe.
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def _discard_broken_pool(self, error: Exception):
+        # A worker killed mid-task (OOM on a huge image) poisons the whole executor; start a fresh one next time.
+        if isinstance(error, BrokenProcessPool) and self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def _options(self, overrides: dict) -> dict:
+        options = {"max_side": self.max_side, "aspect": self.aspect, "quality": self.quality}
+        options.update({key: value for key, value in overrides.items() if value is not None})
+        return options
+
+    def _report(self, result: dict | None, file_name: str) -> dict | None:
+        if result is None:
+            return None
+        self.total_saved_bytes += max(result["saved_bytes"], 0)
+        percent = 100 * result["saved_bytes"] / result["original_bytes"] if result["original_bytes"] else 0
+        self.logger.info(f"Preprocessed '{file_name}': {result['original_bytes']:,} -> {result['bytes']:,} bytes "
+                         f"({result['saved_bytes']:,} saved, {percent:.0f}%), {result['size'][0]}x{result['size'][1]}")
+        return result
+
+    def prepare(self, source, file_name: str = "", use_pool: bool = True, **overrides) -> dict | None:
+        """Prepares one photo; returns None (and logs) if Pillow cannot decode it, so callers can upload as-is."""
+        options = self._options(overrides)
+        try:
+            if use_pool:
+                result = self._executor().submit(prepare_image, source, file_name, **options).result()
+            else:
+                result = prepare_image(source, file_name, **options)
+        except Exception as e:
+            self._discard_broken_pool(e)
+            self.logger.warning(f"Image preprocessing failed for '{file_name}': {e}")
+            return None
+        return self._report(result, file_name)
+
+    def prepare_many(self, items, **overrides) -> list[dict | None]:
+        """Prepares (source, file_name) pairs in parallel; results are in input order, None where decoding failed."""
+        items = list(items)
+        options = self._options(overrides)
+        futures = [self._executor().submit(prepare_image, source, name, **options) for source, name in items]
+        results = []
+        for future, (_, name) in zip(futures, items):
+            try:
+                results.append(self._report(future.result(), name))
+            except Exception as e:
+                self._discard_broken_pool(e)
+                self.logger.warning(f"Image preprocessing failed for '{name}': {e}")
+                results.append(None)
+        return results
@@ -0,0 +1,263 @@
+# job_store.py
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from asset_cache import DEFAULT_CACHE_DIR
+
+UNFINISHED_STATES = ("queued", "running")
+# SQLite's WAL mode needs shared memory between every process using the database, so it must be on local disk.
+NETWORK_FILESYSTEMS = {"nfs", "nfs4", "cifs", "smb3", "smbfs", "9p", "afs", "ceph", "glusterfs", "lustre",
+                       "fuse.sshfs", "fuse.glusterfs", "fuse.s3fs", "fuse.gcsfuse"}
+
+
+def filesystem_type(path: str) -> str | None:
+    """Type of the filesystem path is on, from /proc/mounts (longest matching mount point); None if unknown."""
+    path = os.path.realpath(path)
+    best, fs_type = "", None
+    try:
+        with open("/proc/mounts") as mounts:
+            for line in mounts:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount_point = fields[1].replace("\\040", " ")
+                if (path == mount_point or path.startswith(mount_point.rstrip("/") + "/")) \
+                        and len(mount_point) > len(best):
+                    best, fs_type = mount_point, fields[2]
+    except OSError:  # not Linux
+        return None
+    return fs_type
+
+
+class JobStore:
+    """Durable record of pipeline runs (inputs, outputs incl. vendor job IDs, progress, logs) in SQLite.
+
+    Runs call mark_dirty() on every change; a background writer snapshots the dirty runs and commits them, plus
+    the stage transitions recorded since, in one transaction every commit_interval_seconds. flush() writes
+    immediately and is used right after a paid vendor job is submitted, so its ID is on disk before we wait on
+    it. The database is in WAL mode, so viewers and the writer do not block each other; WAL only works between
+    processes on one host, so a database on a network filesystem is refused (ValueError).
+    """
+
+    def __init__(self, db_path: str = None, commit_interval_seconds: float = 0.5, logger=None):
+        self.db_path = db_path or os.path.join(DEFAULT_CACHE_DIR, "pipeline_runs.sqlite3")
+        self.commit_interval_seconds = commit_interval_seconds
+        self.logger = logger or logging.getLogger(__name__)
+        self._dirty = {}  # run_id -> run
+        self._events = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._writer = None
+        self.commits = 0
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        fs_type = filesystem_type(os.path.dirname(self.db_path) or ".")
+        if fs_type in NETWORK_FILESYSTEMS:
+            raise ValueError(f"Job database {self.db_path} is on a {fs_type} filesystem; SQLite in WAL mode is only "
+                             f"safe on local disk (all processes on one host).")
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS runs ("
+                         "run_id TEXT PRIMARY KEY, state TEXT NOT NULL, stage TEXT, inputs TEXT NOT NULL, "
+                         "outputs TEXT NOT NULL, stages_done TEXT NOT NULL, stages_active TEXT NOT NULL, "
+                         "stage_status TEXT NOT NULL, status_message TEXT, error TEXT, logs TEXT NOT NULL, "
+                         "created_at REAL NOT NULL, finished_at REAL, updated_at REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS runs_state ON runs (state)")
+            conn.execute("CREATE TABLE IF NOT EXISTS run_events ("
+                         "run_id TEXT NOT NULL, at REAL NOT NULL, stage TEXT, event TEXT NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS run_events_run ON run_events (run_id)")
+            # Runs handed to worker processes (see JobQueue); the engine that enqueued them does not run them.
+            conn.execute("CREATE TABLE IF NOT EXISTS run_queue ("
+                         "run_id TEXT PRIMARY KEY, enqueued_at REAL NOT NULL, worker_id TEXT, "
+                         "lease_expires_at REAL, attempts INTEGER NOT NULL DEFAULT 0)")
+
+    @contextmanager
+    def _connect(self, immediate: bool = False):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")  # durable across process crashes; WAL keeps it consistent
+        try:
+            with conn:
+                if immediate:  # take the write lock up front so read-then-update is atomic across processes
+                    conn.execute("BEGIN IMMEDIATE")
+                yield conn
+        finally:
+            conn.close()
+
+    def start(self):
+        """Starts the background writer. Safe to call more than once."""
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._stop.clear()
+                self._writer = threading.Thread(target=self._write_loop, name="job-store-writer", daemon=True)
+                self._writer.start()
+        return self
+
+    def stop(self):
+        """Stops the writer after a final flush."""
+        self._stop.set()
+        if self._writer is not None:
+            self._writer.join()
+        self.flush()
+
+    def _write_loop(self):
+        while not self._stop.wait(self.commit_interval_seconds):
+            try:
+                self.flush()
+            except Exception as e:  # keep writing later changes even if one commit fails
+                self.logger.error(f"Job store commit failed: {e}")
+
+    def mark_dirty(self, run):
+        """Queues the run for the next commit. Cheap: the snapshot is taken by the writer."""
+        with self._lock:
+            self._dirty[run.run_id] = run
+
+    def record_event(self, run_id: str, stage: str | None, event: str):
+        """Queues a stage transition ("started", "done", "failed", "resumed", ...) for the next commit."""
+        with self._lock:
+            self._events.append((run_id, time.time(), stage, event))
+
+    def flush(self):
+        """Commits every pending change now."""
+        with self._write_lock:
+            with self._lock:
+                runs, self._dirty = list(self._dirty.values()), {}
+                events, self._events = self._events, []
+            if not runs and not events:
+                return
+            now = time.time()
+            rows = []
+            for run in runs:
+                snapshot = run.snapshot()
+                rows.append((run.run_id, snapshot["state"], snapshot["stage"], json.dumps(run.inputs, default=str),
+                             json.dumps(snapshot["outputs"], default=str), json.dumps(snapshot["stages_done"]),
+                             json.dumps(snapshot["stages_active"]), json.dumps(snapshot["stage_status"]),
+                             snapshot["status_message"], snapshot["error"], json.dumps(snapshot["logs"]),
+                             snapshot["created_at"], snapshot["finished_at"], now))
+            with self._connect() as conn:
+                conn.executemany("INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                 rows)
+                conn.executemany("INSERT INTO run_events VALUES (?, ?, ?, ?)", events)
+            self.commits += 1
+
+    @staticmethod
+    def _record(row) -> dict:
+        record = dict(row)
+        for field in ("inputs", "outputs", "stages_done", "stages_active", "stage_status", "logs"):
+            record[field] = json.loads(record[field])
+        return record
+
+    def load(self, run_id: str) -> dict | None:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        return self._record(row) if row else None
+
+    def unfinished(self) -> list[dict]:
+        """Runs that were queued or running when the process last stopped, oldest first. Runs in the worker
+        queue are left to the workers."""
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT * FROM runs WHERE state IN ({', '.join('?' * len(UNFINISHED_STATES))}) "
+                                f"AND run_id NOT IN (SELECT run_id FROM run_queue) ORDER BY created_at",
+                                UNFINISHED_STATES).fetchall()
+        return [self._record(row) for row in rows]
+
+    def events(self, run_id: str) -> list[dict]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT at, stage, event FROM run_events WHERE run_id = ? ORDER BY at",
+                                (run_id,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def prune(self, finished_before: float) -> int:
+        """Deletes runs (and their events) that finished before the given time; returns how many."""
+        with self._write_lock, self._connect() as conn:
+            run_ids = [row[0] for row in conn.execute("SELECT run_id FROM runs WHERE finished_at < ?",
+                                                      (finished_before,))]
+            conn.executemany("DELETE FROM run_events WHERE run_id = ?", [(run_id,) for run_id in run_ids])
+            conn.executemany("DELETE FROM run_queue WHERE run_id = ?", [(run_id,) for run_id in run_ids])
+            conn.executemany("DELETE FROM runs WHERE run_id = ?", [(run_id,) for run_id in run_ids])
+        return len(run_ids)
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._dirty) + len(self._events)
+        with self._connect() as conn:
+            counts = dict(conn.execute("SELECT state, COUNT(*) FROM runs GROUP BY state").fetchall())
+        return {"runs": counts, "pending": pending, "commits": self.commits}
+
+
+class JobQueue:
+    """Work queue of pipeline runs in a JobStore's database, consumed by worker processes (pipeline_worker.py).
+
+    A worker claims the oldest unleased run and holds a lease on it, renewed while it works; a run whose lease
+    expires (worker crashed or hung) becomes visible again and is claimed by another worker, which resumes it at
+    its last persisted stage. Any number of worker processes on the database's host can consume the same queue;
+    workers on other machines cannot share it (the database must stay on local disk, see JobStore).
+    """
+
+    def __init__(self, store: JobStore, lease_seconds: float = 120):
+        self.store = store
+        self.lease_seconds = lease_seconds
+
+    def enqueue(self, run):
+        """Persists a new run and makes it claimable."""
+        run.checkpoint()
+        with self.store._connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO run_queue (run_id, enqueued_at) VALUES (?, ?)",
+                         (run.run_id, time.time()))
+
+    def claim(self, worker_id: str) -> dict | None:
+        """Leases the oldest claimable run to the worker; returns its stored record (plus "attempts") or None.
+
+        attempts counts this claim plus earlier ones that ended with the lease expiring; claims handed back with
+        release() are not counted, so deploys do not use up a run's attempts.
+        """
+        now = time.time()
+        with self.store._connect(immediate=True) as conn:
+            row = conn.execute(f"SELECT q.run_id, q.attempts FROM run_queue q JOIN runs r ON r.run_id = q.run_id "
+                               f"WHERE r.state IN ({', '.join('?' * len(UNFINISHED_STATES))}) "
+                               f"AND (q.lease_expires_at IS NULL OR q.lease_expires_at < ?) "
+                               f"ORDER BY q.enqueued_at LIMIT 1", (*UNFINISHED_STATES, now)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE run_queue SET worker_id = ?, lease_expires_at = ?, attempts = attempts + 1 "
+                         "WHERE run_id = ?", (worker_id, now + self.lease_seconds, row["run_id"]))
+            record = conn.execute("SELECT * FROM runs WHERE run_id = ?", (row["run_id"],)).fetchone()
+        return {**self.store._record(record), "attempts": row["attempts"] + 1}
+
+    def renew(self, run_ids: list[str], worker_id: str) -> list[str]:
+        """Extends the worker's leases; returns the run IDs whose lease it no longer holds."""
+        lost = []
+        with self.store._connect(immediate=True) as conn:
+            for run_id in run_ids:
+                updated = conn.execute("UPDATE run_queue SET lease_expires_at = ? WHERE run_id = ? AND worker_id = ?",
+                                       (time.time() + self.lease_seconds, run_id, worker_id)).rowcount
+                if not updated:
+                    lost.append(run_id)
+        return lost
+
+    def release(self, run_ids: list[str], worker_id: str):
+        """Gives leases back early (worker shutting down) so other workers can claim the runs straight away; the
+        claim does not count as an attempt."""
+        with self.store._connect() as conn:
+            conn.executemany("UPDATE run_queue SET worker_id = NULL, lease_expires_at = NULL, "
+                             "attempts = MAX(attempts - 1, 0) WHERE run_id = ? AND worker_id = ?",
+                             [(run_id, worker_id) for run_id in run_ids])
+
+    def complete(self, run_id: str, worker_id: str):
+        """Removes a finished run from the queue (if the worker still holds it)."""
+        with self.store._connect() as conn:
+            conn.execute("DELETE FROM run_queue WHERE run_id = ? AND worker_id = ?", (run_id, worker_id))
+
+    def stats(self) -> dict:
+        now = time.time()
+        with self.store._connect() as conn:
+            waiting, leased, workers = conn.execute(
+                "SELECT COALESCE(SUM(lease_expires_at IS NULL OR lease_expires_at < ?), 0), "
+                "COALESCE(SUM(lease_expires_at >= ?), 0), COUNT(DISTINCT CASE WHEN lease_expires_at >= ? "
+                "THEN worker_id END) FROM run_queue", (now, now, now)).fetchone()
+        return {"waiting": waiting, "leased": leased, "workers": workers}
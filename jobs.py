@@ -0,0 +1,156 @@
+# jobs.py
+# Polling handles for long-running vendor operations, shared by the HeyGen and Shotstack clients.
+import random
+import threading
+import time
+
+
+class Backoff:
+    """Jittered exponential backoff with a ceiling: initial, initial*factor, ... capped at max_delay."""
+
+    def __init__(self, initial: float = 2.0, factor: float = 1.6, max_delay: float = 30.0, jitter: float = 0.3):
+        self.initial = initial
+        self.factor = factor
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.attempt = 0
+
+    def next_delay(self) -> float:
+        delay = min(self.max_delay, self.initial * (self.factor ** self.attempt))
+        self.attempt += 1
+        # Jitter downwards only so the ceiling stays a hard upper bound and concurrent jobs spread out.
+        return delay * random.uniform(1.0 - self.jitter, 1.0)
+
+    def reset(self):
+        self.attempt = 0
+
+
+class PolledJob:
+    """Handle for a long-running vendor operation (HeyGen video, Shotstack render, ...) tracked by polling.
+
+    Subclasses implement _fetch(), returning (state, result, error) where state is "pending", "completed",
+    "failed" or "transient" (the status call itself failed). A transient error never fails the job, since the
+    operation itself may be fine: the next poll is just pushed further out, doubling per consecutive error up to
+    max_transient_delay, and giving up is left to the caller's deadline.
+    """
+    PENDING, COMPLETED, FAILED, TRANSIENT = "pending", "completed", "failed", "transient"
+    kind = "job"
+
+    def __init__(self, client, job_id: str, backoff: Backoff | None = None, max_transient_delay: float = 300.0):
+        self.client = client
+        self.job_id = job_id
+        self.backoff = backoff or Backoff()
+        self.max_transient_delay = max_transient_delay
+        self.state = self.PENDING
+        self.last_status = None
+        self.last_error = None  # of the most recent failed status call
+        self.result = None
+        self.error = None
+        self.polls = 0
+        self.callback_ref = None  # ref of the callback URL the job was submitted with, if any
+        self._transient_errors = 0
+        self._next_poll_at = 0.0
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.job_id} state={self.state} polls={self.polls}>"
+
+    def _fetch(self) -> tuple[str, object, object]:
+        raise NotImplementedError
+
+    def _finish(self, state: str, result=None, error=None):
+        with self._lock:
+            if self._finished.is_set():
+                return
+            self.state, self.result, self.error = state, result, error
+            self._finished.set()
+
+    def resolve(self, result=None):
+        """Marks the job completed from outside the poll loop (e.g. a webhook)."""
+        self._finish(self.COMPLETED, result=result)
+
+    def reject(self, error=None):
+        self._finish(self.FAILED, error=error)
+
+    def poll(self) -> bool:
+        """Performs one status call (regardless of backoff) and returns whether the job is finished."""
+        if self._finished.is_set():
+            return True
+        state, result, error = self._fetch()
+        self.polls += 1
+        delay = self.backoff.next_delay()
+        if state == self.TRANSIENT:
+            self._transient_errors += 1
+            self.last_error = error
+            delay = max(delay, min(self.max_transient_delay, delay * 2 ** self._transient_errors))
+        else:
+            self._transient_errors = 0
+            if state in (self.COMPLETED, self.FAILED):
+                self._finish(state, result=result, error=error)
+        self._next_poll_at = time.monotonic() + delay
+        return self._finished.is_set()
+
+    def done(self) -> bool:
+        """Non-blocking check; issues a status call only if the backoff delay since the last one has elapsed."""
+        if not self._finished.is_set() and time.monotonic() >= self._next_poll_at:
+            self.poll()
+        return self._finished.is_set()
+
+    def defer_polling(self, seconds: float):
+        """Skips status calls for the next `seconds` (e.g. while a completion webhook is expected)."""
+        self._next_poll_at = max(self._next_poll_at, time.monotonic() + seconds)
+
+    def seconds_until_next_poll(self) -> float:
+        return max(0.0, self._next_poll_at - time.monotonic())
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Blocks until the job finishes or timeout elapses; returns True if finished."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.done():
+            pause = self.seconds_until_next_poll()
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                pause = min(pause, remaining)
+            # Waiting on the event (rather than sleeping) lets resolve()/reject() wake us immediately.
+            self._finished.wait(pause)
+        return True
+
+    @property
+    def succeeded(self) -> bool:
+        return self.state == self.COMPLETED
+
+    @property
+    def error_message(self) -> str:
+        if isinstance(self.error, dict):
+            return self.error.get("message", "Unknown error")
+        return str(self.error) if self.error else "Unknown error"
+
+
+def as_completed(jobs, timeout: float | None = None, idle_sleep: float = 0.5):
+    """Yields jobs as they finish, polling each one on its own backoff schedule.
+
+    Raises TimeoutError if timeout elapses before every job has finished.
+    """
+    pending = list(jobs)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while pending:
+        still_pending = []
+        for job in pending:
+            if job.done():
+                yield job
+            else:
+                still_pending.append(job)
+        pending = still_pending
+        if not pending:
+            return
+        pause = min(job.seconds_until_next_poll() for job in pending)
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"{len(pending)} job(s) still pending after {timeout}s")
+            pause = min(pause, remaining)
+        # Cap the sleep so jobs resolved externally (webhooks) are noticed promptly.
+        time.sleep(min(pause, idle_sleep))
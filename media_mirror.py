@@ -0,0 +1,199 @@
+# media_mirror.py
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from storage import StorageBucket
+from upload_streams import DEFAULT_CHUNK_SIZE, AssetStream
+
+DEFAULT_MAX_IMAGE_BYTES = 50 * 1024 * 1024
+DEFAULT_MAX_VIDEO_BYTES = 2 * 1024 * 1024 * 1024
+_EXTENSIONS = {"image/jpeg": "jpg", "image/png": "png", "image/webp": "webp", "image/gif": "gif",
+               "image/svg+xml": "svg", "video/mp4": "mp4", "video/quicktime": "mov", "video/webm": "webm"}
+
+
+class MediaMirror:
+    """Re-hosts the media a Shotstack render fetches in our storage bucket, under content-hash names.
+
+    Listing images and logos are fetched concurrently, downscaled to the render's frame on the image
+    preprocessor's process pool (transparency kept), and stored as media_<sha256>.<ext>; the HeyGen avatar video (a
+    signed, expiring link) is streamed to a per-job scratch file and stored the same way. Identical content is
+    stored once, and an object already in the bucket is not uploaded again. Mirrored URLs are remembered per source
+    for ttl_seconds, so the same listing is not even fetched twice.
+
+    Mirroring is best effort: an asset that cannot be fetched or stored is left out of the result and the caller
+    keeps its original URL.
+    """
+    OBJECT_PREFIX = "media_"
+    DEFAULT_TIMEOUT_SECONDS = 60
+
+    def __init__(self, storage: StorageBucket, image_preprocessor=None, max_workers: int = 8,
+                 ttl_seconds: float = 24 * 3600, scratch_dir: str | None = None,
+                 max_image_bytes: int = DEFAULT_MAX_IMAGE_BYTES, max_video_bytes: int = DEFAULT_MAX_VIDEO_BYTES,
+                 timeout: float | None = DEFAULT_TIMEOUT_SECONDS, logger=None):
+        self.storage = storage
+        self.image_preprocessor = image_preprocessor
+        self.ttl_seconds = ttl_seconds
+        self.scratch_dir = scratch_dir
+        self.max_image_bytes = max_image_bytes
+        self.max_video_bytes = max_video_bytes
+        self.timeout = timeout
+        self.logger = logger or logging.getLogger(__name__)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="media-mirror")
+        self._mirrored = {}  # (source url, max_side) -> (mirrored url, expires_at)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.fetched = 0
+        self.uploaded = 0
+        self.reused = 0
+
+    @property
+    def session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _log(self, message: str, level: str = "info", source: str = "MIRROR"):
+        self.logger.log(logging.ERROR if level == "error" else logging.WARNING if level == "warning"
+                        else logging.INFO, f"({source}) {message}")
+
+    def _remembered(self, key: tuple) -> str | None:
+        with self._lock:
+            entry = self._mirrored.get(key)
+            if entry and entry[1] > time.time():
+                self.reused += 1
+                return entry[0]
+            self._mirrored.pop(key, None)
+            return None
+
+    def _remember(self, key: tuple, mirrored_url: str):
+        now = time.time()
+        with self._lock:
+            self._mirrored[key] = (mirrored_url, now + self.ttl_seconds)
+            if len(self._mirrored) > 10000:
+                self._mirrored = {k: entry for k, entry in self._mirrored.items() if entry[1] > now}
+
+    def mirror_images(self, urls: list[str], max_side: int | None = None, log=None) -> dict:
+        """{source url: mirrored url} for the images that could be mirrored, downscaled so neither side exceeds
+        max_side (None keeps the original pixels)."""
+        log = log or self._log
+        futures = {url: self._executor.submit(self._mirror_image, url, max_side, log) for url in dict.fromkeys(urls)}
+        mirrored = {}
+        for url, future in futures.items():
+            try:
+                result = future.result()
+            except Exception as e:  # a bug here must not fail the render; the original URL is still usable
+                log(f"Mirroring {url} failed: {e}", "warning", "MIRROR")
+                continue
+            if result:
+                mirrored[url] = result
+        return mirrored
+
+    def _mirror_image(self, url: str, max_side: int | None, log) -> str | None:
+        key = (url, max_side)
+        mirrored_url = self._remembered(key)
+        if mirrored_url:
+            return mirrored_url
+        fetched = self._fetch(url, self.max_image_bytes, log)
+        if fetched is None:
+            return None
+        data, content_type = fetched
+        if self.image_preprocessor is not None and max_side and content_type != "image/svg+xml":
+            name = os.path.basename(url.split("?", 1)[0]) or "image"
+            prepared = self.image_preprocessor.prepare(data, name, max_side=max_side, preserve_alpha=True)
+            if prepared is not None:
+                data = prepared["data"]
+                content_type = "image/png" if prepared["file_name"].endswith(".png") else \
+                    "image/jpeg" if prepared["file_name"].endswith(".jpg") else content_type
+        mirrored_url = self._store(hashlib.sha256(data).hexdigest(), data, content_type, log)
+        if mirrored_url:
+            self._remember(key, mirrored_url)
+        return mirrored_url
+
+    def _fetch(self, url: str, max_bytes: int, log) -> tuple[bytes, str] | None:
+        try:
+            with self.session.get(url, stream=True, timeout=self.timeout) as response:
+                if response.status_code >= 400:
+                    log(f"Could not fetch {url} for mirroring: HTTP {response.status_code}.", "warning", "MIRROR")
+                    return None
+                content_type = (response.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+                data = bytearray()
+                for chunk in response.iter_content(chunk_size=DEFAULT_CHUNK_SIZE):
+                    data += chunk
+                    if len(data) > max_bytes:
+                        log(f"Not mirroring {url}: over {max_bytes:,} bytes.", "warning", "MIRROR")
+                        return None
+        except requests.exceptions.RequestException as e:
+            log(f"Could not fetch {url} for mirroring: {e}", "warning", "MIRROR")
+            return None
+        with self._lock:
+            self.fetched += 1
+        return bytes(data), content_type
+
+    def _store(self, digest: str, body, content_type: str, log) -> str | None:
+        """Public URL of media_<digest>.<ext>, uploading body unless the bucket already has that object."""
+        object_name = f"{self.OBJECT_PREFIX}{digest}.{_EXTENSIONS.get(content_type, 'bin')}"
+        if not self.storage.exists(object_name, log):
+            if not self.storage.upload(object_name, body, content_type or "application/octet-stream", log):
+                return None
+            with self._lock:
+                self.uploaded += 1
+        return self.storage.public_url(object_name, log)
+
+    def mirror_video(self, url: str, log=None) -> str | None:
+        """Mirrored URL of the video (streamed through a scratch file, never held in memory), or None."""
+        log = log or self._log
+        key = (url, None)
+        mirrored_url = self._remembered(key)
+        if mirrored_url:
+            return mirrored_url
+        if self.scratch_dir:
+            os.makedirs(self.scratch_dir, exist_ok=True)
+        job_dir = tempfile.mkdtemp(prefix="mirror_", dir=self.scratch_dir)
+        try:
+            path = os.path.join(job_dir, "video")
+            digest = hashlib.sha256()
+            size = 0
+            try:
+                with self.session.get(url, stream=True, timeout=self.timeout) as response, open(path, "wb") as f:
+                    if response.status_code >= 400:
+                        log(f"Could not fetch the video for mirroring: HTTP {response.status_code}.", "warning",
+                            "MIRROR")
+                        return None
+                    content_type = (response.headers.get("Content-Type") or "video/mp4").split(";")[0].strip()
+                    for chunk in response.iter_content(chunk_size=DEFAULT_CHUNK_SIZE):
+                        digest.update(chunk)
+                        f.write(chunk)
+                        size += len(chunk)
+                        if size > self.max_video_bytes:
+                            log(f"Not mirroring the video: over {self.max_video_bytes:,} bytes.", "warning",
+                                "MIRROR")
+                            return None
+            except (requests.exceptions.RequestException, OSError) as e:
+                log(f"Could not fetch the video for mirroring: {e}", "warning", "MIRROR")
+                return None
+            with self._lock:
+                self.fetched += 1
+            if content_type == "application/octet-stream" or not content_type.startswith("video/"):
+                content_type = "video/mp4"
+            with AssetStream(path) as stream:
+                mirrored_url = self._store(digest.hexdigest(), stream.request_body(), content_type, log)
+        finally:
+            shutil.rmtree(job_dir, ignore_errors=True)
+        if mirrored_url:
+            log(f"Mirrored the avatar video ({size:,} bytes) to {mirrored_url}", "info", "MIRROR")
+            self._remember(key, mirrored_url)
+        return mirrored_url
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"fetched": self.fetched, "uploaded": self.uploaded, "reused": self.reused,
+                    "remembered": len(self._mirrored)}
@@ -0,0 +1,204 @@
+# media_preflight.py
+import logging
+import struct
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+
+DEFAULT_PROBE_BYTES = 64 * 1024  # enough for the header (and dimensions) of every common image format
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+# Content types that say nothing about the media; the header bytes are sniffed instead.
+GENERIC_CONTENT_TYPES = ("", "application/octet-stream", "binary/octet-stream", "application/binary")
+
+
+def image_dimensions(head: bytes) -> tuple[int, int] | None:
+    """(width, height) from the first bytes of a PNG, GIF, JPEG or WebP file; None if unknown or cut short."""
+    if head.startswith(b"\x89PNG\r\n\x1a\n") and head[12:16] == b"IHDR" and len(head) >= 24:
+        return struct.unpack(">II", head[16:24])
+    if head[:6] in (b"GIF87a", b"GIF89a") and len(head) >= 10:
+        return struct.unpack("<HH", head[6:10])
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP" and len(head) >= 30:
+        chunk = head[12:16]
+        if chunk == b"VP8 ":
+            width, height = struct.unpack("<HH", head[26:30])
+            return width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L":
+            bits = int.from_bytes(head[21:25], "little")
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            return int.from_bytes(head[24:27], "little") + 1, int.from_bytes(head[27:30], "little") + 1
+        return None
+    if head.startswith(b"\xff\xd8"):
+        position = 2
+        while position + 9 < len(head):
+            if head[position] != 0xFF:
+                return None
+            marker = head[position + 1]
+            if marker == 0xFF:  # fill byte
+                position += 1
+                continue
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:  # markers without a length
+                position += 2
+                continue
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):  # start of frame
+                height, width = struct.unpack(">HH", head[position + 5:position + 9])
+                return width, height
+            position += 2 + struct.unpack(">H", head[position + 2:position + 4])[0]
+    return None
+
+
+def sniff_content_type(head: bytes) -> str | None:
+    """Media type from the first bytes of an image, video or audio file; None if not recognised."""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head.startswith(b"RIFF") and head[8:12] == b"WAVE":
+        return "audio/wav"
+    if head[4:8] == b"ftyp":
+        return "video/quicktime" if head[8:12] == b"qt  " else "video/mp4"
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        return "video/webm"
+    if head.startswith(b"ID3") or (len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+        return "audio/mpeg"
+    text = head[:1024].lstrip().lower()
+    if text.startswith(b"<svg") or (text.startswith(b"<?xml") and b"<svg" in text):
+        return "image/svg+xml"
+    return None
+
+
+class MediaPreflight:
+    """Checks media URLs before a render depends on them: reachable, the expected content type, not too big and,
+    for images, readable dimensions, all from a ranged GET of the first probe_bytes.
+
+    Results are cached per URL (failures for a shorter time, so a fixed origin is picked up quickly), and a URL
+    already being probed for another run is waited on rather than fetched again. check_all() probes on a shared
+    pool, so a listing's URLs take about as long as the slowest one.
+    """
+    DEFAULT_TIMEOUT_SECONDS = 10
+
+    def __init__(self, ttl_seconds: float = 3600, failure_ttl_seconds: float = 60, max_workers: int = 8,
+                 probe_bytes: int = DEFAULT_PROBE_BYTES, max_bytes: int = DEFAULT_MAX_BYTES,
+                 timeout: float | None = DEFAULT_TIMEOUT_SECONDS, max_entries: int = 10000, logger=None):
+        self.ttl_seconds = ttl_seconds
+        self.failure_ttl_seconds = failure_ttl_seconds
+        self.probe_bytes = probe_bytes
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.logger = logger or logging.getLogger(__name__)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="media-preflight")
+        self._results = {}  # url -> (result, expires_at)
+        self._pending = {}  # url -> Future
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.hits = 0
+        self.probes = 0
+
+    @property
+    def session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def check_all(self, urls: list[str], kind: str = "image") -> dict:
+        """{url: result} for every URL (see probe()), probing the uncached ones concurrently."""
+        now = time.time()
+        futures = {}
+        with self._lock:
+            for url in dict.fromkeys(urls):
+                cached = self._results.get(url)
+                if cached and cached[1] > now and cached[0]["kind"] == kind:
+                    self.hits += 1
+                    futures[url] = Future()
+                    futures[url].set_result(cached[0])
+                elif url in self._pending:
+                    futures[url] = self._pending[url]
+                else:
+                    future = self._pending[url] = self._executor.submit(self._probe_and_cache, url, kind)
+                    futures[url] = future
+        return {url: future.result() for url, future in futures.items()}
+
+    def _probe_and_cache(self, url: str, kind: str) -> dict:
+        try:
+            result = self.probe(url, kind)
+        except Exception as e:  # never leave a waiting run without a result
+            result = {"url": url, "kind": kind, "ok": False, "error": f"Preflight failed: {e}"}
+        if not result["ok"]:
+            self.logger.warning(f"Media preflight failed for {url}: {result['error']}")
+        ttl = self.ttl_seconds if result["ok"] else self.failure_ttl_seconds
+        now = time.time()
+        with self._lock:
+            self.probes += 1
+            self._results.pop(url, None)
+            self._results[url] = (result, now + ttl)
+            self._pending.pop(url, None)
+            if len(self._results) > self.max_entries:
+                self._results = {key: entry for key, entry in self._results.items() if entry[1] > now}
+                while len(self._results) > self.max_entries:  # oldest first (insertion order)
+                    del self._results[next(iter(self._results))]
+        return result
+
+    def probe(self, url: str, kind: str = "image") -> dict:
+        """{"url", "kind", "ok", "error", "status", "content_type", "bytes", "width", "height"}, uncached.
+
+        ok is False for unreachable URLs, HTTP errors, a content type other than kind/* and files over max_bytes. A
+        missing or generic (application/octet-stream) content type is replaced by the one sniffed from the header.
+        Images whose dimensions cannot be read from the header are still ok (Shotstack may decode formats we don't
+        parse) but have no width / height.
+        """
+        result = {"url": url, "kind": kind, "ok": False, "error": None, "status": None, "content_type": None,
+                  "bytes": None, "width": None, "height": None}
+        if not url.lower().startswith(("http://", "https://")):
+            result["error"] = "Not an http(s) URL."
+            return result
+        try:
+            with self.session.get(url, headers={"Range": f"bytes=0-{self.probe_bytes - 1}"}, stream=True,
+                                  timeout=self.timeout) as response:
+                result["status"] = response.status_code
+                result["content_type"] = (response.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+                result["bytes"] = self._total_bytes(response)
+                if response.status_code >= 400:
+                    result["error"] = f"HTTP {response.status_code}."
+                    return result
+                head = b""
+                for chunk in response.iter_content(chunk_size=self.probe_bytes):
+                    head += chunk
+                    if len(head) >= self.probe_bytes:
+                        break
+        except requests.exceptions.RequestException as e:
+            result["error"] = f"Unreachable: {e}"
+            return result
+        if result["content_type"] in GENERIC_CONTENT_TYPES:  # e.g. a bucket that stores no type: go by the bytes
+            result["content_type"] = sniff_content_type(head) or result["content_type"]
+        if not result["content_type"].startswith(f"{kind}/"):
+            result["error"] = f"Content type is '{result['content_type'] or 'missing'}', not {kind}/*."
+            return result
+        if result["bytes"] is not None and result["bytes"] > self.max_bytes:
+            result["error"] = f"{result['bytes']:,} bytes, over the {self.max_bytes:,} byte limit."
+            return result
+        if kind == "image":
+            dimensions = image_dimensions(head)
+            if dimensions:
+                result["width"], result["height"] = dimensions
+        result["ok"] = True
+        return result
+
+    @staticmethod
+    def _total_bytes(response) -> int | None:
+        content_range = response.headers.get("Content-Range", "")  # "bytes 0-65535/482113"
+        if "/" in content_range and content_range.rsplit("/", 1)[1].isdigit():
+            return int(content_range.rsplit("/", 1)[1])
+        length = response.headers.get("Content-Length")
+        return int(length) if response.status_code == 200 and length and length.isdigit() else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"cached": len(self._results), "hits": self.hits, "probes": self.probes}
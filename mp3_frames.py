@@ -0,0 +1,114 @@
+# mp3_frames.py
+# Just enough MPEG audio (Layer III) parsing to join MP3 files frame by frame and time them, without re-encoding.
+
+_BITRATES_KBPS = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),  # MPEG-1
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),  # MPEG-2 / 2.5
+}
+_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+_TRAILING_TAGS = (b"TAG", b"APETAGEX", b"LYRICS")
+
+
+class Mp3Frames:
+    """The audio frames of an MP3 file: (offset, length) spans into data, plus the total sample count and rate.
+
+    Leading ID3v2 and trailing ID3v1 / APE tags are skipped, as is a Xing / Info / VBRI header frame (an encoder
+    metadata frame with no audio, whose frame count would be wrong for a joined file); the frame count it declares
+    is kept as declared_frames. Raises ValueError for data that is not Layer III MPEG audio or ends in a truncated
+    frame.
+    """
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.frames = []
+        self.samples = 0
+        self.sample_rate = None
+        self.declared_frames = None  # from the encoder's Xing / Info / VBRI header, if it has one
+        position = self._skip_id3v2(data)
+        while position < len(data):
+            header = self._parse_header(data, position)
+            if header is None:
+                if data.startswith(_TRAILING_TAGS, position):
+                    break
+                raise ValueError(f"Not an MPEG audio frame at byte {position}.")
+            length, samples, sample_rate, side_info = header
+            if position + length > len(data):
+                raise ValueError(f"Truncated MPEG audio frame at byte {position}.")
+            if not self.frames and self._is_info_frame(data, position, side_info):
+                self.declared_frames = self._declared_frames(data, position, side_info)
+                position += length
+                continue
+            if self.sample_rate is not None and sample_rate != self.sample_rate:
+                raise ValueError(f"Sample rate changes from {self.sample_rate} to {sample_rate} Hz.")
+            self.sample_rate = sample_rate
+            self.frames.append((position, length))
+            self.samples += samples
+            position += length
+
+    @staticmethod
+    def _skip_id3v2(data: bytes) -> int:
+        if len(data) < 10 or not data.startswith(b"ID3"):
+            return 0
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]  # synchsafe integer
+        return 10 + size + (10 if data[5] & 0x10 else 0)  # + footer
+
+    @staticmethod
+    def _parse_header(data: bytes, position: int):
+        """(frame length, samples, sample rate, side info size) of the Layer III frame header at position, or None."""
+        if position + 4 > len(data) or data[position] != 0xFF or data[position + 1] & 0xE0 != 0xE0:
+            return None
+        version = (data[position + 1] >> 3) & 0x3
+        layer = (data[position + 1] >> 1) & 0x3
+        bitrate_index = data[position + 2] >> 4
+        rate_index = (data[position + 2] >> 2) & 0x3
+        padding = (data[position + 2] >> 1) & 0x1
+        mono = data[position + 3] >> 6 == 3
+        if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+            return None  # reserved version, not Layer III, free-format or invalid bitrate / rate
+        sample_rate = _SAMPLE_RATES[version][rate_index]
+        bitrate = _BITRATES_KBPS[1 if version == 3 else 2][bitrate_index] * 1000
+        if version == 3:
+            return 144 * bitrate // sample_rate + padding, 1152, sample_rate, 17 if mono else 32
+        return 72 * bitrate // sample_rate + padding, 576, sample_rate, 9 if mono else 17
+
+    @staticmethod
+    def _is_info_frame(data: bytes, position: int, side_info: int) -> bool:
+        tag_at = position + 4 + side_info
+        return data[tag_at:tag_at + 4] in (b"Xing", b"Info") or data[position + 36:position + 40] == b"VBRI"
+
+    @staticmethod
+    def _declared_frames(data: bytes, position: int, side_info: int) -> int | None:
+        tag_at = position + 4 + side_info
+        if data[tag_at:tag_at + 4] in (b"Xing", b"Info"):
+            flags = int.from_bytes(data[tag_at + 4:tag_at + 8], "big")
+            return int.from_bytes(data[tag_at + 8:tag_at + 12], "big") if flags & 0x1 else None
+        return int.from_bytes(data[position + 50:position + 54], "big")  # VBRI
+
+    @property
+    def duration_seconds(self) -> float:
+        return self.samples / self.sample_rate if self.sample_rate else 0.0
+
+    def audio(self):
+        """The frames' bytes, in order, as memoryviews into data."""
+        view = memoryview(self.data)
+        return (view[offset:offset + length] for offset, length in self.frames)
+
+
+def concat_mp3(parts: list[bytes]) -> tuple[bytes, float]:
+    """Joins MP3 files losslessly by concatenating their audio frames; returns (mp3 bytes, duration in seconds).
+
+    Raises ValueError if a part cannot be parsed, the parts do not share a sample rate, or a part has fewer or more
+    audio frames than its encoder header declares (a part cut short, or with junk appended, at a frame boundary).
+    """
+    parsed = [Mp3Frames(part) for part in parts]
+    rates = {frames.sample_rate for frames in parsed if frames.sample_rate}
+    if len(rates) > 1:
+        raise ValueError(f"Cannot join MP3 parts with different sample rates: {sorted(rates)}.")
+    for number, frames in enumerate(parsed, start=1):
+        # Encoders differ on whether the count includes the header frame itself.
+        if frames.declared_frames is not None and len(frames.frames) not in (frames.declared_frames,
+                                                                             frames.declared_frames - 1):
+            raise ValueError(f"MP3 part {number} has {len(frames.frames)} audio frames; its header declares "
+                             f"{frames.declared_frames}.")
+    joined = b"".join(chunk for frames in parsed for chunk in frames.audio())
+    return joined, sum(frames.duration_seconds for frames in parsed)
@@ -0,0 +1,228 @@
+# narration.py
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from mp3_frames import concat_mp3
+from sentences import split_sentences
+from storage import StorageBucket
+from upload_streams import DEFAULT_CHUNK_SIZE, ChunkPipe
+
+CONTENT_TYPES = {"mp3": "audio/mpeg", "opus": "audio/ogg", "aac": "audio/aac", "flac": "audio/flac",
+                 "wav": "audio/wav"}
+
+
+def narration_key(script_text: str, voice_model: str, tts_model: str, response_format: str = "mp3") -> str:
+    """Content hash of a narration: everything that determines the synthesized audio."""
+    return hashlib.sha256(json.dumps([script_text, voice_model, tts_model, response_format]).encode()).hexdigest()
+
+
+class NarrationPublisher:
+    """OpenAI TTS audio published to a Supabase storage bucket, returning its public URL.
+
+    Objects are named by narration_key(), so a narration that was already published (the same script, voice,
+    model and format, e.g. a default line or a retried run) is found with one HEAD request and reused without
+    another TTS call or upload. Concurrent requests for the same narration in this process wait for the first.
+
+    By default the TTS response is streamed straight into the storage upload through a bounded in-memory
+    ChunkPipe (at most buffer_chunks * chunk_size bytes per narration), so nothing touches the disk and the upload
+    finishes shortly after synthesis does. With stream_upload=False the audio is first written to a private
+    scratch directory per narration (under scratch_dir), uploaded, and removed; concurrent narrations never share
+    a file either way.
+
+    Scripts of at least chunk_min_chars characters (mp3 only) are split at sentence boundaries into up to
+    tts_concurrency pieces, synthesized in parallel on a pool shared by every narration and joined frame by frame
+    (concat_mp3) into one file, so a long narration takes about as long as its longest piece.
+    """
+    SOURCE = "NARRATION"
+    OBJECT_PREFIX = "narration_openai_"
+    TTS_MAX_INPUT_CHARS = 4096  # OpenAI speech endpoint limit per request
+
+    def __init__(self, clients, openai_api_key: str | None, supabase_url: str | None, supabase_key: str | None,
+                 bucket: str, stream_upload: bool = True, scratch_dir: str | None = None,
+                 response_format: str = "mp3", chunk_size: int = DEFAULT_CHUNK_SIZE, buffer_chunks: int = 16,
+                 timeout: float | None = StorageBucket.DEFAULT_TIMEOUT_SECONDS, chunk_min_chars: int | None = None,
+                 tts_concurrency: int = 4, logger=None):
+        self.clients = clients
+        self.openai_api_key = openai_api_key
+        self.storage = StorageBucket(clients, supabase_url, supabase_key, bucket, timeout=timeout)
+        self.stream_upload = stream_upload
+        self.scratch_dir = scratch_dir
+        self.chunk_size = chunk_size
+        self.buffer_chunks = buffer_chunks
+        self.response_format = response_format
+        self.chunk_min_chars = chunk_min_chars
+        self.tts_concurrency = tts_concurrency
+        self._tts_pool = None
+        self.logger = logger or logging.getLogger(__name__)
+        self._inflight = {}  # narration key -> [lock, waiters]
+        self._lock = threading.Lock()
+        self.reused = 0
+        self.synthesized = 0
+
+    def _log(self, message: str, level: str = "info", source: str = SOURCE):
+        self.logger.log(logging.ERROR if level == "error" else logging.WARNING if level == "warning"
+                        else logging.INFO, f"({source}) {message}")
+
+    @property
+    def content_type(self) -> str:
+        return CONTENT_TYPES.get(self.response_format, "application/octet-stream")
+
+    def object_name(self, script_text: str, voice_model: str, tts_model: str) -> str:
+        return f"{self.OBJECT_PREFIX}{narration_key(script_text, voice_model, tts_model, self.response_format)}." \
+               f"{self.response_format}"
+
+    def publish(self, script_text: str, voice_model: str, tts_model: str, log=None) -> str | None:
+        """Public URL of the narration of script_text, synthesizing and uploading it unless it is already stored;
+        None on failure."""
+        log = log or self._log
+        if not self.storage.configured:
+            log("Supabase URL/Key not configured.", "error", "SUPABASE")
+            return None
+        object_name = self.object_name(script_text, voice_model, tts_model)
+        with self._lock:
+            entry = self._inflight.setdefault(object_name, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                if self.storage.exists(object_name, log):
+                    self.reused += 1
+                    log(f"Narration already in storage as '{object_name}'; skipping TTS and upload.", "info",
+                        "SUPABASE")
+                    return self.storage.public_url(object_name, log)
+                if not self.openai_api_key:
+                    log("OpenAI API Key not configured for TTS.", "error", "OPENAI_TTS")
+                    return None
+                log(f"Synthesizing speech (voice: {voice_model}, model: {tts_model}) into "
+                    f"'{self.storage.bucket}/{object_name}'...", "info", "OPENAI_TTS")
+                # None: not chunked, or the chunks could not be joined; synthesize in one request instead.
+                uploaded = self._chunked_to_storage(script_text, voice_model, tts_model, object_name, log) \
+                    if self._should_chunk(script_text) else None
+                if uploaded is None:
+                    upload = self._stream_to_storage if self.stream_upload else self._spill_to_storage
+                    uploaded = upload(script_text, voice_model, tts_model, object_name, log)
+                if not uploaded:
+                    return None
+                self.synthesized += 1
+                public_url = self.storage.public_url(object_name, log)
+                if public_url:
+                    log(f"Narration uploaded. URL: {public_url}", "success", "SUPABASE")
+                return public_url
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._inflight[object_name]
+
+    def stats(self) -> dict:
+        return {"reused": self.reused, "synthesized": self.synthesized}
+
+    def _speech(self, script_text: str, voice_model: str, tts_model: str):
+        return self.clients.openai(self.openai_api_key).audio.speech.with_streaming_response.create(
+            model=tts_model, voice=voice_model, input=script_text,
+            response_format=self.response_format)
+
+    def _stream_to_storage(self, script_text: str, voice_model: str, tts_model: str, object_name: str,
+                           log) -> bool:
+        pipe = ChunkPipe(self.buffer_chunks)
+        failure = []
+
+        def synthesize():
+            try:
+                with self._speech(script_text, voice_model, tts_model) as response:
+                    for chunk in response.iter_bytes(self.chunk_size):
+                        if not pipe.write(chunk):
+                            return  # the upload failed; stop reading the TTS response
+                pipe.close()
+            except Exception as e:
+                failure.append(e)
+                pipe.fail(e)
+
+        producer = threading.Thread(target=synthesize, name="narration-tts", daemon=True)
+        producer.start()
+        try:
+            uploaded = self.storage.upload(object_name, iter(pipe), self.content_type, log)
+        finally:
+            pipe.abort()
+            producer.join()
+        if failure:
+            log(f"OpenAI TTS error: {failure[0]}", "error", "OPENAI_TTS")
+            return False
+        if uploaded:
+            log(f"Streamed {pipe.bytes_written:,} bytes of narration to storage.", "info", "SUPABASE")
+        return uploaded
+
+    def _spill_to_storage(self, script_text: str, voice_model: str, tts_model: str, object_name: str,
+                          log) -> bool:
+        if self.scratch_dir:
+            os.makedirs(self.scratch_dir, exist_ok=True)
+        job_dir = tempfile.mkdtemp(prefix="narration_", dir=self.scratch_dir)
+        try:
+            local_audio_file = os.path.join(job_dir, f"narration.{self.response_format}")
+            try:
+                with self._speech(script_text, voice_model, tts_model) as response:
+                    response.stream_to_file(local_audio_file)
+            except Exception as e:
+                log(f"OpenAI TTS error: {e}", "error", "OPENAI_TTS")
+                return False
+            with open(local_audio_file, "rb") as f:
+                return self.storage.upload(object_name, f, self.content_type, log)
+        finally:
+            shutil.rmtree(job_dir, ignore_errors=True)
+
+    def _should_chunk(self, script_text: str) -> bool:
+        return bool(self.chunk_min_chars) and self.response_format == "mp3" and self.tts_concurrency > 1 \
+            and len(script_text) >= self.chunk_min_chars
+
+    def _split_script(self, script_text: str) -> list[str]:
+        """Whole sentences packed into up to tts_concurrency pieces of similar length (more if a piece would exceed
+        the TTS input limit)."""
+        target = min(self.TTS_MAX_INPUT_CHARS, max(1, -(-len(script_text) // self.tts_concurrency)))
+        pieces = []
+        for sentence in split_sentences(script_text):
+            if pieces and len(pieces[-1]) < target and len(pieces[-1]) + 1 + len(sentence) <= self.TTS_MAX_INPUT_CHARS:
+                pieces[-1] += " " + sentence
+            else:
+                pieces.append(sentence)
+        return pieces
+
+    @property
+    def tts_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._tts_pool is None:
+                self._tts_pool = ThreadPoolExecutor(max_workers=self.tts_concurrency,
+                                                    thread_name_prefix="narration-tts")
+            return self._tts_pool
+
+    def _synthesize(self, script_text: str, voice_model: str, tts_model: str) -> bytes:
+        with self._speech(script_text, voice_model, tts_model) as response:
+            return b"".join(response.iter_bytes(self.chunk_size))
+
+    def _chunked_to_storage(self, script_text: str, voice_model: str, tts_model: str, object_name: str,
+                            log) -> bool | None:
+        pieces = self._split_script(script_text)
+        if len(pieces) < 2:
+            return None
+        log(f"Synthesizing {len(pieces)} script pieces in parallel (up to {self.tts_concurrency} at a time)...",
+            "info", "OPENAI_TTS")
+        futures = [self.tts_pool.submit(self._synthesize, piece, voice_model, tts_model) for piece in pieces]
+        try:
+            parts = [future.result() for future in futures]
+        except Exception as e:
+            for future in futures:
+                future.cancel()
+            log(f"OpenAI TTS error: {e}", "error", "OPENAI_TTS")
+            return False
+        try:
+            audio, duration = concat_mp3(parts)
+        except ValueError as e:
+            log(f"Could not join the narration pieces ({e}); synthesizing it in one request.", "warning",
+                "OPENAI_TTS")
+            return None
+        log(f"Joined {len(parts)} pieces: {duration:.1f}s of narration, {len(audio):,} bytes.", "info", "OPENAI_TTS")
+        return self.storage.upload(object_name, audio, self.content_type, log)
@@ -0,0 +1,719 @@
+# pipeline.py
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait as wait_for_futures
+from functools import partial
+
+from services import PipelineServices
+
+# Per-run inputs; anything not supplied falls back to these. merge_fields maps Shotstack merge keys to values
+# (AVATAR_VIDEO and NARRATION_AUDIO_SRC are filled in by the pipeline).
+DEFAULT_INPUTS = {
+    "property_description": "",
+    "target_duration_seconds": 25,
+    "words_per_second": 2.5,
+    "gemini_model": "gemini-1.5-flash-latest",
+    "fresh_script": False,  # bypass the Gemini script cache
+    "photo_path": None,
+    "photo_name": None,
+    "default_talking_photo_id": None,
+    "voice_id": None,
+    "test_mode": False,
+    "add_captions": False,
+    "dimension": "720p",
+    "enable_bg_narration": False,
+    "bg_narration_script": "",
+    "tts_voice": "alloy",
+    "tts_model": "tts-1",
+    "shotstack_template_id": None,
+    "shotstack_owner_id": None,
+    "merge_fields": {},
+}
+# Shotstack template merge fields in template order, with the template's placeholder values.
+DEFAULT_MERGE_FIELDS = [
+    {"find": "AVATAR_VIDEO", "replace": ""},
+    {"find": "IMAGE_SRC",
+     "replace": "https://i2.au.reastatic.net/642x428-crop,format=webp/d41a22cf2369799b3edde708985e50131940373a342da7a122d0801eeb3936e0/image.jpg"},
+    {"find": "IMAGE_SRC_2",
+     "replace": "https://i2.au.reastatic.net/642x428-crop,format=webp/cd50511e31af7da9cf991de96ef294fd2fc64f14a7d67ca1dbd701541d6973ad/image.jpg"},
+    {"find": "IMAGE_SRC_3",
+     "replace": "https://i2.au.reastatic.net/642x428-crop,format=webp/067c4f6c74e9c0e3740cffb0d30d717108419f2a2cf8011a613808354c767b5a/image.jpg"},
+    {"find": "IMAGE_SRC_4",
+     "replace": "https://i2.au.reastatic.net/642x428-crop,format=webp/96f370a3af180544087c634a431f652ba8f452f0b29d69ba4f9a1684a8871fc1/image.jpg"},
+    {"find": "IMAGE_SRC_5",
+     "replace": "https://i2.au.reastatic.net/642x428-crop,format=webp/a8c253abd19c622b6ed15bcce357f70946dd9a98c56fc721664f1b610cf4e0f8/image.jpg"},
+    {"find": "IMAGE_SRC_6",
+     "replace": "https://i2.au.reastatic.net/642x428-crop,format=webp/4e989518bb940cf2ecca14896ffd84e91a7ac8053e3dc21f98b9d78477b4f275/image.jpg"},
+    {"find": "IMAGE_SRC_7",
+     "replace": "https://i2.au.reastatic.net/642x428-crop,format=webp/080956c133ab030da15d7a2c13de132a201568b9c026bf15f0af414d2aeadef5/image.jpg"},
+    {"find": "IMAGE_SRC_8",
+     "replace": "https://i2.au.reastatic.net/642x428-crop,format=webp/13903d93b2b87f53177af5c4dac37e547c36ec4fec3996db3633658d8fbbb1a3/image.jpg"},
+    {"find": "PRODUCT_NAME", "replace": "PRODUCT NAME"},
+    {"find": "BRAND_NAME", "replace": "BRAND NAME"},
+    {"find": "PRODUCT_CTA", "replace": "FREE DELIVERY"},
+    {"find": "PRODUCT_TEXT", "replace": "YOUR TEXT GOES HERE"},
+    {"find": "LOGO_SRC",
+     "replace": "https://templates.shotstack.io/holiday-season-glam-template/68d19af4-20b9-41af-a999-1b3838a8bd6d/source.png"},
+    {"find": "PRODUCT_SUBTITLE", "replace": "YOUR SUBTITLE GOES HERE"},
+    {"find": "NARRATION_AUDIO_SRC", "replace": ""}
+]
+
+# User-editable merge fields that Shotstack fetches as media, checked by the media_preflight stage before any paid
+# work. AVATAR_VIDEO and NARRATION_AUDIO_SRC are produced by the pipeline itself.
+PREFLIGHT_MERGE_FIELDS = {"IMAGE_SRC": "image", "IMAGE_SRC_2": "image", "IMAGE_SRC_3": "image",
+                          "IMAGE_SRC_4": "image", "IMAGE_SRC_5": "image", "IMAGE_SRC_6": "image",
+                          "IMAGE_SRC_7": "image", "IMAGE_SRC_8": "image", "LOGO_SRC": "image"}
+
+# While waiting on a vendor job the run's status line is refreshed at least this often.
+PROGRESS_INTERVAL_SECONDS = 15.0
+
+
+class PipelineError(Exception):
+    """A stage could not produce its outputs; the message is shown to the user."""
+
+
+class PipelineRun:
+    """State of one video production run: inputs, per-stage outputs, progress and logs.
+
+    Written by the engine's worker thread and read by any number of viewers; snapshot() returns a consistent
+    copy, and version increases on every change so a viewer can tell whether anything happened. With a store
+    attached, every change and stage transition is also persisted (see job_store.JobStore).
+    """
+    QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+    MAX_LOG_ENTRIES = 150
+
+    def __init__(self, inputs: dict, run_id: str | None = None):
+        self.run_id = run_id or uuid.uuid4().hex
+        self.inputs = {**DEFAULT_INPUTS, **inputs}
+        self.state = self.QUEUED
+        self.stage = None  # most recently started stage, or the one that failed
+        self.stages_active = []
+        self.stages_done = []
+        self.stage_status = {}  # stage -> latest progress message
+        self.status_message = "Queued"
+        self.outputs = {}
+        self.error = None
+        self.logs = []
+        self.created_at = time.time()
+        self.finished_at = None
+        self.version = 0
+        self.cancelled = threading.Event()  # set once the run has failed or been abandoned; stages give up
+        self.store = None
+        self._changed = threading.Condition()
+
+    def __repr__(self):
+        return f"<PipelineRun {self.run_id} state={self.state} stage={self.stage}>"
+
+    @classmethod
+    def from_record(cls, record: dict) -> "PipelineRun":
+        """Rebuilds a run saved by a JobStore, as it was at its last commit."""
+        run = cls(record["inputs"], run_id=record["run_id"])
+        run.state, run.stage, run.error = record["state"], record["stage"], record["error"]
+        run.stages_active = list(record["stages_active"])
+        run.stages_done = list(record["stages_done"])
+        run.stage_status = dict(record["stage_status"])
+        run.status_message = record["status_message"]
+        run.outputs = dict(record["outputs"])
+        run.logs = list(record["logs"])
+        run.created_at, run.finished_at = record["created_at"], record["finished_at"]
+        return run
+
+    def _touch(self):
+        # Caller holds self._changed.
+        self.version += 1
+        self._changed.notify_all()
+        if self.store is not None:
+            self.store.mark_dirty(self)
+
+    def _record_event(self, stage: str | None, event: str):
+        if self.store is not None:
+            self.store.record_event(self.run_id, stage, event)
+
+    def checkpoint(self):
+        """Writes the run to its store now rather than with the next batched commit."""
+        if self.store is not None:
+            self.store.mark_dirty(self)
+            self.store.flush()
+
+    def log(self, message: str, level: str = "info", source: str = "PIPELINE"):
+        """Same signature as main_app.log_message; newest entries first."""
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+        log_entry = f"[{timestamp}] ({source} - {level.upper()}): {message}"
+        logging.getLogger(__name__).info(f"run {self.run_id[:8]} {log_entry}")
+        with self._changed:
+            self.logs.insert(0, log_entry)
+            del self.logs[self.MAX_LOG_ENTRIES:]
+            self._touch()
+
+    def set_status(self, stage: str, message: str):
+        with self._changed:
+            self.stage_status[stage] = message
+            self.status_message = message
+            self._touch()
+
+    def set_outputs(self, **outputs):
+        with self._changed:
+            self.outputs.update(outputs)
+            self._touch()
+
+    def _start(self):
+        with self._changed:
+            self.state = self.RUNNING
+            self._touch()
+
+    def _begin_stage(self, stage: str, message: str):
+        with self._changed:
+            self.stage = stage
+            self.stages_active.append(stage)
+            self.stage_status[stage] = self.status_message = message
+            self._record_event(stage, "started")
+            self._touch()
+
+    def _end_stage(self, stage: str, outputs: dict | None = None, succeeded: bool = True):
+        with self._changed:
+            self.stages_active.remove(stage)
+            if succeeded:
+                self.outputs.update(outputs or {})
+                self.stages_done.append(stage)
+            self._record_event(stage, "done" if succeeded else "failed")
+            self._touch()
+
+    def _finish(self, state: str, error: str | None = None, stage: str | None = None):
+        with self._changed:
+            if self.finished:
+                return
+            self.state, self.error, self.finished_at = state, error, time.time()
+            self.stage = stage or self.stage
+            self.status_message = error or "Done"
+            if state == self.FAILED:
+                self.cancelled.set()
+            self._record_event(self.stage, state)
+            self._touch()
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (self.DONE, self.FAILED)
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Blocks until the run is done or failed; returns whether it finished."""
+        with self._changed:
+            return self._changed.wait_for(lambda: self.finished, timeout=timeout)
+
+    def snapshot(self) -> dict:
+        with self._changed:
+            return {"run_id": self.run_id, "state": self.state, "stage": self.stage,
+                    "stages_active": list(self.stages_active), "stages_done": list(self.stages_done),
+                    "stage_status": dict(self.stage_status), "status_message": self.status_message,
+                    "outputs": dict(self.outputs), "error": self.error, "logs": list(self.logs),
+                    "created_at": self.created_at, "finished_at": self.finished_at, "version": self.version}
+
+
+def merge_field_list(merge_fields: dict, defaults: list[dict]) -> list[dict]:
+    """Shotstack merge list in the template's field order: values from merge_fields, else the template default."""
+    merge = []
+    for field in defaults:
+        value = merge_fields.get(field["find"], field["replace"])
+        merge.append({"find": field["find"], "replace": "" if value is None else value})
+    return merge
+
+
+def _reattach_vendor_job(job, callback_kind: str, callbacks, callback_ref: str | None = None):
+    """Job handle for a vendor job submitted before a restart: polled from now on, and resolved by its callback
+    too if one still arrives (the callback URL, whose ref the run saved, stays valid when CALLBACK_SECRET is fixed)."""
+    if callbacks is not None:
+        callbacks.register(callback_kind, job.job_id, job, ref=callback_ref)
+    return job
+
+
+def _wait_for_vendor_job(run: PipelineRun, stage: str, job, callback_kind: str, callbacks, timeout_seconds: float,
+                         label: str):
+    """Blocks on a HeyGen/Shotstack job (woken by its callback when enabled) while keeping the run's status fresh.
+
+    Gives up early if another stage fails the run.
+    """
+    deadline = time.monotonic() + timeout_seconds
+    last_status = None
+    try:
+        while not job.wait(timeout=min(PROGRESS_INTERVAL_SECONDS, max(0.0, deadline - time.monotonic()))):
+            if job.last_status != last_status:
+                last_status = job.last_status
+                run.log(f"{label} {job.job_id} status: {last_status} after {job.polls} checks.", "info", "PIPELINE")
+            run.set_status(stage, f"Waiting for {label} (ID: {job.job_id}). Status: {last_status or 'submitted'}...")
+            if run.cancelled.is_set():
+                raise PipelineError(f"Stopped waiting for {label} {job.job_id}: the run failed.")
+            if time.monotonic() >= deadline:
+                raise PipelineError(f"{label} {job.job_id} not finished after {timeout_seconds:.0f}s "
+                                    f"(last status: {last_status}).")
+    finally:
+        if callbacks is not None:
+            callbacks.unregister(callback_kind, job.job_id)
+
+
+def _ensure_not_cancelled(run: PipelineRun, action: str):
+    """Raises instead of starting something billable (a vendor submit) for a run that has failed or been abandoned."""
+    if run.cancelled.is_set():
+        raise PipelineError(f"Not {action}: the run was stopped.")
+
+
+# --- Stages ---
+# Each stage takes (run, services), reads run.inputs / run.outputs and returns the outputs it adds.
+def stage_media_preflight(run: PipelineRun, services: PipelineServices, merge_field_defaults: list[dict]) -> dict:
+    """Outputs: media_checks ({merge key: probe result}); fails the run if a media URL would fail the render."""
+    if services.media_preflight is None:
+        return {"media_checks": {}}
+    merge = merge_field_list(run.inputs["merge_fields"], merge_field_defaults)
+    fields = {field["find"]: field["replace"] for field in merge
+              if field["find"] in PREFLIGHT_MERGE_FIELDS and field["replace"]}
+    run.set_status("media_preflight", f"Checking {len(fields)} media URL(s)...")
+    checks = {}
+    for kind in sorted(set(PREFLIGHT_MERGE_FIELDS[key] for key in fields)):
+        of_kind = {key: url for key, url in fields.items() if PREFLIGHT_MERGE_FIELDS[key] == kind}
+        results = services.media_preflight.check_all(list(of_kind.values()), kind)
+        checks.update({key: results[url] for key, url in of_kind.items()})
+    problems = [f"{key}: {check['error']}" for key, check in checks.items() if not check["ok"]]
+    for key, check in checks.items():
+        if check["ok"]:
+            size = f"{check['width']}x{check['height']}, " if check.get("width") else ""
+            run.log(f"{key} OK ({size}{check['content_type']}).", "debug", "PREFLIGHT")
+    if problems:
+        raise PipelineError("Media URLs Shotstack could not use: " + "; ".join(problems))
+    run.log(f"All {len(checks)} media URL(s) passed preflight.", "info", "PREFLIGHT")
+    return {"media_checks": checks}
+
+
+def stage_media_mirroring(run: PipelineRun, services: PipelineServices, merge_field_defaults: list[dict]) -> dict:
+    """Outputs: mirrored_media ({merge key: URL in our bucket}) for the images that could be re-hosted, downscaled
+    to the template's output frame; the others keep their original URLs."""
+    if services.media_mirror is None:
+        return {"mirrored_media": {}}
+    merge = merge_field_list(run.inputs["merge_fields"], merge_field_defaults)
+    fields = {field["find"]: field["replace"] for field in merge
+              if PREFLIGHT_MERGE_FIELDS.get(field["find"]) == "image" and field["replace"]}
+    max_side = None
+    if services.shotstack_client is not None and run.inputs["shotstack_template_id"]:
+        max_side = services.shotstack_client.output_max_side(run.inputs["shotstack_template_id"])
+    if max_side is None:
+        run.log("Template output size unknown; mirroring images at their original size.", "warning", "MIRROR")
+    run.set_status("media_mirroring", f"Mirroring {len(fields)} image(s) to storage...")
+    mirrored = services.media_mirror.mirror_images(list(fields.values()), max_side, log=run.log)
+    mirrored_media = {key: mirrored[url] for key, url in fields.items() if url in mirrored}
+    run.log(f"Mirrored {len(mirrored_media)} of {len(fields)} image(s)"
+            f"{f' (longest side {max_side}px)' if max_side else ''}.", "info", "MIRROR")
+    return {"mirrored_media": mirrored_media}
+
+
+def stage_avatar_script_generation(run: PipelineRun, services: PipelineServices) -> dict:
+    """Outputs: avatar_script (and avatar_script_draft, the text so far, while Gemini streams it)."""
+    def show_draft(text_so_far: str):
+        run.set_outputs(avatar_script_draft=text_so_far)
+        run.set_status("avatar_script_generation", f"Gemini is writing the script ({len(text_so_far.split())} "
+                                                   f"words so far)...")
+
+    script = services.generate_script(run.inputs["property_description"], run.inputs["target_duration_seconds"],
+                                      run.inputs["words_per_second"], run.inputs["gemini_model"],
+                                      fresh=run.inputs["fresh_script"], on_text=show_draft, log=run.log)
+    if not script or "Error:" in script:
+        raise PipelineError(f"Avatar script generation failed: {script}")
+    return {"avatar_script": script}
+
+
+def stage_heygen_avatar_setup(run: PipelineRun, services: PipelineServices) -> dict:
+    """Outputs: talking_photo_id, plus avatar_lease when a custom photo was used."""
+    if services.heygen_client is None:
+        raise PipelineError("HeyGen client not initialized (API Key issue?).")
+    photo_path, photo_name = run.inputs["photo_path"], run.inputs["photo_name"]
+    if not (photo_path and photo_name):
+        default_tp_id = run.inputs["default_talking_photo_id"]
+        if not default_tp_id:
+            raise PipelineError("Default HeyGen Talking Photo ID not set and no photo uploaded.")
+        run.log(f"SDK: Using default HeyGen Talking Photo ID: {default_tp_id}", "info", "HEYGEN_SETUP")
+        return {"talking_photo_id": default_tp_id}
+
+    run.set_status("heygen_avatar_setup", f"Preparing HeyGen avatar for '{photo_name}' (first use of a photo may take a minute)...")
+    prepared_path, prepared_name = services.prepare_avatar_photo(photo_path, photo_name, run.inputs["dimension"],
+                                                                 log=run.log)
+    try:
+        _ensure_not_cancelled(run, "creating a HeyGen avatar")
+        # Reuses a ready look for this (or a near-identical) photo; only builds a new group on a cache miss.
+        # The prepared file is hashed and uploaded straight from disk (memory-mapped), never loaded whole.
+        lease = services.acquire_avatar(prepared_path, prepared_name, log=run.log)
+    finally:
+        if prepared_path != photo_path:
+            try:
+                os.remove(prepared_path)
+            except OSError:
+                pass
+    if not lease:
+        raise PipelineError("SDK: Failed to get a usable Talking Photo ID for the uploaded photo.")
+    run.log(f"SDK: Using Talking Photo ID {lease['look_id']} from {'cached' if lease['reused'] else 'new'} "
+            f"avatar group {lease['group_id']}", "info", "HEYGEN_SETUP")
+    return {"talking_photo_id": lease["look_id"], "avatar_lease": lease}
+
+
+def stage_heygen_video_processing(run: PipelineRun, services: PipelineServices,
+                                  timeout_seconds: float = 3600) -> dict:
+    """Outputs: heygen_video_id, heygen_video_url. Releases the avatar lease once the video is rendered."""
+    if run.outputs.get("heygen_video_id"):  # submitted (and paid for) before a restart: pick the render back up
+        video_job = _reattach_vendor_job(services.heygen_client.video_job(run.outputs["heygen_video_id"]), "heygen",
+                                         services.callbacks, run.outputs.get("heygen_callback_ref"))
+        run.log(f"SDK: Resuming HeyGen video {video_job.job_id} submitted before the restart.", "info",
+                "HEYGEN_PROCESS")
+    else:
+        _ensure_not_cancelled(run, "submitting the HeyGen video")
+        run.set_status("heygen_video_processing", "Submitting video to HeyGen...")
+        video_job = services.heygen_client.submit_video(
+            text_script=run.outputs["avatar_script"], voice_id=run.inputs["voice_id"],
+            title=f"Avatar for {run.inputs['merge_fields'].get('PRODUCT_NAME') or 'Video'}",
+            test_mode=run.inputs["test_mode"], add_caption=run.inputs["add_captions"],
+            dimension_preset=run.inputs["dimension"], talking_photo_id=run.outputs["talking_photo_id"],
+            callbacks=services.callbacks)
+        if not video_job:
+            raise PipelineError("SDK: Failed to submit HeyGen video job.")
+        run.set_outputs(heygen_video_id=video_job.job_id, heygen_callback_ref=video_job.callback_ref)
+        run.checkpoint()
+        run.log(f"SDK: HeyGen video submitted. ID: {video_job.job_id}", "info", "HEYGEN_PROCESS")
+    _wait_for_vendor_job(run, "heygen_video_processing", video_job, "heygen", services.callbacks, timeout_seconds,
+                         "HeyGen video")
+    if not video_job.succeeded:
+        raise PipelineError(f"SDK: HeyGen video failed: {video_job.error_message}")
+    run.log(f"SDK: HeyGen video completed after {video_job.polls} status checks. URL: {video_job.result}",
+            "success", "HEYGEN_PROCESS")
+    services.release_avatar(run.outputs.pop("avatar_lease", None), log=run.log)
+    return {"heygen_video_url": video_job.result}
+
+
+def stage_avatar_video_mirroring(run: PipelineRun, services: PipelineServices) -> dict:
+    """Outputs: avatar_video_url, the HeyGen video re-hosted in our bucket (its signed HeyGen link expires), or the
+    HeyGen URL itself if mirroring is off or fails."""
+    heygen_video_url = run.outputs["heygen_video_url"]
+    if services.media_mirror is None:
+        return {"avatar_video_url": heygen_video_url}
+    run.set_status("avatar_video_mirroring", "Copying the avatar video to storage...")
+    mirrored_url = services.media_mirror.mirror_video(heygen_video_url, log=run.log)
+    if not mirrored_url:
+        run.log("Avatar video not mirrored; Shotstack will fetch it from HeyGen.", "warning", "MIRROR")
+    return {"avatar_video_url": mirrored_url or heygen_video_url}
+
+
+def stage_optional_narration_processing(run: PipelineRun, services: PipelineServices) -> dict:
+    """Outputs: narration_audio_url ("" when disabled or on failure; narration is optional)."""
+    if not run.inputs["enable_bg_narration"]:
+        return {"narration_audio_url": ""}
+    script = run.inputs["bg_narration_script"]
+    if not script:
+        product_name = run.inputs["merge_fields"].get("PRODUCT_NAME") or "this amazing opportunity"
+        script = f"Welcome! Discover more about {product_name}."
+        run.log(f"Using default script for optional BG narration: '{script}'", "info", "OPENAI_TTS")
+    run.set_status("optional_narration_processing", "Generating and uploading optional BG narration audio...")
+    url = services.generate_background_narration_url(script, run.inputs["tts_voice"], run.inputs["tts_model"],
+                                                     log=run.log)
+    if not url:
+        run.log("Optional BG narration failed.", "warning", "OPENAI_TTS/SUPABASE")
+    return {"narration_audio_url": url or ""}
+
+
+def stage_shotstack_processing(run: PipelineRun, services: PipelineServices, merge_field_defaults: list[dict],
+                               timeout_seconds: float = 1800) -> dict:
+    """Outputs: shotstack_render_id, shotstack_video_url."""
+    if services.shotstack_client is None:
+        raise PipelineError("Shotstack API Key missing.")
+    if run.outputs.get("shotstack_render_id"):  # submitted before a restart
+        render_job = _reattach_vendor_job(services.shotstack_client.render_job(run.outputs["shotstack_render_id"]),
+                                          "shotstack", services.callbacks, run.outputs.get("shotstack_callback_ref"))
+        run.log(f"Resuming Shotstack render {render_job.job_id} submitted before the restart.", "info", "SHOTSTACK")
+    else:
+        avatar_video_url = run.outputs.get("avatar_video_url") or run.outputs.get("heygen_video_url", "")
+        merge_fields = {**run.inputs["merge_fields"], **run.outputs.get("mirrored_media", {}),
+                        "AVATAR_VIDEO": avatar_video_url,
+                        "NARRATION_AUDIO_SRC": run.outputs.get("narration_audio_url", "")}
+        merge = merge_field_list(merge_fields, merge_field_defaults)
+        _ensure_not_cancelled(run, "submitting the Shotstack render")
+        run.set_status("shotstack_processing", "Submitting video to Shotstack...")
+        # Queues behind the shared per-key rate limiter; 429s are retried after Retry-After inside the client.
+        render_job = services.shotstack_client.submit_render(run.inputs["shotstack_template_id"], merge,
+                                                             run.inputs["shotstack_owner_id"],
+                                                             callbacks=services.callbacks)
+        if render_job is None:
+            raise PipelineError(f"Shotstack API submission failed: {services.shotstack_client.last_error}")
+        run.set_outputs(shotstack_render_id=render_job.job_id, shotstack_callback_ref=render_job.callback_ref)
+        run.checkpoint()
+        run.log(f"Shotstack job submitted. ID: {render_job.job_id}", "info", "SHOTSTACK")
+    _wait_for_vendor_job(run, "shotstack_processing", render_job, "shotstack", services.callbacks, timeout_seconds,
+                         "Shotstack render")
+    if not render_job.succeeded:
+        run.set_outputs(shotstack_render_data=render_job.render_data)
+        raise PipelineError(f"Shotstack rendering failed: {render_job.error_message}")
+    run.log(f"Shotstack video completed after {render_job.polls} status checks. URL: {render_job.result}",
+            "success", "SHOTSTACK")
+    return {"shotstack_video_url": render_job.result}
+
+
+class PipelineEngine:
+    """Runs video productions in background worker threads, independent of any page or session.
+
+    Stages form a dependency graph (STAGE_DEPENDENCIES): each takes explicit inputs (run.inputs plus the outputs
+    of the stages it depends on), and every stage whose dependencies are done runs at once on the shared stage
+    pool, so a run takes as long as its critical path (media preflight -> avatar setup or script -> HeyGen video
+    -> avatar video mirroring -> Shotstack) rather than the sum of its stages. The first failure fails the run
+    immediately; stages already in flight are allowed to wind down before the avatar lease is released. Media URLs
+    are checked first, so a broken listing image fails the run before anything is paid for, and with mirroring on
+    Shotstack fetches every image and the avatar video from our own bucket rather than the original hosts.
+
+    submit() returns a PipelineRun handle immediately and does not validate; call validate() first. Runs are
+    kept (for viewers that reconnect) until retention_seconds after they finish. With a JobStore, runs are also
+    persisted, and resume_unfinished() picks up the runs a previous process left behind at the stage they were
+    in: finished stages are not redone, and submitted HeyGen / Shotstack jobs are waited on, not resubmitted.
+
+    With a JobQueue as well, the engine only produces work: submit() enqueues the run for worker processes
+    (pipeline_worker.py) and get() reads its progress back from the store.
+    """
+    STAGES = ("media_preflight", "media_mirroring", "avatar_script_generation", "heygen_avatar_setup",
+              "heygen_video_processing", "avatar_video_mirroring", "optional_narration_processing",
+              "shotstack_processing")
+    STAGE_DEPENDENCIES = {
+        "media_preflight": (),  # cheap and usually cached; gates every stage that costs money
+        "media_mirroring": ("media_preflight",),
+        "avatar_script_generation": ("media_preflight",),
+        "heygen_avatar_setup": ("media_preflight",),  # the photo upload / group / looks do not need the script
+        "heygen_video_processing": ("avatar_script_generation", "heygen_avatar_setup"),
+        "avatar_video_mirroring": ("heygen_video_processing",),
+        "optional_narration_processing": ("media_preflight",),  # narration has its own script
+        "shotstack_processing": ("media_mirroring", "avatar_video_mirroring", "optional_narration_processing"),
+    }
+    # Stages of one run that can be in flight together (image mirroring, script, avatar setup and narration).
+    MAX_PARALLEL_STAGES = 4
+    # Vendor each stage mostly waits on; vendor_concurrency caps how many such stages run at once across all runs.
+    STAGE_VENDORS = {
+        "media_preflight": "media",
+        "media_mirroring": "storage",
+        "avatar_script_generation": "gemini",
+        "heygen_avatar_setup": "heygen",
+        "heygen_video_processing": "heygen",
+        "avatar_video_mirroring": "storage",
+        "optional_narration_processing": "openai",
+        "shotstack_processing": "shotstack",
+    }
+    STAGE_LABELS = {
+        "media_preflight": "🔎 Checking media URLs",
+        "media_mirroring": "🗂️ Mirroring listing images",
+        "avatar_script_generation": "📝 Generating script for HeyGen Avatar",
+        "heygen_avatar_setup": "👤 Setting up HeyGen Avatar",
+        "heygen_video_processing": "🗣️ Processing HeyGen Avatar Video",
+        "avatar_video_mirroring": "🗂️ Mirroring HeyGen Avatar Video",
+        "optional_narration_processing": "🎤 Processing Optional Background Narration",
+        "shotstack_processing": "🎞️ Processing Final Video with Shotstack",
+    }
+
+    def __init__(self, services: PipelineServices, merge_field_defaults: list[dict] | None = None,
+                 max_workers: int = 4, heygen_video_timeout_seconds: float = 3600,
+                 shotstack_render_timeout_seconds: float = 1800, retention_seconds: float = 24 * 3600,
+                 vendor_concurrency: dict | None = None, store=None, queue=None, logger=None):
+        self.services = services
+        self.store = store
+        self.queue = queue
+        self.merge_field_defaults = merge_field_defaults = merge_field_defaults or DEFAULT_MERGE_FIELDS
+        self.vendor_slots = {vendor: threading.BoundedSemaphore(limit)
+                             for vendor, limit in (vendor_concurrency or {}).items() if limit}
+        self.retention_seconds = retention_seconds
+        self.logger = logger or logging.getLogger(__name__)
+        self.stage_functions = {
+            "media_preflight": partial(stage_media_preflight, merge_field_defaults=merge_field_defaults),
+            "media_mirroring": partial(stage_media_mirroring, merge_field_defaults=merge_field_defaults),
+            "avatar_script_generation": stage_avatar_script_generation,
+            "heygen_avatar_setup": stage_heygen_avatar_setup,
+            "heygen_video_processing": partial(stage_heygen_video_processing,
+                                               timeout_seconds=heygen_video_timeout_seconds),
+            "avatar_video_mirroring": stage_avatar_video_mirroring,
+            "optional_narration_processing": stage_optional_narration_processing,
+            "shotstack_processing": partial(stage_shotstack_processing, merge_field_defaults=merge_field_defaults,
+                                            timeout_seconds=shotstack_render_timeout_seconds),
+        }
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pipeline")
+        # Separate from the run pool: run threads block on their stages, so sharing a pool could deadlock.
+        self._stage_executor = ThreadPoolExecutor(max_workers=max_workers * self.MAX_PARALLEL_STAGES,
+                                                  thread_name_prefix="pipeline-stage")
+        self._runs = {}
+        self._lock = threading.Lock()
+
+    def validate(self, inputs: dict) -> list[str]:
+        """Problems that would make a run fail up front (missing keys / IDs); empty if the inputs are usable."""
+        inputs = {**DEFAULT_INPUTS, **inputs}
+        services = self.services
+        problems = []
+        if not services.heygen_client: problems.append("HeyGen Client not initialized (API Key issue?).")
+        if not inputs["property_description"]: problems.append("Property description is required.")
+        if not inputs["photo_path"] and not inputs["default_talking_photo_id"]:
+            problems.append("Upload a photo OR set a Default HeyGen Talking Photo ID.")
+        if not inputs["voice_id"]: problems.append("HeyGen Voice ID for avatar is missing.")
+        if not services.gemini_api_key: problems.append("Gemini API Key is missing.")
+        if inputs["enable_bg_narration"] and not services.openai_api_key:
+            problems.append("OpenAI API Key for BG narration missing.")
+        if inputs["enable_bg_narration"] and (not services.supabase_url or not services.supabase_key):
+            problems.append("Supabase URL/Key for BG audio missing.")
+        if not services.shotstack_client: problems.append("Shotstack API Key is missing.")
+        if not inputs["shotstack_template_id"] or not inputs["shotstack_owner_id"]:
+            problems.append("Shotstack Template/Owner ID missing.")
+        return problems
+
+    def submit(self, inputs: dict, on_finished=None, run_id: str | None = None) -> PipelineRun:
+        """Queues a run; on_finished(run), if given, is called from the worker thread once it is done or failed.
+
+        run_id defaults to a random one; a caller that passes its own (batch_render keys runs by row) replaces any
+        stored run with that ID. With a job queue the run is handed to the worker processes instead (on_finished
+        is not supported).
+        """
+        run = PipelineRun(inputs, run_id=run_id)
+        run.store = self.store
+        if self.queue is not None:
+            if on_finished is not None:
+                raise ValueError("on_finished needs runs executed in this process; the engine has a job queue.")
+            run.log("Queued for a pipeline worker.", "info", "SYSTEM")
+            self.queue.enqueue(run)
+            return run
+        with self._lock:
+            self._prune()
+            self._runs[run.run_id] = run
+        run.log("Starting video generation pipeline.", "info", "SYSTEM")
+        self._executor.submit(self._execute, run, on_finished)
+        return run
+
+    def resume_unfinished(self) -> list[PipelineRun]:
+        """Restarts the runs the store has as queued / running (i.e. the last process stopped mid-run)."""
+        if self.store is None:
+            return []
+        self.store.prune(time.time() - self.retention_seconds)
+        resumed = [run for run in map(self.adopt, self.store.unfinished()) if run is not None]
+        if resumed:
+            self.logger.info(f"Resumed {len(resumed)} unfinished pipeline run(s) from the job store.")
+        return resumed
+
+    def adopt(self, record: dict, on_finished=None) -> PipelineRun | None:
+        """Executes a stored, unfinished run from the stage it had reached; None if it is already running here."""
+        with self._lock:
+            self._prune()
+            existing = self._runs.get(record["run_id"])
+            if existing is not None and not existing.finished:
+                return None
+            run = PipelineRun.from_record(record)
+            run.store = self.store
+            self._runs[run.run_id] = run
+        # Stages that were in flight are not done, so they run again (reattaching to submitted vendor jobs).
+        interrupted, run.stages_active = run.stages_active, []
+        if run.state == run.QUEUED:
+            run.log("Starting video generation pipeline.", "info", "SYSTEM")
+        else:
+            run.log(f"Resuming ({len(run.stages_done)} stage(s) already done"
+                    f"{'; restarting ' + ', '.join(interrupted) if interrupted else ''}).", "info", "SYSTEM")
+            run._record_event(run.stage, "resumed")
+        self._executor.submit(self._execute, run, on_finished)
+        return run
+
+    def get(self, run_id: str | None) -> PipelineRun | None:
+        """The run with this ID; finished runs from before a restart are loaded from the store.
+
+        With a job queue, a fresh copy of the run as last committed by its worker (read-only).
+        """
+        if self.queue is not None:
+            record = self.store.load(run_id) if run_id else None
+            return PipelineRun.from_record(record) if record else None
+        with self._lock:
+            run = self._runs.get(run_id)
+        if run is not None or not run_id or self.store is None:
+            return run
+        record = self.store.load(run_id)
+        if record is None or record["state"] not in (PipelineRun.DONE, PipelineRun.FAILED):
+            return None  # unfinished runs are only served once resume_unfinished() has taken them on
+        with self._lock:
+            return self._runs.setdefault(run_id, PipelineRun.from_record(record))
+
+    def _prune(self):
+        # Caller holds self._lock.
+        cutoff = time.time() - self.retention_seconds
+        for run_id in [run_id for run_id, run in self._runs.items() if run.finished and run.finished_at < cutoff]:
+            del self._runs[run_id]
+
+    def _ready_stages(self, run: PipelineRun, not_started: set) -> list[str]:
+        return [stage for stage in self.STAGES if stage in not_started
+                and all(dependency in run.stages_done for dependency in self.STAGE_DEPENDENCIES[stage])]
+
+    def _run_stage(self, stage: str, run: PipelineRun) -> dict:
+        slots = self.vendor_slots.get(self.STAGE_VENDORS[stage])
+        if slots is None:
+            return self.stage_functions[stage](run, self.services)
+        if not slots.acquire(blocking=False):
+            run.set_status(stage, f"Waiting for a free {self.STAGE_VENDORS[stage]} slot...")
+            slots.acquire()
+        try:
+            return self.stage_functions[stage](run, self.services)
+        finally:
+            slots.release()
+
+    def _execute(self, run: PipelineRun, on_finished=None):
+        run._start()
+        not_started = set(self.STAGES) - set(run.stages_done)
+        in_flight = {}  # future -> stage
+        try:
+            while True:
+                if not run.cancelled.is_set():  # failed or abandoned: start nothing new, let in-flight stages end
+                    for stage in self._ready_stages(run, not_started):
+                        not_started.discard(stage)
+                        run._begin_stage(stage, f"{self.STAGE_LABELS[stage]}...")
+                        in_flight[self._stage_executor.submit(self._run_stage, stage, run)] = stage
+                if not in_flight:
+                    break
+                finished, _ = wait_for_futures(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    self._collect(run, in_flight.pop(future), future)
+            if run.cancelled.is_set() and not run.finished:  # abandoned (e.g. its lease lost) rather than failed
+                run.log("Run abandoned before it finished.", "warning", "SYSTEM")
+                run._finish(run.FAILED, "Abandoned: the run was stopped before it finished.")
+            elif not run.finished:
+                run.log("Video production complete.", "success", "SYSTEM")
+                run._finish(run.DONE)
+        except Exception as e:  # a bug in the scheduler must not leave the run "running" forever
+            self.logger.exception(f"Pipeline run {run.run_id} crashed")
+            run._finish(run.FAILED, f"Unexpected error: {e}")
+        finally:
+            self.services.release_avatar(run.outputs.pop("avatar_lease", None), log=run.log)
+            run.checkpoint()
+            if on_finished is not None:
+                try:
+                    on_finished(run)
+                except Exception:
+                    self.logger.exception(f"on_finished callback failed for run {run.run_id}")
+
+    def _collect(self, run: PipelineRun, stage: str, future):
+        try:
+            outputs = future.result()
+        except PipelineError as e:
+            run._end_stage(stage, succeeded=False)
+            if not run.finished:  # later errors are usually just stages giving up after the first one
+                run.log(str(e), "error", stage.upper())
+                run._finish(run.FAILED, str(e), stage=stage)
+            return
+        except Exception as e:  # a bug in a stage fails the run rather than the engine
+            self.logger.exception(f"Pipeline run {run.run_id} crashed in {stage}")
+            run._end_stage(stage, succeeded=False)
+            run.log(f"Unexpected error in {stage}: {e}", "error", "SYSTEM")
+            run._finish(run.FAILED, f"Unexpected error in {stage}: {e}", stage=stage)
+            return
+        run._end_stage(stage, outputs)
+
+    def stats(self) -> dict:
+        if self.queue is not None:
+            counts = self.store.stats()["runs"]
+            return {state: counts.get(state, 0) for state in (PipelineRun.QUEUED, PipelineRun.RUNNING,
+                                                              PipelineRun.DONE, PipelineRun.FAILED)}
+        with self._lock:
+            states = [run.state for run in self._runs.values()]
+        return {state: states.count(state) for state in (PipelineRun.QUEUED, PipelineRun.RUNNING,
+                                                         PipelineRun.DONE, PipelineRun.FAILED)}
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+        self._stage_executor.shutdown(wait=wait)
+        if self.store is not None:
+            self.store.flush()
@@ -0,0 +1,152 @@
+# pipeline_worker.py
+# Worker process for the pipeline job queue; main_app only enqueues runs when PIPELINE_QUEUE is enabled:
+#   python pipeline_worker.py --concurrency 4
+# Start up to one per core on the host that has the job database (PIPELINE_DB_PATH, on local disk: SQLite cannot be
+# shared over a network filesystem) and the upload spool (UPLOAD_SPOOL_DIR). A worker that dies or hangs loses its
+# leases, and its runs are resumed by another worker at the stage they had reached.
+import argparse
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+
+from dotenv import load_dotenv
+
+from batch_render import DEFAULT_VENDOR_CONCURRENCY
+from engine_factory import build_engine
+from job_store import JobQueue, JobStore
+from pipeline import PipelineEngine, PipelineRun
+
+
+class PipelineWorker:
+    """Claims runs from a JobQueue and executes them on a local PipelineEngine, renewing their leases."""
+
+    def __init__(self, engine: PipelineEngine, queue: JobQueue, worker_id: str | None = None, concurrency: int = 4,
+                 poll_interval_seconds: float = 1.0, max_attempts: int = 3, logger=None):
+        self.engine = engine
+        self.queue = queue
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.concurrency = concurrency
+        self.poll_interval_seconds = poll_interval_seconds
+        # A run claimed this many times has crashed or stalled every worker that took it; it is failed instead.
+        self.max_attempts = max_attempts
+        self.logger = logger or logging.getLogger(__name__)
+        self._held = {}  # run_id -> run
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self.completed = 0
+
+    def run_forever(self):
+        self.logger.info(f"Worker {self.worker_id} consuming {self.queue.store.db_path} "
+                         f"({self.concurrency} concurrent run(s)).")
+        next_renewal = 0.0
+        while not self._stop.is_set():
+            if time.monotonic() >= next_renewal:
+                self._renew_leases()
+                next_renewal = time.monotonic() + self.queue.lease_seconds / 3
+            self._claim_work()
+            self._wake.wait(self.poll_interval_seconds)
+            self._wake.clear()
+
+    def _claim_work(self):
+        while not self._stop.is_set():
+            with self._lock:
+                if len(self._held) >= self.concurrency:
+                    return
+            record = self.queue.claim(self.worker_id)
+            if record is None:
+                return
+            if record["attempts"] > self.max_attempts:
+                self._give_up(record)
+                continue
+            with self._lock:  # held before the run starts, so a fast run's _finished finds it
+                run = self.engine.adopt(record, on_finished=self._finished)
+                if run is not None:
+                    self._held[run.run_id] = run
+            if run is None:
+                # Still winding down here after this worker lost its lease: hand the claim back rather than leak it
+                # (and stop claiming until the next poll, or the queue would return the same run straight away).
+                self.logger.info(f"Run {record['run_id']} is still stopping in this worker; released the claim.")
+                self.queue.release([record["run_id"]], self.worker_id)
+                return
+            self.logger.info(f"Claimed run {run.run_id} (attempt {record['attempts']}).")
+
+    def _give_up(self, record: dict):
+        run = PipelineRun.from_record(record)
+        run.store = self.queue.store
+        self.engine.services.release_avatar(run.outputs.pop("avatar_lease", None), log=run.log)
+        run.log(f"Run was claimed {record['attempts']} times without finishing; giving up.", "error", "WORKER")
+        run._finish(run.FAILED, f"Gave up after {record['attempts'] - 1} attempts (workers crashed or timed out).")
+        run.checkpoint()
+        self.queue.complete(run.run_id, self.worker_id)
+
+    def _renew_leases(self):
+        with self._lock:
+            run_ids = list(self._held)
+        if not run_ids:
+            return
+        for run_id in self.queue.renew(run_ids, self.worker_id):
+            # Another worker has taken the run over (we stalled past the lease): stop writing to it and stop.
+            with self._lock:
+                run = self._held.pop(run_id, None)
+            if run is not None:
+                self.logger.warning(f"Lost the lease on run {run_id}; abandoning it to the worker that took it.")
+                run.store = None
+                run.outputs.pop("avatar_lease", None)  # the new owner releases it
+                run.cancelled.set()
+
+    def _finished(self, run: PipelineRun):
+        with self._lock:
+            held = self._held.pop(run.run_id, None) is not None
+        if held:
+            self.queue.complete(run.run_id, self.worker_id)
+            self.completed += 1
+        self._wake.set()
+
+    def stop(self):
+        """Makes run_forever() return (safe from a signal handler)."""
+        self._stop.set()
+        self._wake.set()
+
+    def shutdown(self):
+        """Stops claiming and hands in-flight runs back to the queue at their last committed stage."""
+        self.stop()
+        with self._lock:
+            runs, self._held = list(self._held.values()), {}
+        for run in runs:
+            run.store = None  # no writes after the handover
+        self.queue.store.stop()
+        self.queue.release([run.run_id for run in runs], self.worker_id)
+        if runs:
+            self.logger.info(f"Released {len(runs)} in-flight run(s) back to the queue.")
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    cli = argparse.ArgumentParser(description="Execute queued video pipeline runs.")
+    cli.add_argument("--concurrency", type=int, default=int(os.getenv("PIPELINE_WORKERS", "4")),
+                     help="runs executed at the same time by this process")
+    cli.add_argument("--worker-id", help="name in the queue's leases (default: host:pid:random)")
+    cli.add_argument("--lease-seconds", type=float, default=float(os.getenv("PIPELINE_LEASE_SECONDS", "120")),
+                     help="a run is handed to another worker if its lease is not renewed for this long")
+    cli.add_argument("--poll-interval", type=float, default=1.0, help="seconds between checks for new runs")
+    cli.add_argument("--max-attempts", type=int, default=3, help="claims per run before it is failed")
+    args = cli.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    store = JobStore(os.getenv("PIPELINE_DB_PATH") or None).start()
+    worker = PipelineWorker(build_engine(args.concurrency, DEFAULT_VENDOR_CONCURRENCY, store=store),
+                            JobQueue(store, lease_seconds=args.lease_seconds), worker_id=args.worker_id,
+                            concurrency=args.concurrency, poll_interval_seconds=args.poll_interval,
+                            max_attempts=args.max_attempts)
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    try:
+        worker.run_forever()
+    except KeyboardInterrupt:
+        pass
+    worker.shutdown()
+    os._exit(0)  # engine threads may be blocked on a vendor job for minutes; their runs are already handed back
@@ -0,0 +1,181 @@
+# rate_limit.py
+import asyncio
+import email.utils
+import hashlib
+import logging
+import os
+import threading
+import time
+
+# Default (requests per second, burst) per vendor and endpoint class. Override with env vars named
+# RATE_LIMIT_<VENDOR>_<CLASS>, e.g. RATE_LIMIT_HEYGEN_STATUS="5/10" (rate/burst) or "2" (rate, burst 1).
+DEFAULT_LIMITS = {
+    ("heygen", "submit"): (1.0, 3),
+    ("heygen", "status"): (5.0, 10),
+    ("heygen", "upload"): (2.0, 4),
+    ("shotstack", "submit"): (1.0, 2),
+    ("shotstack", "status"): (2.0, 5),
+    ("shotstack", "template"): (1.0, 2),
+}
+FALLBACK_LIMIT = (2.0, 5)
+MAX_RETRY_AFTER_SECONDS = 300.0
+
+
+def parse_retry_after(value, default: float = 1.0) -> float:
+    """Retry-After is either delay-seconds or an HTTP-date; returns seconds from now (clamped to a sane range)."""
+    if value is None or value == "":
+        return default
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        try:
+            seconds = email.utils.parsedate_to_datetime(str(value)).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return default
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER_SECONDS)
+
+
+def _limit_from_env(vendor: str, endpoint_class: str) -> tuple[float, int] | None:
+    value = os.getenv(f"RATE_LIMIT_{vendor.upper()}_{endpoint_class.upper()}")
+    if not value:
+        return None
+    try:
+        rate, _, burst = value.partition("/")
+        return float(rate), int(burst or 1)
+    except ValueError:
+        logging.getLogger(__name__).warning(f"Ignoring invalid rate limit '{value}' for {vendor}/{endpoint_class}")
+        return None
+
+
+class TokenBucket:
+    """Token bucket implemented as a reservation schedule (GCRA).
+
+    Each caller reserves the next free slot under a lock and then sleeps until it, so callers are served strictly
+    in arrival order and sustained throughput sits exactly at `rate` while bursts of up to `burst` pass
+    immediately. A 429's Retry-After pushes the schedule back for everyone sharing the bucket.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._interval = 1.0 / rate
+        self._tat = time.monotonic()  # theoretical arrival time of the next request at exactly `rate`
+        self._lock = threading.Lock()
+        self.waits = 0
+        self.waited_seconds = 0.0
+        self.throttles = 0
+
+    def reserve(self, max_wait: float | None = None) -> float | None:
+        """Claims a slot and returns how long to wait for it, or None (nothing claimed) if that exceeds max_wait."""
+        with self._lock:
+            now = time.monotonic()
+            tat = max(self._tat, now)
+            # A request may run up to burst-1 intervals ahead of the schedule: that is the stored-up burst allowance.
+            delay = max(0.0, tat - (self.burst - 1) * self._interval - now)
+            if max_wait is not None and delay > max_wait:
+                return None
+            self._tat = tat + self._interval
+            if delay > 0:
+                self.waits += 1
+                self.waited_seconds += delay
+            return delay
+
+    def acquire(self, max_wait: float | None = None) -> bool:
+        delay = self.reserve(max_wait)
+        if delay is None:
+            return False
+        if delay > 0:
+            time.sleep(delay)
+        return True
+
+    async def acquire_async(self, max_wait: float | None = None) -> bool:
+        delay = self.reserve(max_wait)
+        if delay is None:
+            return False
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return True
+
+    def configure(self, rate: float, burst: int = 1):
+        """Changes the limit in place; under the lock, so a concurrent reserve() sees the old or the new limit, never
+        a mix of the two."""
+        with self._lock:
+            self.rate, self.burst, self._interval = rate, max(1, burst), 1.0 / rate
+
+    def throttle(self, seconds: float):
+        """Vendor said slow down: no slot is handed out for the next `seconds`, and the burst allowance is spent."""
+        with self._lock:
+            self._tat = max(self._tat, time.monotonic() + seconds + (self.burst - 1) * self._interval)
+            self.throttles += 1
+
+    def stats(self) -> dict:
+        return {"rate": self.rate, "burst": self.burst, "waits": self.waits,
+                "waited_seconds": round(self.waited_seconds, 2), "throttles": self.throttles}
+
+
+class RateLimiter:
+    """Process-wide registry of TokenBuckets keyed by (vendor, API key, endpoint class).
+
+    Every client built in this process shares the buckets for the same key, so all sessions together stay under
+    the vendor's per-key limit and queue instead of tripping 429s.
+    """
+
+    def __init__(self, limits: dict | None = None, logger=None):
+        self.limits = dict(DEFAULT_LIMITS)
+        self.limits.update(limits or {})
+        self.logger = logger or logging.getLogger(__name__)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key_id(api_key: str) -> str:
+        return hashlib.sha256((api_key or "").encode()).hexdigest()[:16]
+
+    def configure(self, vendor: str, endpoint_class: str, rate: float, burst: int = 1):
+        with self._lock:
+            self.limits[(vendor, endpoint_class)] = (rate, burst)
+            for (bucket_vendor, _, bucket_class), bucket in list(self._buckets.items()):
+                if (bucket_vendor, bucket_class) == (vendor, endpoint_class):
+                    bucket.configure(rate, burst)
+
+    def bucket(self, vendor: str, api_key: str, endpoint_class: str) -> TokenBucket:
+        key = (vendor, self._key_id(api_key), endpoint_class)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                rate, burst = (_limit_from_env(vendor, endpoint_class) or self.limits.get((vendor, endpoint_class))
+                               or FALLBACK_LIMIT)
+                bucket = self._buckets[key] = TokenBucket(rate, burst)
+            return bucket
+
+    def acquire(self, vendor: str, api_key: str, endpoint_class: str, max_wait: float | None = None) -> bool:
+        return self.bucket(vendor, api_key, endpoint_class).acquire(max_wait)
+
+    async def acquire_async(self, vendor: str, api_key: str, endpoint_class: str,
+                            max_wait: float | None = None) -> bool:
+        return await self.bucket(vendor, api_key, endpoint_class).acquire_async(max_wait)
+
+    def throttle(self, vendor: str, api_key: str, endpoint_class: str, retry_after=None) -> float:
+        """Applies a 429's Retry-After header value to the bucket; returns the pause in seconds."""
+        seconds = parse_retry_after(retry_after)
+        self.bucket(vendor, api_key, endpoint_class).throttle(seconds)
+        self.logger.warning(f"{vendor} rate limited ({endpoint_class}); pausing that endpoint class for {seconds:.1f}s")
+        return seconds
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {f"{vendor}/{key_id[:6]}/{endpoint_class}": bucket.stats()
+                    for (vendor, key_id, endpoint_class), bucket in self._buckets.items()}
+
+
+_default_limiter = None
+_default_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """The shared per-process limiter used by all clients unless one is passed in explicitly."""
+    global _default_limiter
+    with _default_limiter_lock:
+        if _default_limiter is None:
+            _default_limiter = RateLimiter()
+        return _default_limiter
@@ -0,0 +1,125 @@
+# script_cache.py
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from asset_cache import DEFAULT_CACHE_DIR
+
+
+def normalize_description(description: str) -> str:
+    """Whitespace- and Unicode-normalised text, so re-pasted or re-indented descriptions share a cache entry."""
+    return " ".join(unicodedata.normalize("NFC", description or "").split())
+
+
+def script_key(description: str, target_duration_seconds: float, words_per_second: float, model_name: str,
+               prompt_version: int) -> str:
+    """Cache key of a Gemini script: everything that goes into the prompt or picks the model."""
+    parts = [normalize_description(description), float(target_duration_seconds), float(words_per_second),
+             model_name, prompt_version]
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+
+class ScriptCache:
+    """Generated scripts by script_key(), in a small in-memory LRU in front of a persistent SQLite table.
+
+    A retry after a HeyGen / Shotstack failure (or the same listing rendered again) reuses the script instead of
+    paying for and waiting on another Gemini call. Only successful scripts are stored.
+    """
+
+    def __init__(self, db_path: str = None, ttl_seconds: float = 30 * 24 * 3600, max_entries: int = 5000,
+                 memory_entries: int = 256, logger=None):
+        self.db_path = db_path or os.path.join(DEFAULT_CACHE_DIR, "gemini_scripts.sqlite3")
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.logger = logger or logging.getLogger(__name__)
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # key -> (script, created_at)
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS scripts ("
+                         "key TEXT PRIMARY KEY, script TEXT NOT NULL, model TEXT, created_at REAL NOT NULL, "
+                         "last_used REAL NOT NULL)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _remember(self, key: str, script: str, created_at: float):
+        # Caller holds self._lock.
+        self._memory[key] = (script, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and now - entry[1] <= self.ttl_seconds:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry[0]
+            self._memory.pop(key, None)
+            with self._connect() as conn:
+                row = conn.execute("SELECT script, created_at FROM scripts WHERE key = ?", (key,)).fetchone()
+                if row and now - row[1] > self.ttl_seconds:
+                    conn.execute("DELETE FROM scripts WHERE key = ?", (key,))
+                    row = None
+                if row:
+                    conn.execute("UPDATE scripts SET last_used = ? WHERE key = ?", (now, key))
+            if not row:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, row[0], row[1])
+            return row[0]
+
+    def put(self, key: str, script: str, model_name: str | None = None):
+        now = time.time()
+        with self._lock:
+            self._remember(key, script, now)
+            with self._connect() as conn:
+                conn.execute("INSERT OR REPLACE INTO scripts VALUES (?, ?, ?, ?, ?)",
+                             (key, script, model_name, now, now))
+                conn.execute("DELETE FROM scripts WHERE created_at < ?", (now - self.ttl_seconds,))
+                conn.execute("DELETE FROM scripts WHERE rowid IN (SELECT rowid FROM scripts "
+                             "ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def get_or_generate(self, key: str, generate, fresh: bool = False,
+                        model_name: str | None = None) -> tuple[str, bool]:
+        """Returns (script, from_cache): the cached script for key, else generate() (stored unless it is an
+        "Error: ..." string).
+
+        fresh=True skips the lookup (a new take) but still stores the result, so later retries reuse it.
+        """
+        if not fresh:
+            script = self.get(key)
+            if script is not None:
+                self.logger.info(f"Gemini script cache hit ({key[:12]}).")
+                return script, True
+        script = generate()
+        if script and "Error:" not in script:
+            self.put(key, script, model_name)
+        return script, False
+
+    def stats(self) -> dict:
+        with self._lock, self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM scripts").fetchone()[0]
+            return {"entries": entries, "memory_entries": len(self._memory), "memory_hits": self.memory_hits,
+                    "disk_hits": self.disk_hits, "misses": self.misses}
@@ -0,0 +1,20 @@
+# sentences.py
+import re
+
+# End of a sentence: terminal punctuation, any closing quotes / brackets, then whitespace.
+SENTENCE_END = re.compile(r'(?<=[.!?…])["\')\]]*\s+')
+
+
+def split_sentences(text: str) -> list[str]:
+    """The sentences of a text; a trailing sentence without final punctuation is kept."""
+    sentences = []
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        sentence = text[start:match.end()].strip()
+        if sentence:
+            sentences.append(sentence)
+        start = match.end()
+    rest = text[start:].strip()
+    if rest:
+        sentences.append(rest)
+    return sentences
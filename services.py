@@ -0,0 +1,234 @@
+# services.py
+import logging
+import os
+import tempfile
+from functools import partial
+
+from HeyGen import HeyGenAPIClient
+from clients import get_client_registry
+from media_mirror import MediaMirror
+from narration import NarrationPublisher
+from script_cache import script_key
+from storage import StorageBucket
+
+_LOG_LEVELS = {"debug": logging.DEBUG, "info": logging.INFO, "success": logging.INFO, "warning": logging.WARNING,
+               "error": logging.ERROR}
+_logger = logging.getLogger(__name__)
+# Bump whenever build_script_prompt() changes, so cached scripts written for the old prompt are not reused.
+SCRIPT_PROMPT_VERSION = 1
+
+
+def default_log(message: str, level: str = "info", source: str = "SERVICES"):
+    """Same signature as main_app.log_message, so pipeline code can log to a run, a page or plain logging."""
+    _logger.log(_LOG_LEVELS.get(level, logging.INFO), f"({source}) {message}")
+
+
+def build_script_prompt(description: str, target_duration_seconds: float, words_per_second: float) -> str:
+    target_word_count = int(target_duration_seconds * words_per_second)
+    return (
+        f"You are an enthusiastic and persuasive real estate sales agent creating a promotional video script aimed at attracting potential residents. "
+        f"Your task is to transform the following property description into a compelling and inviting narration. "
+        f"The script should be approximately {target_word_count} words long, suitable for a {target_duration_seconds}-second video, and delivered in a warm, confident, and professional sales tone. "
+        f"Highlight the key benefits and lifestyle a resident would enjoy. Make them feel like this is their next dream home. "
+        f"Focus on the most appealing features that would matter to someone looking to live there. "
+        f"Keep the language clear, aspirational, and avoid overly technical jargon. "
+        f"Conclude with an inviting remark or a subtle call to imagine themselves living there. "
+        f"Strictly provide ONLY the spoken narration script, with no scene directions, camera instructions, or any other text.\n\n"
+        f"Property Description:\n\"\"\"\n{description}\n\"\"\"\n\n"
+        f"Generate ONLY the narration script text, nothing else."
+    )
+
+
+def gemini_response_text(response) -> str:
+    """Text of a Gemini response, or of one chunk of a streamed response; "" if it has none."""
+    if hasattr(response, 'parts') and response.parts:
+        return "".join(part.text for part in response.parts if hasattr(part, 'text'))
+    try:
+        return response.text if hasattr(response, 'text') else ""
+    except ValueError:  # .text raises when the chunk has no text part (e.g. a final safety-only chunk)
+        return ""
+
+
+def frame_for_dimension(dimension_preset: str) -> dict:
+    """{"width", "height"} of a HeyGen dimension preset ("720p") or a "WxH" string; 720p if unparsable."""
+    frame = HeyGenAPIClient.DIMENSION_PRESETS.get(dimension_preset)
+    if frame:
+        return frame
+    try:
+        width, height = map(int, dimension_preset.split('x'))
+        return {"width": width, "height": height}
+    except (ValueError, AttributeError):
+        return HeyGenAPIClient.DIMENSION_PRESETS["720p"]
+
+
+class PipelineServices:
+    """API keys plus the shared clients and caches the production pipeline calls out to, with no UI code.
+
+    One instance is built per process and shared by every run: the clients, caches and rate limiter are
+    thread-safe. Methods report problems through the log callable they are given and return None (or an
+    "Error: ..." string for script generation, as before) instead of raising.
+    """
+
+    def __init__(self, heygen_client=None, shotstack_client=None, gemini_api_key: str | None = None,
+                 openai_api_key: str | None = None, supabase_url: str | None = None,
+                 supabase_key: str | None = None, supabase_bucket: str = "videobgm", image_key_cache=None,
+                 avatar_cache=None, image_preprocessor=None, cleanup_service=None, callbacks=None,
+                 crop_avatar_photo_to_frame: bool = True, look_timeout_seconds: float = 120, script_cache=None,
+                 clients=None, narration_stream_upload: bool = True, narration_scratch_dir: str | None = None,
+                 narration_chunk_min_chars: int | None = None, narration_tts_concurrency: int = 4,
+                 media_preflight=None, media_mirroring: bool = False, media_scratch_dir: str | None = None):
+        self.heygen_client = heygen_client
+        self.shotstack_client = shotstack_client
+        self.gemini_api_key = gemini_api_key
+        self.openai_api_key = openai_api_key
+        self.supabase_url = supabase_url
+        self.supabase_key = supabase_key
+        self.supabase_bucket = supabase_bucket
+        self.image_key_cache = image_key_cache
+        self.avatar_cache = avatar_cache
+        self.image_preprocessor = image_preprocessor
+        self.cleanup_service = cleanup_service
+        self.callbacks = callbacks
+        self.crop_avatar_photo_to_frame = crop_avatar_photo_to_frame
+        self.look_timeout_seconds = look_timeout_seconds
+        self.script_cache = script_cache
+        self.media_preflight = media_preflight  # MediaPreflight; None skips the media_preflight stage
+        self.media_scratch_dir = media_scratch_dir  # prepared avatar photos and mirrored videos; default: system temp
+        self.clients = clients or get_client_registry()  # shared OpenAI / Supabase / Gemini clients
+        self.narration = NarrationPublisher(self.clients, openai_api_key, supabase_url, supabase_key, supabase_bucket,
+                                            stream_upload=narration_stream_upload, scratch_dir=narration_scratch_dir,
+                                            chunk_min_chars=narration_chunk_min_chars,
+                                            tts_concurrency=narration_tts_concurrency)
+        # Re-hosts listing images and the avatar video in the bucket before rendering; None skips the mirroring stages.
+        self.media_mirror = MediaMirror(StorageBucket(self.clients, supabase_url, supabase_key, supabase_bucket),
+                                        image_preprocessor=image_preprocessor, scratch_dir=media_scratch_dir) \
+            if media_mirroring and supabase_url and supabase_key else None
+
+    # --- Gemini ---
+    def generate_script(self, description: str, target_duration_seconds: float, words_per_second: float,
+                        model_name: str = "gemini-1.5-flash-latest", fresh: bool = False, on_text=None,
+                        log=default_log) -> str:
+        """Script for the description, reused from the script cache when possible; fresh=True forces a new take.
+
+        With on_text, the script is streamed: on_text(text_so_far) is called as chunks arrive (once with the whole
+        script on a cache hit), so it can be shown before generation finishes. The return value is the same either
+        way. Only the progress display consumes the stream: the HeyGen video needs the whole script and background
+        narration has its own, so no sentence-level work is started on partial text.
+        """
+        log(f"Generating script for HeyGen Avatar (target: {target_duration_seconds}s).", "info", "GEMINI")
+        if not self.gemini_api_key:
+            log("Gemini API Key not configured.", "error", "GEMINI")
+            return "Error: Gemini API Key not configured."
+        generate = partial(self._generate_script, description, target_duration_seconds, words_per_second,
+                           model_name, on_text, log)
+        if self.script_cache is None:
+            return generate()
+        key = script_key(description, target_duration_seconds, words_per_second, model_name, SCRIPT_PROMPT_VERSION)
+        script, from_cache = self.script_cache.get_or_generate(key, generate, fresh=fresh, model_name=model_name)
+        if from_cache:
+            log("Reusing the cached Gemini script for this description (tick 'fresh script' for a new take).",
+                "success", "GEMINI")
+            if on_text is not None:
+                on_text(script)
+        return script
+
+    def _generate_script(self, description: str, target_duration_seconds: float, words_per_second: float,
+                         model_name: str, on_text, log) -> str:
+        try:
+            model = self.clients.gemini_model(self.gemini_api_key, model_name)
+            target_word_count = int(target_duration_seconds * words_per_second)
+            prompt = build_script_prompt(description, target_duration_seconds, words_per_second)
+            log(f"🤖 Generating script for HeyGen Avatar (target: ~{target_word_count} words)...", "info", "GEMINI")
+            if on_text is None:
+                response = model.generate_content(prompt)
+                generated_text = gemini_response_text(response)
+            else:
+                response = model.generate_content(prompt, stream=True)
+                generated_text = ""
+                for chunk in response:
+                    text = gemini_response_text(chunk)
+                    if text:
+                        generated_text += text
+                        on_text(generated_text)
+            if not generated_text:
+                feedback = str(response.prompt_feedback) if hasattr(response, 'prompt_feedback') and \
+                                                             response.prompt_feedback else "No prompt feedback."
+                log(f"Gemini returned empty. Feedback: {feedback}", "error", "GEMINI")
+                return "Error: Gemini empty script."
+            log(f"Gemini script generated. Length: {len(generated_text.split())} words.", "success", "GEMINI")
+            return generated_text.strip()
+        except Exception as e:
+            log(f"Error with Gemini: {e}", "error", "GEMINI")
+            return f"Error: {str(e)}"
+
+    # --- OpenAI TTS + Supabase ---
+    def generate_background_narration_url(self, script_text: str, voice_model: str, tts_model: str,
+                                          log=default_log) -> str | None:
+        if not script_text or "Error:" in script_text:
+            log("Skipping BG narration due to script error/empty.", "warning", "OPENAI_TTS")
+            return None
+        return self.narration.publish(script_text, voice_model, tts_model, log=log)
+
+    # --- HeyGen avatar ---
+    def prepare_avatar_photo(self, photo_path: str, photo_name: str, dimension_preset: str,
+                             log=default_log) -> tuple[str, str]:
+        """Shrinks the photo to what the chosen HeyGen output can use; returns (path, name) to upload.
+
+        The prepared photo is written to a new private file (under media_scratch_dir) that the caller removes, so
+        runs preparing the same source photo at once never share it. Falls back to the original file if there is no
+        preprocessor or Pillow cannot process it.
+        """
+        if self.image_preprocessor is None:
+            return photo_path, photo_name
+        frame = frame_for_dimension(dimension_preset)
+        result = self.image_preprocessor.prepare(photo_path, photo_name,
+                                                 max_side=max(frame["width"], frame["height"]),
+                                                 aspect=f"{frame['width']}:{frame['height']}"
+                                                 if self.crop_avatar_photo_to_frame else None)
+        if not result:
+            log(f"Photo preprocessing failed for '{photo_name}'; uploading the original.", "warning", "IMAGE_PREP")
+            return photo_path, photo_name
+        log(f"Avatar photo '{photo_name}': {result['original_bytes']:,} -> {result['bytes']:,} bytes "
+            f"({result['saved_bytes']:,} saved), {result['size'][0]}x{result['size'][1]}", "info", "IMAGE_PREP")
+        if self.media_scratch_dir:
+            os.makedirs(self.media_scratch_dir, exist_ok=True)
+        fd, prepared_path = tempfile.mkstemp(prefix="avatar_", suffix=os.path.splitext(result["file_name"])[1],
+                                             dir=self.media_scratch_dir)
+        with os.fdopen(fd, "wb") as f:
+            f.write(result["data"])
+        return prepared_path, result["file_name"]
+
+    def wait_for_look(self, group_id: str, timeout_seconds: float | None = None, log=default_log) -> str | None:
+        """Polls a photo avatar group until its first look is ready; returns the look (talking photo) ID or None."""
+        timeout_seconds = timeout_seconds or self.look_timeout_seconds
+        log(f"SDK: Polling HeyGen group '{group_id}' for processed looks", "info", "HEYGEN_GROUP_POLL")
+        look_job = self.heygen_client.look_job(group_id)  # Jittered exponential backoff between status calls
+        look_job.wait(timeout=timeout_seconds)
+        if look_job.succeeded:
+            log(f"SDK: Look ID {look_job.result} in group '{group_id}' is READY after {look_job.polls} polls.",
+                "success", "HEYGEN_GROUP_POLL")
+            return look_job.result
+        if look_job.state == look_job.FAILED:
+            log(f"SDK: Look processing for group '{group_id}' failed: {look_job.error_message}. Stopping poll.",
+                "error", "HEYGEN_GROUP_POLL")
+            return None
+        log(f"SDK: Look not '{look_job.ready_status}' after {timeout_seconds}s ({look_job.polls} polls). "
+            f"Last status: {look_job.last_status}.", "error", "HEYGEN_GROUP_POLL")
+        return None
+
+    def acquire_avatar(self, photo_path: str, photo_name: str, log=default_log) -> dict | None:
+        """Lease on a ready look for the photo, reusing a cached avatar group when there is one."""
+        return self.avatar_cache.acquire(self.heygen_client, photo_path, file_name=photo_name,
+                                         image_key_cache=self.image_key_cache,
+                                         look_waiter=lambda group_id: self.wait_for_look(group_id, log=log))
+
+    def release_avatar(self, lease: dict | None, log=default_log):
+        """Releases a lease; the group stays cached and idle groups are deleted in the background."""
+        if not lease or self.avatar_cache is None:
+            return
+        self.avatar_cache.release(lease)
+        if self.cleanup_service is not None:
+            queued_evictions = self.cleanup_service.request_eviction()
+            if queued_evictions:
+                log(f"SDK: Queued {queued_evictions} idle cached avatar group(s) for deletion.", "info",
+                    "HEYGEN_CLEANUP")
@@ -0,0 +1,182 @@
+# shotstack_client.py
+import logging
+import threading
+
+import requests
+
+from jobs import Backoff, PolledJob
+from rate_limit import RateLimiter, get_rate_limiter
+
+DEFAULT_RENDER_ENDPOINT = "https://api.shotstack.io/edit/stage/templates/render"
+DEFAULT_STATUS_ENDPOINT_TEMPLATE = "https://api.shotstack.io/edit/stage/render/{}"
+# Frame size of each Shotstack output "resolution" (16:9; other aspect ratios keep the same longest side).
+OUTPUT_RESOLUTIONS = {"preview": (512, 288), "mobile": (640, 360), "sd": (1024, 576), "hd": (1280, 720),
+                      "1080": (1920, 1080), "4k": (3840, 2160)}
+
+
+class RenderJob(PolledJob):
+    """Tracks a Shotstack render via the render status endpoint; result is the finished video URL."""
+    kind = "render"
+
+    def __init__(self, client, render_id: str, **kwargs):
+        super().__init__(client, render_id, **kwargs)
+        self.render_data = None  # last status payload, kept for error display
+
+    def _fetch(self):
+        response = self.client.get_render_status(self.job_id)
+        if response is None or not response.get("success"):
+            message = (response or {}).get("message") or self.client.last_error or "Failed to get render status"
+            return self.TRANSIENT, None, {"message": message}
+        self.render_data = response.get("response") or {}
+        self.last_status = self.render_data.get("status")
+        if self.last_status == "done":
+            return self.COMPLETED, self.render_data.get("url"), None
+        if self.last_status == "failed":
+            return self.FAILED, None, {"message": self.render_data.get("error") or "Shotstack render failed"}
+        return self.PENDING, None, None
+
+
+class ShotstackClient:
+    """Minimal Shotstack template render/status client.
+
+    Requests go through the shared per-key RateLimiter: callers queue for capacity, and a 429 applies its
+    Retry-After to the bucket and is resent instead of being reported as a failure. Methods return the decoded
+    JSON response or None; the reason for a None is kept in last_error for display. last_error and last_response
+    are per thread, so runs sharing one client each read back their own call's outcome.
+    """
+    RATE_LIMIT_VENDOR = "shotstack"
+    # With a callback registered, status polling is only a watchdog in case the callback never arrives.
+    CALLBACK_WATCHDOG_BACKOFF = {"initial": 60.0, "factor": 1.5, "max_delay": 300.0}
+    MAX_RATE_LIMIT_RETRIES = 5
+    DEFAULT_TIMEOUT_SECONDS = 60
+
+    def __init__(self, api_key: str, render_endpoint: str = DEFAULT_RENDER_ENDPOINT,
+                 status_endpoint_template: str = DEFAULT_STATUS_ENDPOINT_TEMPLATE, logger=None,
+                 rate_limiter: RateLimiter | None = None, timeout: float | None = DEFAULT_TIMEOUT_SECONDS):
+        if not api_key:
+            raise ValueError("API key cannot be empty.")
+        self.api_key = api_key
+        self.render_endpoint = render_endpoint
+        self.status_endpoint_template = status_endpoint_template
+        self.logger = logger or logging.getLogger(__name__)
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.timeout = timeout
+        self._local = threading.local()
+        self._output_sides = {}  # template_id -> longest side of its output frame
+
+    @property
+    def session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    @property
+    def last_error(self) -> str | None:
+        """Why this thread's last call returned None."""
+        return getattr(self._local, "last_error", None)
+
+    @last_error.setter
+    def last_error(self, value: str | None):
+        self._local.last_error = value
+
+    @property
+    def last_response(self) -> dict | None:
+        """This thread's last render submission response."""
+        return getattr(self._local, "last_response", None)
+
+    @last_response.setter
+    def last_response(self, value: dict | None):
+        self._local.last_response = value
+
+    def _send(self, endpoint_class: str, method: str, url: str, **kwargs) -> dict | None:
+        self.last_error = None
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire(self.RATE_LIMIT_VENDOR, self.api_key, endpoint_class)
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            except requests.exceptions.RequestException as e:
+                self.last_error = str(e)
+                self.logger.error(f"Shotstack {endpoint_class} request failed: {e}")
+                return None
+            if response.status_code == 429:
+                self.rate_limiter.throttle(self.RATE_LIMIT_VENDOR, self.api_key, endpoint_class,
+                                           response.headers.get("Retry-After"))
+                if attempt < self.MAX_RATE_LIMIT_RETRIES:
+                    attempt += 1
+                    continue
+            if response.status_code >= 400:
+                self.last_error = f"{response.status_code}: {response.text[:500]}"
+                self.logger.error(f"Shotstack {endpoint_class} API error {self.last_error}")
+                return None
+            try:
+                return response.json()
+            except ValueError:
+                self.last_error = f"Response not valid JSON. Status: {response.status_code}. Text: {response.text[:200]}"
+                self.logger.error(f"Shotstack {endpoint_class}: {self.last_error}")
+                return None
+
+    def render_template(self, template_id: str, merge_fields: list[dict], owner_id: str,
+                        callback_url: str | None = None) -> dict | None:
+        payload = {"id": template_id, "merge": merge_fields, "owner": owner_id}
+        if callback_url:
+            payload["callback"] = callback_url
+        return self._send("submit", "POST", self.render_endpoint, json=payload,
+                          headers={"Content-Type": "application/json", "x-api-key": self.api_key})
+
+    def get_render_status(self, render_id: str) -> dict | None:
+        if not render_id:
+            return None
+        return self._send("status", "GET", self.status_endpoint_template.format(render_id),
+                          headers={"x-api-key": self.api_key, "Accept": "application/json"})
+
+    def get_template(self, template_id: str) -> dict | None:
+        # Template endpoints sit next to the render endpoint: .../templates/render -> .../templates/{id}
+        url = f"{self.render_endpoint.rsplit('/', 1)[0]}/{template_id}"
+        return self._send("template", "GET", url, headers={"x-api-key": self.api_key, "Accept": "application/json"})
+
+    def output_max_side(self, template_id: str) -> int | None:
+        """Longest side in pixels of the template's output frame (from its output size or resolution), or None if
+        the template cannot be read. Cached per template."""
+        if template_id in self._output_sides:
+            return self._output_sides[template_id]
+        response = self.get_template(template_id)
+        if not response or not response.get("success"):
+            return None
+        output = ((response.get("response") or {}).get("template") or {}).get("output") or {}
+        size = output.get("size") or {}
+        if size.get("width") and size.get("height"):
+            side = max(int(size["width"]), int(size["height"]))
+        else:
+            side = max(OUTPUT_RESOLUTIONS.get(str(output.get("resolution")), OUTPUT_RESOLUTIONS["sd"]))
+        self._output_sides[template_id] = side
+        return side
+
+    def render_job(self, render_id: str, backoff: Backoff | None = None) -> RenderJob:
+        return RenderJob(self, render_id, backoff=backoff or Backoff(initial=10.0, max_delay=30.0))
+
+    def submit_render(self, template_id: str, merge_fields: list[dict], owner_id: str,
+                      callbacks=None) -> RenderJob | None:
+        """Submits a template render and returns its job handle, or None (see last_error / last_response).
+
+        If callbacks (a callbacks.CallbackServer) is enabled, Shotstack is given its callback URL and the job is
+        resolved by the callback; status polling then drops to a slow watchdog.
+        """
+        callback_ref = callbacks.new_ref() if callbacks is not None else None
+        callback_url = callbacks.url_for("shotstack", callback_ref) if callbacks is not None else None
+        self.last_response = response = self.render_template(template_id, merge_fields, owner_id,
+                                                             callback_url=callback_url)
+        render_id = (response or {}).get("response", {}).get("id") if (response or {}).get("success") else None
+        if not render_id:
+            if response is not None:
+                self.last_error = response.get("message") or "Shotstack did not return a render ID"
+            return None
+        if not callback_url:
+            return self.render_job(render_id)
+        backoff = Backoff(**self.CALLBACK_WATCHDOG_BACKOFF)
+        job = self.render_job(render_id, backoff=backoff)
+        job.defer_polling(backoff.next_delay())
+        job.callback_ref = callback_ref
+        callbacks.register("shotstack", render_id, job, ref=callback_ref)
+        return job
@@ -0,0 +1,77 @@
+# storage.py
+import threading
+from urllib.parse import quote
+
+import requests
+
+
+class StorageBucket:
+    """One Supabase Storage bucket, written through the Storage REST API.
+
+    storage3's upload() only takes a path or bytes; posting to the REST endpoint directly lets callers stream any
+    requests body (generators, file objects, AssetStream bodies). Public URLs still come from the shared Supabase
+    client. Methods report problems through the log callable they are given and return False / None.
+    """
+    DEFAULT_TIMEOUT_SECONDS = 120
+
+    def __init__(self, clients, supabase_url: str | None, supabase_key: str | None, bucket: str,
+                 timeout: float | None = DEFAULT_TIMEOUT_SECONDS):
+        self.clients = clients
+        self.supabase_url = (supabase_url or "").rstrip("/")
+        self.supabase_key = supabase_key
+        self.bucket = bucket
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.supabase_url and self.supabase_key)
+
+    @property
+    def session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.supabase_key}", "apikey": self.supabase_key, "x-upsert": "true"}
+
+    def object_url(self, object_name: str, access: str = "") -> str:
+        access = f"{access}/" if access else ""
+        return f"{self.supabase_url}/storage/v1/object/{access}{quote(self.bucket)}/{quote(object_name)}"
+
+    def exists(self, object_name: str, log) -> bool:
+        """Whether the object is already in the bucket; False (write it again) if storage cannot tell."""
+        try:
+            response = self.session.head(self.object_url(object_name, "authenticated"), headers=self._headers(),
+                                         timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            log(f"Could not check storage for '{object_name}': {e}", "warning", "SUPABASE")
+            return False
+        return response.status_code == 200
+
+    def upload(self, object_name: str, body, content_type: str, log) -> bool:
+        """Writes (or overwrites) the object from any requests body."""
+        try:
+            response = self.session.post(self.object_url(object_name), data=body, timeout=self.timeout,
+                                         headers={**self._headers(), "Content-Type": content_type})
+        except Exception as e:  # includes errors raised by a streaming body's producer
+            log(f"Supabase upload of '{object_name}' failed: {e}", "error", "SUPABASE")
+            return False
+        if response.status_code >= 400:
+            log(f"Supabase upload error {response.status_code}: {response.text[:500]}", "error", "SUPABASE")
+            return False
+        return True
+
+    def public_url(self, object_name: str, log) -> str | None:
+        try:
+            public_url = self.clients.supabase(self.supabase_url, self.supabase_key).storage \
+                .from_(self.bucket).get_public_url(object_name)
+        except Exception as e:
+            log(f"Supabase get public URL failed: {e}", "error", "SUPABASE")
+            return None
+        if not isinstance(public_url, str):
+            log(f"Supabase get public URL failed. Response: {public_url}", "error", "SUPABASE")
+            return None
+        return public_url
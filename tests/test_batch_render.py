@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+# batch_render builds the full engine, so it imports the vendor SDKs (Gemini, OpenAI, Supabase).
+batch_render = pytest.importorskip("batch_render")
+
+
+def test_row_columns_map_to_inputs_and_merge_fields():
+    inputs = batch_render.row_to_inputs(
+        {"description": "Sunny flat", "Product_Name": "12 Elm St", "photo": "/photos/agent.jpg", "notes": "ignored",
+         "voice_id": ""},
+        {"voice_id": "base-voice", "merge_fields": {"LOGO_SRC": "https://logo"}})
+    assert inputs["property_description"] == "Sunny flat"
+    assert inputs["merge_fields"] == {"LOGO_SRC": "https://logo", "PRODUCT_NAME": "12 Elm St"}
+    assert inputs["photo_path"] == "/photos/agent.jpg" and inputs["photo_name"] == "agent.jpg"
+    assert inputs["voice_id"] == "base-voice"  # empty cells keep the base value
+    assert "notes" not in inputs and "NOTES" not in inputs["merge_fields"]
+
+
+def test_pipeline_filled_merge_fields_are_not_taken_from_rows():
+    inputs = batch_render.row_to_inputs({"AVATAR_VIDEO": "https://elsewhere"}, {})
+    assert "AVATAR_VIDEO" not in inputs["merge_fields"]
+
+
+def test_values_are_converted_to_the_default_input_type():
+    column_map = {"seconds": "target_duration_seconds", "wps": "words_per_second", "test": "test_mode",
+                  "captions": "add_captions"}
+    inputs = batch_render.row_to_inputs({"seconds": " 30 ", "wps": "2.75", "test": "Yes", "captions": "0"}, {},
+                                        column_map)
+    assert inputs["target_duration_seconds"] == 30 and isinstance(inputs["target_duration_seconds"], int)
+    assert inputs["words_per_second"] == 2.75
+    assert inputs["test_mode"] is True and inputs["add_captions"] is False
+
+
+def test_jsonl_values_of_the_right_type_are_kept():
+    inputs = batch_render.row_to_inputs({"seconds": 45, "test": False},
+                                        {}, {"seconds": "target_duration_seconds", "test": "test_mode"})
+    assert inputs["target_duration_seconds"] == 45 and inputs["test_mode"] is False
+
+
+@pytest.mark.parametrize("column, value", [("seconds", "30.5"), ("seconds", "thirty"), ("test", "maybe"),
+                                           ("seconds", True)])
+def test_unparseable_values_raise_naming_the_column(column, value):
+    column_map = {"seconds": "target_duration_seconds", "test": "test_mode"}
+    with pytest.raises(ValueError, match=f"column '{column}'"):
+        batch_render.row_to_inputs({column: value}, {}, column_map)
+
+
+def test_load_finished_reads_done_and_optionally_failed_rows(tmp_path):
+    output = tmp_path / "results.jsonl"
+    output.write_text("\n".join([json.dumps({"row_key": "a", "status": "done"}),
+                                 json.dumps({"row_key": "b", "status": "failed"}),
+                                 json.dumps({"row_key": "c", "status": "done"}),
+                                 '{"row_key": "d", "sta']) + "\n", encoding="utf-8")  # cut short by a crash
+    assert batch_render.load_finished(str(output)) == {"a", "c"}
+    assert batch_render.load_finished(str(output), include_failed=True) == {"a", "b", "c"}
+
+
+def test_load_finished_without_an_output_file(tmp_path):
+    assert batch_render.load_finished(str(tmp_path / "missing.jsonl")) == set()
+
+
+def test_row_key_prefers_the_id_column():
+    assert batch_render.row_key({"id": 17, "description": "x"}) == "17"
+    assert batch_render.row_key({"description": "x"}) == batch_render.row_key({"description": "x"})
+    assert batch_render.row_key({"description": "x"}) != batch_render.row_key({"description": "y"})
+
+
+def test_batch_run_ids_are_stable_per_output_file_and_row(tmp_path):
+    first, second = str(tmp_path / "a.jsonl"), str(tmp_path / "b.jsonl")
+    assert batch_render.batch_run_id(first, "row-1") == batch_render.batch_run_id(first, "row-1")
+    assert batch_render.batch_run_id(first, "row-1") != batch_render.batch_run_id(first, "row-2")
+    assert batch_render.batch_run_id(first, "row-1") != batch_render.batch_run_id(second, "row-1")
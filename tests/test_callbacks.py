@@ -0,0 +1,117 @@
+import json
+
+import pytest
+
+from callbacks import (CallbackServer, heygen_event, parse_heygen_event, parse_shotstack_event, shotstack_event, sign,
+                       verify)
+from jobs import PolledJob
+
+
+class Job(PolledJob):
+    def __init__(self, job_id: str):
+        super().__init__(None, job_id)
+
+
+@pytest.fixture
+def server():
+    # Not started: handle() is called directly, as the HTTP handler would.
+    return CallbackServer(public_url="https://hooks.example.invalid", secret="url-secret",
+                          vendor_secrets={"heygen": "heygen-secret"})
+
+
+def query(server: CallbackServer, kind: str, ref: str) -> str:
+    return f"ref={ref}&sig={server._ref_signature(kind, ref)}"
+
+
+def body(payload: dict) -> bytes:
+    return json.dumps(payload).encode()
+
+
+def test_sign_and_verify():
+    signature = sign("secret", b"message")
+    assert verify("secret", b"message", signature)
+    assert not verify("secret", b"other message", signature)
+    assert not verify("other secret", b"message", signature)
+    assert not verify("secret", b"message", None)
+
+
+def test_parse_heygen_event():
+    assert parse_heygen_event(heygen_event("v1", url="https://cdn/v1.mp4")) == ("v1", "completed", "https://cdn/v1.mp4",
+                                                                                None)
+    assert parse_heygen_event(heygen_event("v1", success=False, message="no voice")) == (
+        "v1", "failed", None, {"message": "no voice"})
+    assert parse_heygen_event({"event_type": "avatar_video_gif.success", "event_data": {"video_id": "v1"}})[1] is None
+
+
+def test_parse_shotstack_event():
+    assert parse_shotstack_event(shotstack_event("r1", url="https://cdn/r1.mp4")) == ("r1", "completed",
+                                                                                      "https://cdn/r1.mp4", None)
+    assert parse_shotstack_event(shotstack_event("r1", success=False, message="bad asset"))[1:] == (
+        "failed", None, {"message": "bad asset"})
+    assert parse_shotstack_event({"type": "serve", "id": "r1", "status": "done"})[1] is None
+    assert parse_shotstack_event({"type": "edit", "id": "r1", "status": "rendering"})[1] is None
+
+
+def test_signed_heygen_callback_resolves_its_job(server):
+    job = Job("v1")
+    server.register("heygen", "v1", job, ref="ref-1")
+    payload = body(heygen_event("v1", url="https://cdn/v1.mp4"))
+    status, _ = server.handle("heygen", query(server, "heygen", "ref-1"), payload,
+                              {"Signature": sign("heygen-secret", payload)})
+    assert status == 200
+    assert job.succeeded and job.result == "https://cdn/v1.mp4"
+    assert server.stats()["received"] == 1
+
+
+def test_forged_url_is_rejected(server):
+    status, _ = server.handle("heygen", "ref=ref-1&sig=forged", body(heygen_event("v1")), {})
+    assert status == 403
+    assert server.stats()["rejected"] == 1
+
+
+def test_heygen_body_signature_is_required_when_a_secret_is_set(server):
+    job = Job("v1")
+    server.register("heygen", "v1", job, ref="ref-1")
+    payload = body(heygen_event("v1"))
+    status, _ = server.handle("heygen", query(server, "heygen", "ref-1"), payload,
+                              {"Signature": sign("wrong-secret", payload)})
+    assert status == 401
+    assert job.state == PolledJob.PENDING
+
+
+def test_shotstack_callbacks_are_not_checked_against_a_vendor_secret():
+    server = CallbackServer(public_url="https://hooks.example.invalid", secret="url-secret",
+                            vendor_secrets={"heygen": "heygen-secret", "shotstack": "unused"})
+    job = Job("r1")
+    server.register("shotstack", "r1", job, ref="ref-9")
+    status, _ = server.handle("shotstack", query(server, "shotstack", "ref-9"), body(shotstack_event("r1")), {})
+    assert status == 200 and job.succeeded
+
+
+def test_callback_for_another_job_is_rejected(server):
+    job_1, job_2 = Job("r1"), Job("r2")
+    server.register("shotstack", "r1", job_1, ref="ref-1")
+    server.register("shotstack", "r2", job_2, ref="ref-2")
+    status, _ = server.handle("shotstack", query(server, "shotstack", "ref-1"), body(shotstack_event("r2")), {})
+    assert status == 403
+    assert job_1.state == job_2.state == PolledJob.PENDING
+
+
+def test_early_callback_is_applied_on_registration_with_the_same_ref(server):
+    server.handle("shotstack", query(server, "shotstack", "ref-1"), body(shotstack_event("r1", success=False)), {})
+    assert server.stats()["early"] == 1
+    job = Job("r1")
+    server.register("shotstack", "r1", job, ref="ref-1")
+    assert job.state == PolledJob.FAILED
+
+
+def test_early_callback_with_another_ref_is_dropped(server):
+    server.handle("shotstack", query(server, "shotstack", "ref-x"), body(shotstack_event("r1")), {})
+    job = Job("r1")
+    server.register("shotstack", "r1", job, ref="ref-1")
+    assert job.state == PolledJob.PENDING
+
+
+def test_unknown_kind_and_bad_payload(server):
+    assert server.handle("other", "", b"{}", {})[0] == 404
+    assert server.handle("shotstack", query(server, "shotstack", "ref-1"), b"not json", {})[0] == 400
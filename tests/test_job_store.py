@@ -0,0 +1,110 @@
+import time
+
+import pytest
+
+import job_store
+from job_store import JobQueue, JobStore
+
+
+class FakeRun:
+    """The parts of a PipelineRun a JobStore reads."""
+
+    def __init__(self, run_id: str, state: str = "queued"):
+        self.run_id = run_id
+        self.inputs = {"property_description": f"listing {run_id}"}
+        self.state = state
+        self.store = None
+
+    def snapshot(self) -> dict:
+        return {"state": self.state, "stage": None, "outputs": {}, "stages_done": [], "stages_active": [],
+                "stage_status": {}, "status_message": "Queued", "error": None, "logs": [],
+                "created_at": time.time(), "finished_at": None}
+
+    def checkpoint(self):
+        self.store.mark_dirty(self)
+        self.store.flush()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "runs.sqlite3"))
+
+
+def enqueue(queue: JobQueue, run_id: str, state: str = "queued") -> FakeRun:
+    run = FakeRun(run_id, state)
+    run.store = queue.store
+    queue.enqueue(run)
+    time.sleep(0.001)  # distinct enqueued_at, so claim order is well defined
+    return run
+
+
+def test_claims_oldest_first_and_leases_exclusively(store):
+    queue = JobQueue(store, lease_seconds=60)
+    enqueue(queue, "first"), enqueue(queue, "second")
+    record = queue.claim("worker-a")
+    assert record["run_id"] == "first" and record["attempts"] == 1
+    assert record["inputs"] == {"property_description": "listing first"}
+    assert queue.claim("worker-b")["run_id"] == "second"
+    assert queue.claim("worker-c") is None
+
+
+def test_renew_reports_only_leases_the_worker_lost(store):
+    queue = JobQueue(store, lease_seconds=60)
+    enqueue(queue, "run-1")
+    queue.claim("worker-a")
+    assert queue.renew(["run-1"], "worker-a") == []
+    assert queue.renew(["run-1"], "worker-b") == ["run-1"]
+
+
+def test_expired_lease_is_claimed_again_as_another_attempt(store):
+    queue = JobQueue(store, lease_seconds=0.05)
+    enqueue(queue, "run-1")
+    queue.claim("worker-a")
+    time.sleep(0.1)
+    record = queue.claim("worker-b")
+    assert record["run_id"] == "run-1" and record["attempts"] == 2
+    assert queue.renew(["run-1"], "worker-a") == ["run-1"]
+
+
+def test_release_hands_the_run_back_without_using_an_attempt(store):
+    queue = JobQueue(store, lease_seconds=60)
+    enqueue(queue, "run-1")
+    queue.claim("worker-a")
+    queue.release(["run-1"], "worker-b")  # not the holder: no effect
+    assert queue.claim("worker-b") is None
+    queue.release(["run-1"], "worker-a")
+    assert queue.claim("worker-b")["attempts"] == 1
+
+
+def test_complete_removes_the_run_from_the_queue(store):
+    queue = JobQueue(store, lease_seconds=0.05)
+    enqueue(queue, "run-1")
+    queue.claim("worker-a")
+    queue.complete("run-1", "worker-a")
+    time.sleep(0.1)
+    assert queue.claim("worker-b") is None
+    assert queue.stats() == {"waiting": 0, "leased": 0, "workers": 0}
+
+
+def test_finished_runs_are_not_claimed(store):
+    queue = JobQueue(store)
+    enqueue(queue, "run-1", state="done")
+    assert queue.claim("worker-a") is None
+
+
+def test_stats_count_waiting_and_leased_runs(store):
+    queue = JobQueue(store, lease_seconds=60)
+    for run_id in ("run-1", "run-2", "run-3"):
+        enqueue(queue, run_id)
+    queue.claim("worker-a"), queue.claim("worker-b")
+    assert queue.stats() == {"waiting": 1, "leased": 2, "workers": 2}
+
+
+def test_store_refuses_a_database_on_a_network_filesystem(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_store, "filesystem_type", lambda path: "nfs4")
+    with pytest.raises(ValueError, match="nfs4"):
+        JobStore(str(tmp_path / "runs.sqlite3"))
+
+
+def test_filesystem_type_of_a_local_directory(tmp_path):
+    assert job_store.filesystem_type(str(tmp_path)) not in job_store.NETWORK_FILESYSTEMS
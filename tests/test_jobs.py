@@ -0,0 +1,103 @@
+import threading
+
+import pytest
+
+from jobs import Backoff, PolledJob, as_completed
+
+
+class ScriptedJob(PolledJob):
+    """Returns the given _fetch() results in order."""
+
+    def __init__(self, states, **kwargs):
+        super().__init__(None, "job-1", **kwargs)
+        self.states = list(states)
+
+    def _fetch(self):
+        state = self.states.pop(0)
+        if state == self.COMPLETED:
+            return state, "https://example.invalid/video.mp4", None
+        if state in (self.FAILED, self.TRANSIENT):
+            return state, None, {"message": f"{state} error"}
+        return state, None, None
+
+
+def fast_backoff():
+    return Backoff(initial=0.001, factor=2.0, max_delay=0.004, jitter=0.0)
+
+
+def test_backoff_grows_by_factor_up_to_the_ceiling():
+    backoff = Backoff(initial=2.0, factor=1.5, max_delay=5.0, jitter=0.0)
+    assert [backoff.next_delay() for _ in range(5)] == [2.0, 3.0, 4.5, 5.0, 5.0]
+
+
+def test_backoff_jitter_only_shortens_the_delay():
+    backoff = Backoff(initial=10.0, factor=1.0, max_delay=10.0, jitter=0.3)
+    delays = [backoff.next_delay() for _ in range(200)]
+    assert all(7.0 <= delay <= 10.0 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_backoff_reset_starts_over():
+    backoff = Backoff(initial=1.0, factor=2.0, max_delay=100.0, jitter=0.0)
+    backoff.next_delay(), backoff.next_delay()
+    backoff.reset()
+    assert backoff.next_delay() == 1.0
+
+
+def test_job_completes_with_the_fetched_result():
+    job = ScriptedJob([PolledJob.PENDING, PolledJob.PENDING, PolledJob.COMPLETED], backoff=fast_backoff())
+    assert job.wait(timeout=5)
+    assert job.succeeded and job.result == "https://example.invalid/video.mp4"
+    assert job.polls == 3
+
+
+def test_failed_status_fails_the_job():
+    job = ScriptedJob([PolledJob.FAILED], backoff=fast_backoff())
+    assert job.wait(timeout=5)
+    assert job.state == PolledJob.FAILED and job.error_message == "failed error"
+
+
+def test_transient_errors_back_off_instead_of_failing():
+    job = ScriptedJob([PolledJob.TRANSIENT] * 8 + [PolledJob.COMPLETED], backoff=fast_backoff(),
+                      max_transient_delay=0.02)
+    for _ in range(8):
+        assert not job.poll()
+        assert 0.0 < job.seconds_until_next_poll() <= 0.02
+    assert job.last_error == {"message": "transient error"}
+    assert job.state == PolledJob.PENDING
+    assert job.poll() and job.succeeded
+
+
+def test_transient_delay_doubles_per_consecutive_error():
+    job = ScriptedJob([PolledJob.TRANSIENT] * 3, backoff=Backoff(initial=1.0, factor=1.0, max_delay=1.0, jitter=0.0),
+                      max_transient_delay=100.0)
+    delays = []
+    for _ in range(3):
+        job.poll()
+        delays.append(job.seconds_until_next_poll())
+    assert delays == pytest.approx([2.0, 4.0, 8.0], abs=0.05)
+
+
+def test_resolve_wakes_a_waiter_without_polling():
+    job = ScriptedJob([PolledJob.PENDING] * 100, backoff=Backoff(initial=60.0, jitter=0.0))
+    job.poll()  # next poll is a minute away
+    threading.Timer(0.05, job.resolve, args=("from-callback",)).start()
+    assert job.wait(timeout=5)
+    assert job.result == "from-callback" and job.polls == 1
+
+
+def test_wait_times_out_while_pending():
+    job = ScriptedJob([PolledJob.PENDING] * 100, backoff=fast_backoff())
+    assert not job.wait(timeout=0.05)
+
+
+def test_as_completed_yields_jobs_as_they_finish():
+    slow = ScriptedJob([PolledJob.PENDING] * 3 + [PolledJob.COMPLETED], backoff=fast_backoff())
+    fast = ScriptedJob([PolledJob.COMPLETED], backoff=fast_backoff())
+    assert list(as_completed([slow, fast], timeout=5, idle_sleep=0.001)) == [fast, slow]
+
+
+def test_as_completed_raises_on_timeout():
+    job = ScriptedJob([PolledJob.PENDING] * 1000, backoff=fast_backoff())
+    with pytest.raises(TimeoutError):
+        list(as_completed([job], timeout=0.05, idle_sleep=0.001))
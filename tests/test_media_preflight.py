@@ -0,0 +1,105 @@
+import io
+
+import pytest
+from PIL import Image
+
+from media_preflight import MediaPreflight, image_dimensions, sniff_content_type
+
+
+def encoded(image_format: str, size=(321, 123), **options) -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", size, (200, 120, 40)).save(output, format=image_format, **options)
+    return output.getvalue()
+
+
+@pytest.mark.parametrize("image_format, options", [
+    ("PNG", {}), ("GIF", {}), ("JPEG", {}), ("JPEG", {"progressive": True}), ("WEBP", {}),
+    ("WEBP", {"lossless": True}),
+])
+def test_image_dimensions_from_the_header(image_format, options):
+    assert image_dimensions(encoded(image_format, **options)[:4096]) == (321, 123)
+
+
+def test_image_dimensions_of_jpeg_after_exif():
+    output = io.BytesIO()
+    image = Image.new("RGB", (64, 48))
+    exif = image.getexif()
+    exif[0x010F] = "Camera maker " * 50
+    image.save(output, format="JPEG", exif=exif)
+    assert image_dimensions(output.getvalue()) == (64, 48)
+
+
+@pytest.mark.parametrize("head", [b"", b"\x89PNG\r\n\x1a\n", b"GIF89a\x01", b"not an image at all"])
+def test_image_dimensions_unknown_or_cut_short(head):
+    assert image_dimensions(head) is None
+
+
+@pytest.mark.parametrize("image_format, content_type", [
+    ("PNG", "image/png"), ("GIF", "image/gif"), ("JPEG", "image/jpeg"), ("WEBP", "image/webp"),
+])
+def test_sniff_image_types(image_format, content_type):
+    assert sniff_content_type(encoded(image_format)) == content_type
+
+
+@pytest.mark.parametrize("head, content_type", [
+    (b'<?xml version="1.0"?>\n<svg xmlns="http://www.w3.org/2000/svg">', "image/svg+xml"),
+    (b"\x00\x00\x00\x20ftypisom\x00\x00\x02\x00", "video/mp4"),
+    (b"\x00\x00\x00\x14ftypqt  \x00\x00\x00\x00", "video/quicktime"),
+    (b"\x1a\x45\xdf\xa3\x9f\x42\x86\x81", "video/webm"),
+    (b"ID3\x04\x00\x00\x00\x00\x00\x00", "audio/mpeg"),
+    (b"RIFF\x24\x00\x00\x00WAVEfmt ", "audio/wav"),
+    (b"%PDF-1.7", None),
+])
+def test_sniff_other_types(head, content_type):
+    assert sniff_content_type(head) == content_type
+
+
+class FakeResponse:
+    def __init__(self, body: bytes, content_type: str | None, status_code: int = 206):
+        self.body = body
+        self.status_code = status_code
+        self.headers = {"Content-Range": f"bytes 0-{len(body) - 1}/{len(body)}"}
+        if content_type is not None:
+            self.headers["Content-Type"] = content_type
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def iter_content(self, chunk_size: int):
+        for start in range(0, len(self.body), chunk_size):
+            yield self.body[start:start + chunk_size]
+
+
+class FakeSession:
+    def __init__(self, response: FakeResponse):
+        self.response = response
+
+    def get(self, url, **kwargs):
+        return self.response
+
+
+def probe(body: bytes, content_type: str | None, kind: str = "image") -> dict:
+    preflight = MediaPreflight()
+    preflight._local.session = FakeSession(FakeResponse(body, content_type))  # this thread's session
+    return preflight.probe("https://cdn.example.invalid/photo", kind)
+
+
+@pytest.mark.parametrize("content_type", ["application/octet-stream", "binary/octet-stream", None])
+def test_probe_sniffs_generic_content_types(content_type):
+    result = probe(encoded("PNG"), content_type)
+    assert result["ok"] and result["content_type"] == "image/png"
+    assert (result["width"], result["height"]) == (321, 123)
+
+
+def test_probe_rejects_generic_content_that_is_not_the_expected_kind():
+    result = probe(b"%PDF-1.7 ...", "application/octet-stream")
+    assert not result["ok"]
+    assert "application/octet-stream" in result["error"]
+
+
+def test_probe_trusts_a_specific_content_type():
+    result = probe(encoded("PNG"), "text/html; charset=utf-8")
+    assert not result["ok"] and "text/html" in result["error"]
@@ -0,0 +1,77 @@
+import pytest
+
+from mp3_frames import Mp3Frames, concat_mp3
+
+FRAME_BYTES = 417  # MPEG-1 Layer III, 128 kbit/s, 44.1 kHz, no padding
+SAMPLES_PER_FRAME = 1152
+
+
+def frame(fill: int = 0, rate_index: int = 0) -> bytes:
+    header = bytes([0xFF, 0xFB, 0x90 | (rate_index << 2), 0x00])  # stereo: 32 bytes of side info
+    length = 144 * 128000 // (44100, 48000, 32000)[rate_index]
+    return header + bytes([fill]) * (length - 4)
+
+
+def xing_frame(frame_count: int) -> bytes:
+    data = bytearray(frame())
+    data[4 + 32:4 + 32 + 12] = b"Info" + (1).to_bytes(4, "big") + frame_count.to_bytes(4, "big")
+    return bytes(data)
+
+
+def id3v2(size: int = 20) -> bytes:
+    return b"ID3\x04\x00\x00" + bytes([0, 0, 0, size]) + b"\x00" * size
+
+
+def mp3(frames: int, fill: int = 0, tagged: bool = True) -> bytes:
+    """An encoder-style file: ID3v2 tag, Info header frame, audio frames and an ID3v1 tag."""
+    body = b"".join(frame(fill) for _ in range(frames))
+    if not tagged:
+        return body
+    return id3v2() + xing_frame(frames) + body + b"TAG" + b"\x00" * 125
+
+
+def test_frames_skip_tags_and_the_info_frame():
+    parsed = Mp3Frames(mp3(10))
+    assert len(parsed.frames) == 10
+    assert parsed.declared_frames == 10
+    assert parsed.sample_rate == 44100
+    assert parsed.duration_seconds == pytest.approx(10 * SAMPLES_PER_FRAME / 44100)
+
+
+def test_concat_joins_the_audio_frames_only():
+    joined, duration = concat_mp3([mp3(3, fill=1), mp3(5, fill=2)])
+    assert joined == frame(1) * 3 + frame(2) * 5
+    assert duration == pytest.approx(8 * SAMPLES_PER_FRAME / 44100)
+    assert Mp3Frames(joined).declared_frames is None and len(Mp3Frames(joined).frames) == 8
+
+
+def test_concat_of_untagged_parts():
+    joined, duration = concat_mp3([mp3(2, tagged=False), mp3(2, tagged=False)])
+    assert len(joined) == 4 * FRAME_BYTES
+    assert duration == pytest.approx(4 * SAMPLES_PER_FRAME / 44100)
+
+
+def test_part_with_fewer_frames_than_declared_is_rejected():
+    short = id3v2() + xing_frame(10) + frame() * 7  # cut at a frame boundary
+    with pytest.raises(ValueError, match="part 2 has 7 audio frames; its header declares 10"):
+        concat_mp3([mp3(3), short])
+
+
+def test_declared_count_including_the_header_frame_is_accepted():
+    _, duration = concat_mp3([id3v2() + xing_frame(5) + frame() * 4])
+    assert duration == pytest.approx(4 * SAMPLES_PER_FRAME / 44100)
+
+
+def test_truncated_frame_is_rejected():
+    with pytest.raises(ValueError, match="Truncated"):
+        concat_mp3([mp3(3, tagged=False)[:-10]])
+
+
+def test_non_mp3_data_is_rejected():
+    with pytest.raises(ValueError, match="Not an MPEG audio frame"):
+        concat_mp3([b"RIFF\x00\x00\x00\x00WAVEfmt "])
+
+
+def test_parts_with_different_sample_rates_are_rejected():
+    with pytest.raises(ValueError, match="different sample rates"):
+        concat_mp3([frame(rate_index=0), frame(rate_index=1)])
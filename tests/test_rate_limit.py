@@ -0,0 +1,88 @@
+import email.utils
+import time
+
+import pytest
+
+from rate_limit import MAX_RETRY_AFTER_SECONDS, RateLimiter, TokenBucket, parse_retry_after
+
+
+def test_burst_passes_then_requests_are_spaced_at_the_rate():
+    bucket = TokenBucket(rate=10.0, burst=3)
+    delays = [bucket.reserve() for _ in range(6)]
+    assert delays[:3] == [0.0, 0.0, 0.0]
+    assert delays[3:] == pytest.approx([0.1, 0.2, 0.3], abs=0.01)
+    assert bucket.waits == 3
+
+
+def test_reserve_over_max_wait_claims_nothing():
+    bucket = TokenBucket(rate=1.0, burst=1)
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve(max_wait=0.5) is None
+    assert bucket.reserve() == pytest.approx(1.0, abs=0.01)  # the refused caller did not take the slot
+
+
+def test_idle_time_refills_the_burst_but_no_more():
+    bucket = TokenBucket(rate=50.0, burst=2)
+    bucket.reserve(), bucket.reserve()
+    time.sleep(0.1)  # five intervals
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, pytest.approx(0.02, abs=0.01)]
+
+
+def test_throttle_pushes_back_the_next_slot_and_spends_the_burst():
+    bucket = TokenBucket(rate=10.0, burst=5)
+    bucket.throttle(2.0)
+    assert bucket.reserve() == pytest.approx(2.0, abs=0.01)
+    assert bucket.reserve() == pytest.approx(2.1, abs=0.01)
+    assert bucket.throttles == 1
+
+
+def test_configure_changes_the_spacing():
+    bucket = TokenBucket(rate=1.0, burst=1)
+    bucket.configure(rate=20.0, burst=1)
+    bucket.reserve()
+    assert bucket.reserve() == pytest.approx(0.05, abs=0.01)
+    assert bucket.stats()["rate"] == 20.0
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("3", 3.0), ("0.5", 0.5), (7, 7.0), ("-4", 0.0), ("100000", MAX_RETRY_AFTER_SECONDS),
+    (None, 1.0), ("", 1.0), ("soon", 1.0),
+])
+def test_parse_retry_after_seconds(value, expected):
+    assert parse_retry_after(value) == expected
+
+
+def test_parse_retry_after_http_date():
+    value = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert parse_retry_after(value) == pytest.approx(30, abs=2)
+
+
+def test_limiter_shares_buckets_per_vendor_key_and_class():
+    limiter = RateLimiter()
+    assert limiter.bucket("heygen", "key-a", "status") is limiter.bucket("heygen", "key-a", "status")
+    assert limiter.bucket("heygen", "key-a", "status") is not limiter.bucket("heygen", "key-b", "status")
+    assert limiter.bucket("heygen", "key-a", "status") is not limiter.bucket("heygen", "key-a", "submit")
+
+
+def test_limiter_uses_defaults_env_overrides_and_fallback(monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_HEYGEN_UPLOAD", "7/9")
+    limiter = RateLimiter(limits={("shotstack", "submit"): (3.0, 4)})
+    assert (limiter.bucket("heygen", "k", "status").rate, limiter.bucket("heygen", "k", "status").burst) == (5.0, 10)
+    assert (limiter.bucket("heygen", "k", "upload").rate, limiter.bucket("heygen", "k", "upload").burst) == (7.0, 9)
+    assert limiter.bucket("shotstack", "k", "submit").rate == 3.0
+    assert limiter.bucket("other", "k", "anything").rate == 2.0
+
+
+def test_limiter_configure_updates_live_buckets():
+    limiter = RateLimiter()
+    bucket = limiter.bucket("heygen", "k", "submit")
+    limiter.configure("heygen", "submit", rate=4.0, burst=2)
+    assert (bucket.rate, bucket.burst) == (4.0, 2)
+    assert limiter.bucket("heygen", "other-key", "submit").rate == 4.0
+
+
+def test_limiter_throttle_applies_retry_after_to_the_bucket():
+    limiter = RateLimiter()
+    assert limiter.throttle("shotstack", "k", "submit", retry_after="1.5") == 1.5
+    assert limiter.bucket("shotstack", "k", "submit").reserve() == pytest.approx(1.5, abs=0.01)
+    assert limiter.stats()[next(iter(limiter.stats()))]["throttles"] == 1
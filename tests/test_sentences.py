@@ -0,0 +1,22 @@
+import pytest
+
+from sentences import split_sentences
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("One. Two! Three? Four", ["One.", "Two!", "Three?", "Four"]),
+    ('He said "Hi." Then left.', ['He said "Hi."', "Then left."]),
+    ("A list (see below.) Next…  Done.", ["A list (see below.)", "Next…", "Done."]),
+    ("Line one.\nLine two.", ["Line one.", "Line two."]),
+    ("No final punctuation", ["No final punctuation"]),
+    ("Costs $4.50 today. Call now.", ["Costs $4.50 today.", "Call now."]),
+    ("", []),
+    ("   ", []),
+])
+def test_split_sentences(text, expected):
+    assert split_sentences(text) == expected
+
+
+def test_joined_sentences_keep_every_word():
+    text = "First sentence here. Second one! And a third? Trailing words"
+    assert " ".join(split_sentences(text)).split() == text.split()
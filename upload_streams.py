@@ -0,0 +1,225 @@
+# upload_streams.py
+import io
+import mmap
+import os
+import queue
+import threading
+import uuid
+
+DEFAULT_CHUNK_SIZE = 256 * 1024
+
+
+class AssetStream:
+    """Constant-memory request body over a file path, file object, bytes-like buffer or iterable of chunks.
+
+    Paths are memory-mapped, buffers are sliced without copying the whole object, and file objects are read in
+    chunk_size blocks, so peak RSS per upload is ~chunk_size regardless of the asset size. Use as a context manager
+    so files/maps opened here are closed.
+    """
+
+    def __init__(self, source, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._owned = []
+        self._buffer = None
+        self._fileobj = None
+        self._chunks = None
+        self._position = 0
+        self.length = None
+        self.name = None
+        if isinstance(source, (str, os.PathLike)):
+            self.name = os.path.basename(os.fspath(source))
+            f = open(source, "rb")
+            self._owned.append(f)
+            size = os.fstat(f.fileno()).st_size
+            if size:
+                self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._owned.append(self._buffer)
+            else:
+                self._buffer = b""
+            self.length = size
+        elif isinstance(source, (bytes, bytearray, memoryview)):
+            self._buffer = source if isinstance(source, memoryview) else memoryview(source)
+            self.length = self._buffer.nbytes
+        elif hasattr(source, "read"):
+            self._fileobj = source
+            self._start = source.tell() if hasattr(source, "tell") else None
+            self.name = os.path.basename(getattr(source, "name", "") or "") or None
+            self.length = self._remaining_length(source)
+        else:
+            self._chunks = iter(source)
+
+    @staticmethod
+    def _remaining_length(fileobj) -> int | None:
+        try:
+            if isinstance(fileobj, io.BytesIO):
+                return fileobj.getbuffer().nbytes - fileobj.tell()
+            if hasattr(fileobj, "fileno"):
+                return os.fstat(fileobj.fileno()).st_size - fileobj.tell()
+            position = fileobj.tell()
+            end = fileobj.seek(0, io.SEEK_END)
+            fileobj.seek(position)
+            return end - position
+        except (OSError, ValueError, AttributeError, io.UnsupportedOperation):
+            return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        for resource in reversed(self._owned):
+            resource.close()
+        self._owned.clear()
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self.chunk_size
+        if self._buffer is not None:
+            chunk = bytes(self._buffer[self._position:self._position + size])
+            self._position += len(chunk)
+            return chunk
+        if self._fileobj is not None:
+            return self._fileobj.read(size)
+        return next(self._chunks, b"")
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def rewind(self) -> bool:
+        """Restarts the stream so a request can be resent (e.g. after a 429); False if the source is one-shot."""
+        if self._buffer is not None:
+            self._position = 0
+            return True
+        if self._fileobj is not None and self._start is not None:
+            try:
+                self._fileobj.seek(self._start)
+                return True
+            except (OSError, ValueError, io.UnsupportedOperation):
+                return False
+        return False
+
+    def request_body(self):
+        """Body for requests: a sized file-like (Content-Length) when the size is known, else a chunk generator
+        (Transfer-Encoding: chunked)."""
+        return _SizedReader(self) if self.length is not None else iter(self)
+
+
+class _SizedReader:
+    """Exposes read()/__len__ so requests sets Content-Length and http.client streams it block by block."""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def read(self, size: int = -1) -> bytes:
+        return self._stream.read(size)
+
+    def __len__(self):
+        return self._stream.length
+
+    def rewind(self) -> bool:
+        return self._stream.rewind()
+
+    def __iter__(self):
+        return iter(self._stream)
+
+
+class MultipartStream:
+    """Streaming multipart/form-data body with one file part, so large voice samples are never buffered whole."""
+
+    def __init__(self, fields: dict, file_field: str, file_name: str, file_content_type: str, file_stream: AssetStream):
+        self.boundary = uuid.uuid4().hex
+        head = b"".join(
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n{value}\r\n'.encode()
+            for key, value in fields.items())
+        head += (f'--{self.boundary}\r\nContent-Disposition: form-data; name="{file_field}"; '
+                 f'filename="{file_name}"\r\nContent-Type: {file_content_type}\r\n\r\n').encode()
+        tail = f"\r\n--{self.boundary}--\r\n".encode()
+        self._all_parts = [AssetStream(head), file_stream, AssetStream(tail)]
+        self._parts = list(self._all_parts)
+        self.length = (len(head) + file_stream.length + len(tail)) if file_stream.length is not None else None
+        self.chunk_size = file_stream.chunk_size
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def read(self, size: int = -1) -> bytes:
+        while self._parts:
+            chunk = self._parts[0].read(size)
+            if chunk:
+                return chunk
+            self._parts.pop(0)
+        return b""
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def rewind(self) -> bool:
+        if not all(part.rewind() for part in self._all_parts):
+            return False
+        self._parts = list(self._all_parts)
+        return True
+
+    def request_body(self):
+        return _SizedReader(self) if self.length is not None else iter(self)
+
+
+class ChunkPipe:
+    """Bounded in-memory pipe from a producer thread to a request body.
+
+    The producer write()s chunks and then close()s (or fail()s with its exception); iterating yields the chunks
+    in order and raises the producer's exception, which aborts the request mid-body so a partial object is never
+    committed. At most max_chunks chunks are buffered: a producer that gets ahead of the upload blocks. If the
+    consumer gives up, abort() makes write() return False so the producer can stop.
+    """
+
+    def __init__(self, max_chunks: int = 16):
+        self._queue = queue.Queue(maxsize=max_chunks)
+        self._aborted = threading.Event()
+        self.bytes_written = 0
+
+    def write(self, chunk: bytes) -> bool:
+        while not self._aborted.is_set():
+            try:
+                self._queue.put(chunk, timeout=0.5)
+                self.bytes_written += len(chunk)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def close(self):
+        self._put_final(None)
+
+    def fail(self, exc: BaseException):
+        self._put_final(exc)
+
+    def _put_final(self, item):
+        while not self._aborted.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def abort(self):
+        self._aborted.set()
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item